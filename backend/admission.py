@@ -0,0 +1,315 @@
+"""
+Admission control for the upload endpoints.
+
+Every protection here rejects work early and cheaply instead of letting a
+burst of uploads exhaust memory:
+
+- `AdmissionMiddleware` (ASGI) guards the upload paths before their bodies
+  are read: a per-client token bucket (429), a cap on requests in flight
+  (503), a `Content-Length` check and a byte count while the body streams in
+  (413 as soon as the limit is crossed, so an oversize `.raw` is never held
+  in memory);
+- `check_analysis_size` bounds what the DSP of one request allocates: the
+  STFT of a recording is hundreds of times larger than its upload, so the
+  real limit is on samples, derived from a per-request memory budget, and
+  the default upload limit follows from it (`upload_limit`);
+- `Stage` bounds the concurrency of a processing stage (DSP, inference) with
+  a short wait queue; when the queue is full, or the request's deadline would
+  pass while waiting, the request is shed with 503 and a `Retry-After`
+  estimated from the stage's recent service times;
+- `Deadline` carries the request's time budget (server default, or shorter
+  via the client's `X-Request-Timeout` header in seconds) through the stages
+  and stops work whose client has already disconnected.
+
+All limits come from the environment, see `LIMITS`.
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+
+
+def _env(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+LIMITS = {
+    # per-request DSP memory; bounds the samples /api/analyze takes at once
+    "analysis_memory_bytes": int(_env("LEAK_ANALYSIS_MEMORY_MB", 1024) * 2 ** 20),
+    # 0: derived from the analysis budget, see `upload_limit`
+    "max_upload_bytes": int(_env("LEAK_MAX_UPLOAD_MB", 0) * 2 ** 20),
+    "max_job_upload_bytes": int(_env("LEAK_MAX_JOB_UPLOAD_MB", 2048) * 2 ** 20),
+    "max_inflight": int(_env("LEAK_MAX_INFLIGHT", 32)),
+    "dsp_concurrency": int(_env("LEAK_DSP_CONCURRENCY", 2)),
+    "inference_concurrency": int(_env("LEAK_INFERENCE_CONCURRENCY", 1)),
+    "max_queue": int(_env("LEAK_MAX_QUEUE", 16)),
+    "rate_per_min": _env("LEAK_RATE_PER_MIN", 60),
+    "rate_burst": _env("LEAK_RATE_BURST", 10),
+    "request_timeout_s": _env("LEAK_REQUEST_TIMEOUT_S", 60),
+    "trust_proxy": os.environ.get("LEAK_TRUST_PROXY") == "1",
+}
+
+# Counters of the middleware, for /api/health
+STATS = {"inflight": 0, "rate_limited": 0, "too_large": 0, "overloaded": 0}
+
+
+def max_analysis_samples(bytes_per_sample: float, channels: int = 2) -> int:
+    """Most samples per channel whose analysis fits the memory budget."""
+    return int(LIMITS["analysis_memory_bytes"] // (bytes_per_sample * channels))
+
+
+def upload_limit(max_samples: int, channels: int = 2) -> int:
+    """
+    Body limit for uploads of up to `max_samples`.
+
+    `LEAK_MAX_UPLOAD_MB` if set, else room for `max_samples` float64 `.npy`
+    samples per channel plus 1 MB of multipart and file headers.
+    """
+    return LIMITS["max_upload_bytes"] or max_samples * channels * 8 + 2 ** 20
+
+
+def check_analysis_size(samples: int, channels: int, bytes_per_sample: float, fs: float,
+                        hint: str = "submit it to /api/jobs"):
+    """
+    413 if analysing `samples` x `channels` would exceed the memory budget.
+
+    Mono input is analysed as two channels, so `channels` counts at least 2.
+    """
+    channels = max(2, channels)
+    limit = max_analysis_samples(bytes_per_sample, channels)
+    if samples > limit:
+        STATS["too_large"] += 1
+        raise HTTPException(status_code=413,
+                            detail=f"Recording of {samples / fs:.0f} s exceeds the {limit / fs:.0f} s "
+                                   f"analysed per request; {hint}")
+
+
+class TokenBucket:
+    """Per-key token buckets refilled at `rate` tokens/s up to `burst`; LRU-bounded."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def take(self, key: str, now: Optional[float] = None) -> float:
+        """
+        Take one token for `key`.
+
+        Returns:
+            0 if admitted, else the seconds until a token is available
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        tokens, last = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        wait = 0.0
+        if tokens >= 1.0:
+            tokens -= 1.0
+        else:
+            wait = (1.0 - tokens) / self.rate
+        self._buckets[key] = [tokens, now]
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+def client_key(scope: Dict, trust_proxy: bool = False) -> str:
+    """Client address, or the first `X-Forwarded-For` hop behind a trusted proxy."""
+    if trust_proxy:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class AdmissionMiddleware:
+    """
+    Rate, in-flight and body-size limits for POSTs to the guarded paths.
+
+    Args:
+        app: ASGI application
+        limits: Path -> maximum body size in bytes; a path ending in "/"
+            covers everything below it
+        rate_per_min, burst: Token bucket per client
+        max_inflight: Guarded requests processed at once
+        trust_proxy: Take the client from `X-Forwarded-For`
+    """
+
+    def __init__(self, app, limits: Dict[str, int], rate_per_min: float = 60, burst: float = 10,
+                 max_inflight: int = 32, trust_proxy: bool = False):
+        self.app = app
+        self.limits = limits
+        self.buckets = TokenBucket(rate_per_min / 60.0, burst)
+        self.max_inflight = max_inflight
+        self.trust_proxy = trust_proxy
+
+    def _limit(self, path: str) -> Optional[int]:
+        if path in self.limits:
+            return self.limits[path]
+        for prefix, limit in self.limits.items():
+            if prefix.endswith("/") and path.startswith(prefix):
+                return limit
+        return None
+
+    async def __call__(self, scope, receive, send):
+        limit = None
+        if scope["type"] == "http" and scope["method"] == "POST":
+            limit = self._limit(scope["path"])
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        wait = self.buckets.take(client_key(scope, self.trust_proxy))
+        if wait > 0:
+            STATS["rate_limited"] += 1
+            await _reject(send, 429, "Rate limit exceeded", wait)
+            return
+        if STATS["inflight"] >= self.max_inflight:
+            STATS["overloaded"] += 1
+            await _reject(send, 503, "Server busy", 1)
+            return
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                STATS["too_large"] += 1
+                await _reject(send, 413, f"Upload exceeds {limit / 2 ** 20:.1f} MB")
+                return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit and not exceeded:
+                    exceeded = True
+                    STATS["too_large"] += 1
+                    # the app sees the end of the body (and fails to parse it)
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                if exceeded:
+                    return {"type": "http.request", "body": b"", "more_body": False}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                # whatever the app answers to the truncated body, the client gets 413
+                if not started:
+                    started = True
+                    await _reject(send, 413, f"Upload exceeds {limit / 2 ** 20:.1f} MB")
+                return
+            started = True
+            await send(message)
+
+        STATS["inflight"] += 1
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        finally:
+            STATS["inflight"] -= 1
+
+
+async def _reject(send, status: int, detail: str, retry_after: Optional[float] = None):
+    headers = [(b"content-type", b"application/json"), (b"connection", b"close")]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(max(1, math.ceil(retry_after))).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
+
+
+class Deadline:
+    """Time budget of one request, checked between stages."""
+
+    def __init__(self, request: Request, timeout: float):
+        self.request = request
+        self.expires = time.monotonic() + timeout
+
+    @classmethod
+    def from_request(cls, request: Request, default: float = LIMITS["request_timeout_s"]) -> "Deadline":
+        """Server default, shortened by the client's `X-Request-Timeout` (seconds)."""
+        timeout = default
+        try:
+            timeout = min(default, float(request.headers.get("x-request-timeout", default)))
+        except ValueError:
+            pass
+        return cls(request, timeout)
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+    async def check(self):
+        """Stop if the client has gone or the budget is spent."""
+        if await self.request.is_disconnected():
+            raise HTTPException(status_code=499, detail="Client closed request")
+        if self.remaining() <= 0:
+            raise HTTPException(status_code=503, detail="Request deadline exceeded",
+                                headers={"Retry-After": "1"})
+
+
+class Stage:
+    """
+    Bounded concurrency for one processing stage, shedding load past `max_queue`.
+
+    Service times are tracked as an exponential moving average to estimate
+    how long a shed client should wait before retrying.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self.waiting = 0
+        self.active = 0
+        self.service_s = 1.0
+        self.shed = 0
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.service_s * (self.waiting + 1) / self.concurrency))
+
+    def _overloaded(self, detail: str) -> HTTPException:
+        self.shed += 1
+        return HTTPException(status_code=503, detail=detail,
+                             headers={"Retry-After": str(self.retry_after())})
+
+    @asynccontextmanager
+    async def slot(self, deadline: Deadline):
+        """Hold one of the stage's slots for the duration of the block."""
+        if self._sem.locked():
+            if self.waiting >= self.max_queue:
+                raise self._overloaded(f"{self.name} queue full")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._sem.acquire(), timeout=max(0.0, deadline.remaining()))
+            except asyncio.TimeoutError:
+                raise self._overloaded(f"{self.name} busy past the request deadline")
+            finally:
+                self.waiting -= 1
+        else:
+            await self._sem.acquire()
+        self.active += 1
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.service_s = 0.8 * self.service_s + 0.2 * (time.monotonic() - t0)
+            self.active -= 1
+            self._sem.release()
+
+    def snapshot(self) -> Dict:
+        return {"concurrency": self.concurrency, "active": self.active, "waiting": self.waiting,
+                "max_queue": self.max_queue, "service_ms": round(self.service_s * 1e3, 1),
+                "shed": self.shed}
@@ -0,0 +1,280 @@
+"""
+Temporal aggregation of per-window class probabilities into stable decisions.
+
+A single 2 s window is a noisy vote; an alarm should follow the evidence of
+many. Each sensor's stream of window softmaxes goes through
+
+1. a smoother, updated in O(classes) per window:
+   - "mean": average probability over the last `window` windows,
+   - "logmean": average log-probability over the last `window` windows
+     (a normalised geometric mean: one confident window cannot outvote many),
+   - "hmm": forward filtering in a sticky hidden Markov model whose state is
+     the leak class, staying put with probability `stay` per window;
+2. an alarm state machine on the smoothed leak probability (1 - P(No-leak))
+   with hysteresis (`on_threshold` > `off_threshold`) and minimum durations
+   (`min_on` windows above to raise, `min_off` windows below to clear).
+
+State changes come out as events (`alarm_on`, `alarm_off`, `class_change`),
+far fewer than there are windows. For a complete recording, `viterbi` gives
+the most likely class sequence and `segments` its runs.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from inference import LEAK_TYPES
+
+NO_LEAK = LEAK_TYPES.index("No-leak")
+METHODS = ("mean", "logmean", "hmm")
+EPS = 1e-6
+
+
+def leak_score(probs: np.ndarray) -> np.ndarray:
+    """Probability of any leak class, per window."""
+    return 1.0 - np.asarray(probs)[..., NO_LEAK]
+
+
+class RingSmoother:
+    """Mean of the last `window` probability (or log-probability) vectors."""
+
+    def __init__(self, n_classes: int, window: int = 8, log: bool = False):
+        self.window = window
+        self.log = log
+        self._buf = np.zeros((window, n_classes))
+        self._sum = np.zeros(n_classes)
+        self._i = 0
+        self._n = 0
+
+    def update(self, probs: np.ndarray) -> np.ndarray:
+        x = np.log(np.asarray(probs, dtype=np.float64) + EPS) if self.log else np.asarray(probs, np.float64)
+        self._sum += x - self._buf[self._i]
+        self._buf[self._i] = x
+        self._i = (self._i + 1) % self.window
+        self._n = min(self._n + 1, self.window)
+        mean = self._sum / self._n
+        if not self.log:
+            return mean
+        p = np.exp(mean - mean.max())
+        return p / p.sum()
+
+
+class HMMSmoother:
+    """Forward filter of a sticky HMM: P(class at t | windows up to t)."""
+
+    def __init__(self, n_classes: int, stay: float = 0.95):
+        self.n = n_classes
+        self.stay = stay
+        self._alpha = np.full(n_classes, 1.0 / n_classes)
+
+    def update(self, probs: np.ndarray) -> np.ndarray:
+        # transition with uniform switching, in O(classes): A^T alpha
+        switch = (1.0 - self.stay) / (self.n - 1)
+        prior = self.stay * self._alpha + switch * (1.0 - self._alpha)
+        alpha = prior * (np.asarray(probs, dtype=np.float64) + EPS)
+        self._alpha = alpha / alpha.sum()
+        return self._alpha
+
+
+def make_smoother(method: str, n_classes: int, window: int = 8, stay: float = 0.95):
+    if method == "mean":
+        return RingSmoother(n_classes, window)
+    if method == "logmean":
+        return RingSmoother(n_classes, window, log=True)
+    if method == "hmm":
+        return HMMSmoother(n_classes, stay)
+    raise ValueError(f"Unknown aggregation {method!r}; choose from {METHODS}")
+
+
+class AlarmState:
+    """Hysteresis and minimum-duration rules on the smoothed leak score."""
+
+    def __init__(self, on_threshold: float = 0.7, off_threshold: float = 0.4,
+                 min_on: int = 3, min_off: int = 5):
+        if off_threshold > on_threshold:
+            raise ValueError("off_threshold must not exceed on_threshold")
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.min_on = min_on
+        self.min_off = min_off
+        self.alarming = False
+        self._run = 0
+
+    def update(self, score: float) -> Optional[str]:
+        """"alarm_on" / "alarm_off" when the state flips, else None."""
+        if self.alarming:
+            self._run = self._run + 1 if score <= self.off_threshold else 0
+            if self._run >= self.min_off:
+                self.alarming, self._run = False, 0
+                return "alarm_off"
+        else:
+            self._run = self._run + 1 if score >= self.on_threshold else 0
+            if self._run >= self.min_on:
+                self.alarming, self._run = True, 0
+                return "alarm_on"
+        return None
+
+
+class SensorStream:
+    """Smoother, alarm state and current decision of one sensor."""
+
+    def __init__(self, sensor_id: str, method: str = "hmm", window: int = 8, stay: float = 0.95,
+                 **alarm):
+        self.sensor_id = sensor_id
+        self.smoother = make_smoother(method, len(LEAK_TYPES), window, stay)
+        self.alarm = AlarmState(**alarm)
+        self.probs = np.full(len(LEAK_TYPES), 1.0 / len(LEAK_TYPES))
+        self.label = None
+        self.windows = 0
+        self.last_time = None
+
+    def update(self, probs: np.ndarray, t: float) -> List[Dict]:
+        """Add one window (ending at time `t`); returns the events it caused."""
+        self.probs = self.smoother.update(probs)
+        self.windows += 1
+        self.last_time = t
+        score = float(leak_score(self.probs))
+        events = []
+        label = LEAK_TYPES[int(np.argmax(self.probs))]
+        if label != self.label:
+            if self.label is not None:
+                events.append(self._event("class_change", t, score, previous=self.label, label=label))
+            self.label = label
+        flip = self.alarm.update(score)
+        if flip:
+            events.append(self._event(flip, t, score, label=label))
+        return events
+
+    def _event(self, kind: str, t: float, score: float, **fields) -> Dict:
+        return {"type": kind, "sensor": self.sensor_id, "time": t, "window": self.windows - 1,
+                "leakProbability": round(score, 4), **fields}
+
+    def state(self) -> Dict:
+        return {
+            "sensor": self.sensor_id,
+            "label": self.label,
+            "alarming": self.alarm.alarming,
+            "leakProbability": float(leak_score(self.probs)),
+            "probabilities": {LEAK_TYPES[i]: float(p) for i, p in enumerate(self.probs)},
+            "windows": self.windows,
+            "lastSeen": self.last_time,
+        }
+
+
+class AggregationEngine:
+    """
+    Per-sensor streams plus fan-out of their events to subscribers (SSE).
+
+    Sensors are kept in LRU order and the least recently updated is dropped
+    beyond `max_sensors`. Subscriber queues are bounded; a slow subscriber
+    loses its oldest events rather than holding memory.
+    """
+
+    def __init__(self, method: str = "hmm", max_sensors: int = 10000, queue_size: int = 1000,
+                 **options):
+        make_smoother(method, len(LEAK_TYPES))  # validate early
+        self.method = method
+        self.options = options
+        self.max_sensors = max_sensors
+        self.queue_size = queue_size
+        self.sensors: "OrderedDict[str, SensorStream]" = OrderedDict()
+        self._subscribers: List[asyncio.Queue] = []
+
+    def update(self, sensor_id: str, window_probs: np.ndarray, times: np.ndarray) -> List[Dict]:
+        """Feed consecutive windows of one sensor; returns and publishes the events."""
+        stream = self.sensors.pop(sensor_id, None)
+        if stream is None:
+            stream = SensorStream(sensor_id, self.method, **self.options)
+        self.sensors[sensor_id] = stream
+        while len(self.sensors) > self.max_sensors:
+            self.sensors.popitem(last=False)
+        events = []
+        for probs, t in zip(window_probs, times):
+            events += stream.update(probs, float(t))
+        for event in events:
+            self.publish(event)
+        return events
+
+    def state(self, sensor_id: str) -> Optional[Dict]:
+        stream = self.sensors.get(sensor_id)
+        return stream.state() if stream else None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def publish(self, event: Dict):
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+def viterbi(window_probs: np.ndarray, stay: float = 0.95) -> np.ndarray:
+    """Most likely class sequence of a whole recording under the sticky HMM."""
+    T, C = window_probs.shape
+    log_a = np.full((C, C), np.log((1.0 - stay) / (C - 1)))
+    np.fill_diagonal(log_a, np.log(stay))
+    log_b = np.log(window_probs + EPS)
+    delta = log_b[0] - np.log(C)
+    back = np.zeros((T, C), dtype=np.int64)
+    for t in range(1, T):
+        scores = delta[:, None] + log_a  # (from, to)
+        back[t] = np.argmax(scores, axis=0)
+        delta = scores[back[t], np.arange(C)] + log_b[t]
+    path = np.zeros(T, dtype=np.int64)
+    path[-1] = int(np.argmax(delta))
+    for t in range(T - 1, 0, -1):
+        path[t - 1] = back[t, path[t]]
+    return path
+
+
+def segments(labels: np.ndarray, times: np.ndarray, step: float) -> List[Dict]:
+    """Runs of equal labels as [{label, startSec, endSec, windows}]."""
+    out = []
+    start = 0
+    for i in range(1, len(labels) + 1):
+        if i == len(labels) or labels[i] != labels[start]:
+            out.append({"label": LEAK_TYPES[int(labels[start])], "startSec": float(times[start]),
+                        "endSec": float(times[i - 1] + step), "windows": i - start})
+            start = i
+    return out
+
+
+def aggregate_recording(window_probs: np.ndarray, times: np.ndarray, step: float,
+                        method: str = "hmm", window: int = 8, stay: float = 0.95, **alarm) -> Dict:
+    """
+    Stable decision for a whole recording.
+
+    The windows are fed through a `SensorStream` exactly as a live sensor
+    would be; with "hmm" the segments come from the Viterbi path.
+
+    Returns:
+        Dict with the smoothed final probabilities and label, the alarm
+        events and the label segments
+    """
+    stream = SensorStream("recording", method, window, stay, **alarm)
+    events = []
+    smoothed = np.zeros_like(window_probs, dtype=np.float64)
+    for i, (probs, t) in enumerate(zip(window_probs, times)):
+        events += stream.update(probs, float(t))
+        smoothed[i] = stream.probs
+    labels = viterbi(window_probs, stay) if method == "hmm" else np.argmax(smoothed, axis=1)
+    state = stream.state()
+    return {
+        "method": method,
+        "prediction": state["label"],
+        "leakProbability": state["leakProbability"],
+        "alarming": state["alarming"],
+        "probabilities": state["probabilities"],
+        "events": [{k: v for k, v in e.items() if k != "sensor"} for e in events],
+        "segments": segments(labels, times, step),
+    }
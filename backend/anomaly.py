@@ -0,0 +1,133 @@
+"""
+Unsupervised spectral-baseline anomaly scores.
+
+The CNN can only name the five classes it was trained on and is the
+expensive stage. A much cheaper question comes first: does this window
+sound like the sensor usually does? Each sensor keeps an exponential moving
+mean and variance of its log band energies (`dsp.band_energies`, i.e. the
+spectrum pooled into `n_bands` frequency bands). A window's score is the
+diagonal Mahalanobis distance to that baseline, as an RMS z-score over the
+bands:
+
+    score = sqrt(mean_b((x_b - mean_b)^2 / var_b))
+
+A few vector operations per window (microseconds). Windows scoring above
+`threshold` are anomalous and do not update the baseline, so a developing
+leak is not absorbed into "normal"; the first `warmup` windows only build it.
+
+Used two ways: as a gate (windows that match the baseline of a sensor whose
+state is already known need not go through the CNN again) and as a signal
+of its own (an anomaly the classifier calls No-leak is still worth a look).
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+N_BANDS = 32
+ALPHA = 0.05
+THRESHOLD = 3.0
+WARMUP = 8
+MIN_VAR = 1e-4
+
+
+def mahalanobis(x: np.ndarray, mean: np.ndarray, var: np.ndarray) -> np.ndarray:
+    """RMS z-score of `x` (..., bands) against a diagonal baseline."""
+    return np.sqrt(np.mean((x - mean) ** 2 / var, axis=-1))
+
+
+def score_and_update(bands: np.ndarray, mean: np.ndarray, var: np.ndarray, count: int,
+                     alpha: float = ALPHA, threshold: float = THRESHOLD,
+                     warmup: int = WARMUP) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Score consecutive windows against a baseline, updating it in place.
+
+    Args:
+        bands: Log band energies (N, n_bands) in time order
+        mean, var: Baseline (n_bands,) float arrays, modified in place
+        count: Windows the baseline has seen so far
+        alpha: EMA weight of a new window
+        threshold: Score above which a window is anomalous
+        warmup: Windows that only build the baseline (score NaN, never anomalous)
+
+    Returns:
+        (scores (N,), anomalous (N,) bool, new count)
+    """
+    n = len(bands)
+    scores = np.full(n, np.nan, dtype=np.float32)
+    anomalous = np.zeros(n, dtype=bool)
+    for i, x in enumerate(np.asarray(bands, dtype=np.float32)):
+        if count >= warmup:
+            scores[i] = np.sqrt(np.mean((x - mean) ** 2 / var))
+            anomalous[i] = scores[i] > threshold
+        if not anomalous[i]:
+            count += 1
+            # plain running mean/variance while warming up, then the EMA
+            a = max(alpha, 1.0 / count)
+            d = x - mean
+            mean += a * d
+            var[:] = np.maximum((1 - a) * (var + a * d * d), MIN_VAR)
+    return scores, anomalous, count
+
+
+class BaselineScorer:
+    """Baseline and scores of one stream of windows (one recording or sensor)."""
+
+    def __init__(self, n_bands: int = N_BANDS, alpha: float = ALPHA, threshold: float = THRESHOLD,
+                 warmup: int = WARMUP):
+        self.n_bands = n_bands
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.mean = np.zeros(n_bands, dtype=np.float32)
+        self.var = np.ones(n_bands, dtype=np.float32)
+        self.count = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.count >= self.warmup
+
+    def score(self, bands: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        scores, anomalous, self.count = score_and_update(
+            bands, self.mean, self.var, self.count, self.alpha, self.threshold, self.warmup)
+        return scores, anomalous
+
+
+def gate(scores: np.ndarray, anomalous: np.ndarray) -> np.ndarray:
+    """
+    Windows that must go through the classifier: anomalous or not yet scored.
+
+    Returns:
+        Boolean mask; always includes the first window so there is a
+        decision to carry forward
+    """
+    run = anomalous | np.isnan(scores)
+    if len(run):
+        run[0] = True
+    return run
+
+
+def carry_forward(run: np.ndarray, probs_run: np.ndarray) -> np.ndarray:
+    """Per-window probabilities, each skipped window taking the last classified one's."""
+    idx = np.flatnonzero(run)
+    src = np.searchsorted(idx, np.arange(len(run)), side="right") - 1
+    return probs_run[src]
+
+
+def summarize(scores: np.ndarray, anomalous: np.ndarray) -> dict:
+    """
+    Recording-level anomaly summary for the API.
+
+    A recording scored against its own baseline gets no scores until
+    `WARMUP` windows have built it, so a shorter clip has `maxScore` and
+    `meanScore` None (null), not 0, which would read as "normal".
+    """
+    scored = scores[~np.isnan(scores)]
+    return {
+        "maxScore": float(scored.max()) if len(scored) else None,
+        "meanScore": float(scored.mean()) if len(scored) else None,
+        "scoredWindows": len(scored),
+        "anomalousWindows": int(anomalous.sum()),
+        "threshold": THRESHOLD,
+        "warmupWindows": WARMUP,
+    }
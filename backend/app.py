@@ -1,13 +1,35 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import numpy as np
 from pathlib import Path
+import base64
+import asyncio
 import io
+import json
+import os
 import time
-from typing import Dict, List, Optional
+from typing import Dict, Optional
 import logging
 
+from admission import LIMITS, AdmissionMiddleware, Deadline, Stage
+import admission
+from aggregation import METHODS as AGGREGATIONS, AggregationEngine, aggregate_recording
+import anomaly
+from cascade import Cascade
+from encoding import encode_response, negotiate
+from fleet import FleetStore
+from dsp import FS, STEP, NWIN, CHUNK_SEC, band_energies, frames_for_seconds, window_spectrogram
+from frontends import get_frontend
+import feature_cache
+from feature_cache import audio_hash, cache_key
+from localization import cross_spectra, localize
+from preview import PreviewCache, encode_png, render_preview
+from inference import LEAK_TYPES, KerasPredictor, LinearProbePredictor, load_model_info, load_predictor
+import jobs
+import resources
+
 # Try to import TensorFlow (optional for demo mode)
 try:
     import tensorflow as tf
@@ -15,14 +37,32 @@ try:
 except ImportError:
     TF_AVAILABLE = False
     logger = logging.getLogger(__name__)
-    logger.warning("TensorFlow not available. Running in DEMO mode only.")
+    logger.warning("TensorFlow not available. Running in DEMO mode unless a TFLite model can be loaded.")
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Thread pools of TensorFlow, BLAS and the FFT, before TensorFlow runs anything
+resource_config = resources.apply()
+
 app = FastAPI(title="LucentWave API", version="1.0.0")
 
+# Body size limit per upload path; the analysis limits follow the model's
+# front-end and are updated when it is loaded
+upload_limits = {"/api/analyze": 0, "/api/stream/": 0, "/api/jobs": LIMITS["max_job_upload_bytes"]}
+
+# Rate, in-flight and upload size limits, enforced before a body is read.
+# Added before CORS so CORS wraps it and its 413/429/503 carry CORS headers.
+app.add_middleware(
+    AdmissionMiddleware,
+    limits=upload_limits,
+    rate_per_min=LIMITS["rate_per_min"],
+    burst=LIMITS["rate_burst"],
+    max_inflight=LIMITS["max_inflight"],
+    trust_proxy=LIMITS["trust_proxy"],
+)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -32,129 +72,83 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Constants from training
-FS = 8000  # Sampling rate
-STEP = 16
-NWIN = 512
-CHUNK_SEC = 2.0
-
-# Leak type names
-LEAK_TYPES = [
-    "Circumferential Crack",
-    "Gasket Leak",
-    "Longitudinal Crack",
-    "No-leak",
-    "Orifice Leak"
-]
-
-# Global model variable
-model = None
-model_loaded = False
-
-
-def frames_for_seconds(sec: float) -> int:
-    """Calculate number of frames for given seconds."""
-    return int(np.floor((sec * FS - NWIN) / STEP) + 1)
-
-
-def hlt_window(L: int, zeta: float = 8.0, n: float = 0.99) -> np.ndarray:
-    """
-    Hyperlet transform (HLT) window function.
-
-    Args:
-        L: Window length
-        zeta: Tapering parameter (default 8.0)
-        n: Exponent parameter (default 0.99)
-
-    Returns:
-        HLT window array
-    """
-    t = np.arange(-(L // 2), (L // 2) + (L % 2))
-    window = zeta / (zeta + np.abs(t) ** n)
-    return window.astype(np.float32)
+MODELS_DIR = Path(__file__).parent / "models"
 
+# Propagation speed of leak noise in water-filled pipes (m/s); depends on
+# pipe material and diameter, so callers may override it per request
+DEFAULT_WAVE_SPEED = 1200.0
 
-def radar_tfr(cube: np.ndarray, Nwin: int, step: int) -> np.ndarray:
-    """
-    Short-time Fourier transform with HLT window.
-
-    Args:
-        cube: Input signal (samples, channels)
-        Nwin: Window size
-        step: Step size
-
-    Returns:
-        4D STFT array (freq_bins, time_frames, channels)
-    """
-    N, L = cube.shape  # samples, channels
-    frames = (N - Nwin) // step + 1
-
-    w = hlt_window(Nwin)
-    w = w / np.sqrt(np.mean(w ** 2))  # Normalize to unit RMS
-
-    out = np.zeros((Nwin, frames, L), dtype=np.complex64)
-
-    for k in range(frames):
-        s = k * step
-        sl = slice(s, s + Nwin)
-        segment = cube[sl, :] * w[:, np.newaxis]
-        out[:, k, :] = np.fft.fftshift(np.fft.fft(segment, axis=0), axes=0)
-
-    return out
-
-
-def process_audio_data(audio_data: np.ndarray) -> np.ndarray:
-    """
-    Process raw audio data into model input format.
-
-    Args:
-        audio_data: Raw audio signal (mono or stereo)
-
-    Returns:
-        Processed spectrogram ready for model input
-    """
-    # Ensure we have the right shape
-    if audio_data.ndim == 1:
-        audio_data = audio_data[:, np.newaxis]
-        audio_data = np.tile(audio_data, (1, 2))  # Duplicate to 2 channels
-
-    # Apply STFT with HLT window
-    stft_result = radar_tfr(audio_data, NWIN, STEP)
-
-    # Take magnitude and apply log compression
-    magnitude = np.log1p(np.abs(stft_result))
-
-    # Transpose to (freq, time, channels)
-    magnitude = magnitude.astype(np.float32)
-
-    return magnitude
+# Global model variable (a predictor from inference.py)
+model = None
+model_loaded = False
+model_path = None
+model_info = {}
+cascade = Cascade()
+frontend = get_frontend()  # replaced by the model's front-end on load
+previews = PreviewCache()
+# On-disk features of /api/analyze uploads: opt-in, since every miss writes a
+# spectrogram far larger than the upload on the request path
+spectrogram_cache = feature_cache.from_env() if os.environ.get("LEAK_ANALYZE_CACHE") == "1" else None
+# Bounded concurrency of the CPU-heavy stages; excess requests wait briefly, then get 503
+dsp_stage = Stage("dsp", LIMITS["dsp_concurrency"], LIMITS["max_queue"])
+inference_stage = Stage("inference", LIMITS["inference_concurrency"], LIMITS["max_queue"])
+# Per-sensor smoothing and alarm state of the streaming endpoint, and the
+# array-backed fleet summaries queried by /api/fleet
+FLEET_CAPACITY = int(os.environ.get("LEAK_FLEET_CAPACITY", "50000"))
+aggregator = AggregationEngine(method=os.environ.get("LEAK_AGGREGATION", "hmm"), max_sensors=FLEET_CAPACITY)
+fleet = FleetStore(capacity=FLEET_CAPACITY)
+# Skip the CNN for streamed windows that match the sensor's spectral baseline
+ANOMALY_GATE = os.environ.get("LEAK_ANOMALY_GATE", "1") == "1"
+job_pool = jobs.WorkerPool(workers=int(os.environ.get("LEAK_JOB_WORKERS", "1")),
+                           threads=int(os.environ.get("LEAK_JOB_THREADS", "1")))
+
+
+def set_upload_limits():
+    """Upload limits of the analysis endpoints for the current front-end."""
+    limit = admission.upload_limit(admission.max_analysis_samples(frontend.bytes_per_sample()))
+    upload_limits["/api/analyze"] = upload_limits["/api/stream/"] = limit
+
+
+set_upload_limits()
 
 
 def load_model():
-    """Load the trained CNN model."""
-    global model, model_loaded
+    """Load the trained CNN model, or a demo stand-in if there is none."""
+    global model, model_loaded, model_path, model_info, cascade, frontend
 
-    if not TF_AVAILABLE:
-        logger.info("TensorFlow not available. Running in DEMO mode (simulated predictions).")
-        model_loaded = True  # Set to True for demo mode
-        return
+    cascade = Cascade.from_models_dir(MODELS_DIR, len(LEAK_TYPES))
+    if cascade.enabled:
+        logger.info(f"No-leak screen loaded (threshold {cascade.screen.threshold:.3f})")
 
     try:
-        # Try to load pre-trained model
-        model_path = Path(__file__).parent / "models" / "leak_detector.h5"
-        if model_path.exists():
-            model = tf.keras.models.load_model(str(model_path))
+        # Try to load pre-trained model (.tflite, SavedModel or .h5); a
+        # .tflite also loads without TensorFlow if tflite-runtime is installed
+        try:
+            model, model_path = load_predictor(MODELS_DIR, num_threads=resource_config["tf_intra_op"])
+        except ImportError as e:
+            logger.warning(f"Cannot load the model without TensorFlow: {e}")
+            model, model_path = None, None
+        if model is not None:
             model_loaded = True
-            logger.info(f"Model loaded successfully from {model_path}")
-        else:
-            logger.warning(f"Model file not found at {model_path}")
+            model_info = load_model_info(MODELS_DIR)
+            frontend = get_frontend(model_info.get("frontend"))
+            logger.info(f"Model loaded successfully from {model_path} ({model.format}, "
+                        f"dataset {model_info.get('dataset_version')}, front-end {frontend.config})")
+        elif TF_AVAILABLE:
+            logger.warning(f"No model file found in {MODELS_DIR}")
             # Build a simple model for demo purposes
-            model = build_demo_model()
+            model = KerasPredictor(build_demo_model())
             model_loaded = True
             logger.info("Demo model built (not trained)")
+        else:
+            # DEMO MODE: the full pipeline with a deterministic NumPy model
+            model = LinearProbePredictor(frontend.fftshifted)
+            model_loaded = True
+            logger.info("TensorFlow not available. Running in DEMO mode (linear probe on band energies).")
     except Exception as e:
         logger.error(f"Error loading model: {e}")
         model_loaded = False
+    set_upload_limits()
 
 
 def build_demo_model():
@@ -164,7 +158,7 @@ def build_demo_model():
 
     from tensorflow.keras import layers, models
 
-    F, K, S = NWIN, frames_for_seconds(CHUNK_SEC), 2
+    F, K, S = frontend.n_features, frontend.frames_for_seconds(CHUNK_SEC), 2
     input_shape = (F, K, S)
     num_classes = 5
 
@@ -196,6 +190,15 @@ def build_demo_model():
 async def startup_event():
     """Load model on startup."""
     load_model()
+    if job_pool.workers > 0:
+        job_pool.start()
+        logger.info(f"{job_pool.workers} job worker(s) started, jobs in {jobs.JOBS_DIR}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the job workers; running jobs are requeued on the next start."""
+    job_pool.stop()
 
 
 @app.get("/")
@@ -215,105 +218,170 @@ async def health_check():
         "status": "healthy",
         "model_loaded": model_loaded,
         "tensorflow_available": TF_AVAILABLE,
-        "demo_mode": not TF_AVAILABLE,
+        "demo_mode": model_loaded and model_path is None,
+        "model_format": getattr(model, "format", None),
+        "model_path": str(model_path) if model_path else None,
+        "dataset_version": model_info.get("dataset_version"),
         "leak_types": LEAK_TYPES,
+        "cascade": {"enabled": cascade.enabled, **cascade.stats.snapshot()},
+        "resources": resources.effective(),
+        "feature_cache": spectrogram_cache.stats() if spectrogram_cache else None,
+        "admission": {**admission.STATS, "dsp": dsp_stage.snapshot(),
+                      "inference": inference_stage.snapshot()},
         "config": {
             "sampling_rate": FS,
             "window_size": NWIN,
             "step_size": STEP,
-            "chunk_duration": CHUNK_SEC
+            "chunk_duration": CHUNK_SEC,
+            "frontend": frontend.config
         }
     }
 
 
+def audio_format(filename: str) -> str:
+    """How `read_audio` decodes an upload: ".npy", ".raw" or "synthetic"."""
+    for suffix in ('.npy', '.raw'):
+        if filename.endswith(suffix):
+            return suffix
+    return "synthetic"
+
+
+def read_audio(filename: str, contents: bytes) -> np.ndarray:
+    """Decode an uploaded recording (.npy float, .raw int32)."""
+    fmt = audio_format(filename)
+    if fmt == '.npy':
+        return np.load(io.BytesIO(contents))
+    if fmt == '.raw':
+        return np.frombuffer(contents, dtype=np.int32).astype(np.float32)
+    # For demo: generate synthetic data (seeded, so demo results are repeatable)
+    logger.warning("Using synthetic data for demo")
+    return np.random.default_rng(0).standard_normal((int(FS * CHUNK_SEC), 2)).astype(np.float32)
+
+
+def check_min_length(audio_data: np.ndarray):
+    """400 for a recording shorter than one front-end frame (no spectrogram, no preview)."""
+    if len(audio_data) < frontend.frame_length:
+        raise HTTPException(status_code=400,
+                            detail=f"Recording of {len(audio_data)} samples is shorter than one "
+                                   f"analysis frame ({frontend.frame_length} samples)")
+
+
+def extract_windows(audio_data: np.ndarray, contents: bytes, filename: str,
+                    sensor_spacing: Optional[float], wave_speed: float):
+    """
+    DSP part of an analysis: model windows, localisation and the cached preview.
+
+    Returns:
+        (windows (N, F, K, S), K, localization or None, preview id,
+        log band energies (N, anomaly.N_BANDS))
+    """
+    K = frontend.frames_for_seconds(CHUNK_SEC)
+    stride = max(1, K // 2)
+
+    # Features (and the cross-spectra localisation needs) from the on-disk
+    # cache, or from the model's front-end; the same bytes decode differently
+    # as .npy and .raw, so the decoder is part of the key
+    key = cache_key(audio_hash(contents), frontend.config, audio_format(filename))
+    cached = spectrogram_cache.get(key) if spectrogram_cache else None
+    if cached is not None:
+        spectrogram, extras = cached
+        spectra = (extras["g01"], extras["g00"], extras["g11"]) if "g01" in extras else None
+    else:
+        spectrogram, stft = frontend.analyze(audio_data)
+        spectra = None
+        if stft is not None and audio_data.ndim == 2 and audio_data.shape[1] >= 2:
+            spectra = cross_spectra(window_spectrogram(stft, K, stride))
+        if spectrogram_cache:
+            spectrogram_cache.put(key, spectrogram, dict(zip(("g01", "g00", "g11"), spectra)) if spectra else None)
+
+    # Downsampled preview of the same spectrogram, content-addressed
+    preview_id = key[:24]
+    if previews.get(preview_id) is None:
+        previews.put(preview_id, {
+            **render_preview(spectrogram, frontend.fftshifted),
+            "duration_s": len(audio_data) / FS,
+            "frontend": frontend.config
+        })
+
+    # Split into model-sized windows (50% overlap, padded if too short)
+    windows = window_spectrogram(spectrogram, K, stride)
+
+    # Time delay (and position) between two real hydrophone channels,
+    # from the cross-spectra of the same STFT windows
+    localization = localize(None, sensor_spacing, wave_speed, spectra=spectra) if spectra else None
+    bands = band_energies(windows, anomaly.N_BANDS, frontend.fftshifted)
+    return windows, K, localization, preview_id, bands
+
+
 @app.post("/api/analyze")
-async def analyze_audio(audio: UploadFile = File(...)) -> Dict:
+async def analyze_audio(request: Request, audio: UploadFile = File(...),
+                        sensor_spacing: Optional[float] = None,
+                        wave_speed: float = DEFAULT_WAVE_SPEED, per_window: bool = False,
+                        aggregation: Optional[str] = None, anomaly_gate: bool = False,
+                        format: Optional[str] = None) -> Response:
     """
     Analyze audio file for leak detection.
 
     Args:
         audio: Uploaded audio file (.wav, .raw, .npy)
+        sensor_spacing: Distance between the two hydrophones in metres; with
+            two-channel input the leak position between them is estimated
+        wave_speed: Propagation speed along the pipe in m/s
+        per_window: Also return per-window start times, stages and
+            probabilities as columnar arrays (always on for Arrow)
+        aggregation: "mean", "logmean" or "hmm"; also return a smoothed
+            decision with alarm events and label segments over the windows
+        anomaly_gate: Skip the cascade for windows that match the recording's
+            spectral baseline, reusing the previous window's probabilities
+        format: "json", "msgpack" or "arrow"; overrides the Accept header
 
     Returns:
-        Prediction results with probabilities
+        Prediction results with probabilities, in the negotiated format
     """
+    if aggregation is not None and aggregation not in AGGREGATIONS:
+        raise HTTPException(status_code=400, detail=f"aggregation must be one of {list(AGGREGATIONS)}")
     if not model_loaded:
         raise HTTPException(
             status_code=503,
             detail="Model not loaded. Please check server logs."
         )
 
+    fmt = negotiate(request.headers.get("accept"), format)
+    per_window = per_window or fmt == "arrow"  # the Arrow table is the per-window results
+
     start_time = time.time()
+    deadline = Deadline.from_request(request)
 
     try:
-        # Read file content
+        # Read file content (size already bounded by AdmissionMiddleware)
         contents = await audio.read()
 
-        # DEMO MODE: If TensorFlow not available, generate simulated predictions
-        if not TF_AVAILABLE:
-            logger.info("Running in DEMO mode - generating simulated predictions")
-
-            # Simulate realistic-looking predictions
-            # Weighted random probabilities that sum to 1
-            raw_probs = np.random.dirichlet([10, 2, 2, 1, 2])  # Bias toward first class
-            predictions = raw_probs.astype(np.float32)
-
-            # Get top prediction
-            predicted_class = int(np.argmax(predictions))
-            confidence = float(predictions[predicted_class]) * 100
-
-            # Build probabilities list
-            probabilities = [
-                {
-                    "type": LEAK_TYPES[i],
-                    "probability": float(predictions[i]) * 100
-                }
-                for i in range(len(LEAK_TYPES))
-            ]
-
-            # Sort by probability descending
-            probabilities.sort(key=lambda x: x["probability"], reverse=True)
-
-            processing_time = time.time() - start_time
-
-            return {
-                "prediction": LEAK_TYPES[predicted_class],
-                "confidence": confidence,
-                "probabilities": probabilities,
-                "processingTime": f"{processing_time:.2f}s",
-                "demo_mode": True,
-                "message": "Running in DEMO mode (TensorFlow not installed)"
-            }
-
-        # REAL MODE: Use actual model
-        # Parse audio based on file type
-        if audio.filename.endswith('.npy'):
-            audio_data = np.load(io.BytesIO(contents))
-        elif audio.filename.endswith('.raw'):
-            audio_data = np.frombuffer(contents, dtype=np.int32).astype(np.float32)
-        else:
-            # For demo: generate synthetic data
-            logger.warning("Using synthetic data for demo")
-            audio_data = np.random.randn(int(FS * CHUNK_SEC), 2).astype(np.float32)
-
-        # Process audio
-        spectrogram = process_audio_data(audio_data)
-
-        # Ensure correct shape for model
-        K = frames_for_seconds(CHUNK_SEC)
-        if spectrogram.shape[1] < K:
-            # Pad if too short
-            pad_width = K - spectrogram.shape[1]
-            spectrogram = np.pad(spectrogram, ((0, 0), (0, pad_width), (0, 0)), mode='constant')
-        elif spectrogram.shape[1] > K:
-            # Truncate if too long
-            spectrogram = spectrogram[:, :K, :]
-
-        # Add batch dimension
-        input_data = np.expand_dims(spectrogram, axis=0)
-
-        # Make prediction
-        predictions = model.predict(input_data, verbose=0)[0]
+        # Parse audio based on file type; its STFT must fit the memory budget
+        audio_data = read_audio(audio.filename, contents)
+        check_min_length(audio_data)
+        admission.check_analysis_size(len(audio_data), audio_data.shape[1] if audio_data.ndim == 2 else 1,
+                                      frontend.bytes_per_sample(), FS)
+
+        # Front-end, preview and localisation off the event loop, bounded
+        await deadline.check()
+        async with dsp_stage.slot(deadline):
+            windows, K, localization, preview_id, bands = await run_in_threadpool(
+                extract_windows, audio_data, contents, audio.filename, sensor_spacing, wave_speed)
+
+        # Spectral-baseline anomaly scores over the recording; with the gate,
+        # windows matching the baseline keep the previous window's result
+        anomaly_scores, anomalous = anomaly.BaselineScorer().score(bands)
+        run = anomaly.gate(anomaly_scores, anomalous) if anomaly_gate else np.ones(len(windows), dtype=bool)
+
+        # Screen cheap No-leak windows, run the CNN on the rest, average
+        await deadline.check()
+        async with inference_stage.slot(deadline):
+            probs_run, stage_run = await run_in_threadpool(
+                cascade.predict, model, windows if run.all() else windows[run])
+        window_probs = anomaly.carry_forward(run, probs_run)
+        stage = np.zeros(len(windows), dtype=np.int8)
+        stage[run] = stage_run
+        predictions = window_probs.mean(axis=0)
 
         # Get top prediction
         predicted_class = int(np.argmax(predictions))
@@ -333,14 +401,43 @@ async def analyze_audio(audio: UploadFile = File(...)) -> Dict:
 
         processing_time = time.time() - start_time
 
-        return {
+        result = {
             "prediction": LEAK_TYPES[predicted_class],
             "confidence": confidence,
             "probabilities": probabilities,
             "processingTime": f"{processing_time:.2f}s",
-            "spectrogramShape": list(spectrogram.shape)
+            "spectrogramShape": list(windows.shape[1:]),
+            "windows": len(windows),
+            "cascade": {
+                "gated": int(np.sum(stage == 0)),
+                "screened": int(np.sum(stage == 1)),
+                "fullModel": int(np.sum(stage == 2))
+            },
+            "anomaly": anomaly.summarize(anomaly_scores, anomalous),
+            "localization": localization,
+            "previewId": preview_id,
+            "previewUrl": f"/api/preview/{preview_id}"
         }
+        if model_path is None:
+            result["demo_mode"] = True
+            result["message"] = "Running in DEMO mode (no trained model; predictions are not meaningful)"
+        step_sec = max(1, K // 2) * frontend.hop / FS
+        start_sec = np.arange(len(windows)) * step_sec
+        if aggregation:
+            result["aggregation"] = aggregate_recording(window_probs, start_sec, step_sec, aggregation)
+        if per_window:
+            # columnar: one array per field instead of a dict per window
+            result["windowResults"] = {
+                "startSec": start_sec.astype(np.float32),
+                "stage": stage,
+                "anomalyScore": anomaly_scores,
+                "probabilities": window_probs.astype(np.float32)
+            }
+            result["windowResultsColumns"] = {"probabilities": LEAK_TYPES}
+        return encode_response(result, fmt)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error analyzing audio: {e}")
         raise HTTPException(
@@ -349,6 +446,228 @@ async def analyze_audio(audio: UploadFile = File(...)) -> Dict:
         )
 
 
+@app.get("/api/preview/{preview_id}")
+async def spectrogram_preview(preview_id: str, request: Request, format: str = "png"):
+    """
+    Downsampled spectrogram of an analyzed recording.
+
+    Args:
+        preview_id: `previewId` from /api/analyze
+        format: "png" (grayscale image, low frequencies at the bottom) or
+            "raw" (JSON with base64 uint8 pixels and the dB scale)
+
+    Returns:
+        The preview; previews are immutable, so ETag / If-None-Match and
+        long-lived Cache-Control headers apply
+    """
+    if format not in ("png", "raw"):
+        raise HTTPException(status_code=400, detail="format must be 'png' or 'raw'")
+    preview = previews.get(preview_id)
+    if preview is None:
+        raise HTTPException(status_code=404, detail="Preview not found or expired; analyze the file again")
+
+    etag = f'"{preview_id}-{format}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    pixels = preview["pixels"]
+    if format == "png":
+        return Response(content=encode_png(pixels), media_type="image/png", headers=headers)
+    return JSONResponse({
+        "height": int(pixels.shape[0]),
+        "width": int(pixels.shape[1]),
+        "dbMin": preview["db_min"],
+        "dbMax": preview["db_max"],
+        "durationSec": preview["duration_s"],
+        "frontend": preview["frontend"],
+        "data": base64.b64encode(pixels.tobytes()).decode("ascii")
+    }, headers=headers)
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(audio: UploadFile = File(...), priority: int = 0) -> Dict:
+    """
+    Queue a long recording for asynchronous analysis.
+
+    Args:
+        audio: Recording (.npy or .raw); streamed to disk, never held in memory
+        priority: Higher runs first
+
+    Returns:
+        Job id and status URL
+    """
+    try:
+        job = jobs.create_job(audio.filename or "", priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    with open(job["input_path"], "wb") as f:
+        while chunk := await audio.read(1 << 20):
+            f.write(chunk)
+    jobs.enqueue(job)
+    return {"id": job["id"], "status": "queued", "url": f"/api/jobs/{job['id']}"}
+
+
+@app.get("/api/jobs")
+async def list_jobs(limit: int = 50) -> Dict:
+    """Most recent jobs first."""
+    return {"jobs": jobs.list_jobs(limit), "workers": job_pool.alive}
+
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str) -> Dict:
+    """Status, progress (0..1) and, when done, the summary of a job."""
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {**job, "resultsUrl": f"/api/jobs/{job_id}/results"}
+
+
+@app.get("/api/jobs/{job_id}/results")
+async def job_results(job_id: str):
+    """Per-window results as JSON lines; partial while the job runs."""
+    path = jobs.job_dir(job_id) / "results.jsonl"
+    if jobs.get_job(job_id) is None or not path.exists():
+        raise HTTPException(status_code=404, detail="No results for this job yet")
+    return FileResponse(path, media_type="application/x-ndjson")
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str) -> Dict:
+    """Cancel a queued job, or stop a running one after its current block."""
+    status = jobs.cancel_job(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"id": job_id, "status": status}
+
+
+@app.post("/api/stream/{sensor_id}")
+async def stream_chunk(sensor_id: str, request: Request, audio: UploadFile = File(...),
+                       start: Optional[float] = None) -> Dict:
+    """
+    Feed the next chunk of a sensor's live audio into its aggregation state.
+
+    Args:
+        sensor_id: Sensor the chunk belongs to
+        audio: Chunk of at least 2 s (.npy or .raw), following the previous one
+        start: Unix time of the first sample (default: now minus the chunk length)
+
+    Returns:
+        The sensor's smoothed state, the alarm events this chunk caused, the
+        windows' anomaly scores and how many of them were classified
+    """
+    if not model_loaded:
+        raise HTTPException(status_code=503, detail="Streaming needs a loaded model")
+    deadline = Deadline.from_request(request)
+    contents = await audio.read()
+    K = frontend.frames_for_seconds(CHUNK_SEC)
+
+    def chunk_windows():
+        # decoding and the whole front-end run off the event loop
+        try:
+            audio_data = read_audio(audio.filename or "", contents)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Unreadable audio: {e}")
+        check_min_length(audio_data)
+        admission.check_analysis_size(len(audio_data), audio_data.shape[1] if audio_data.ndim == 2 else 1,
+                                      frontend.bytes_per_sample(), FS, "send shorter chunks")
+        features, _ = frontend.analyze(audio_data)
+        windows = window_spectrogram(features, K, max(1, K // 2))
+        return len(audio_data), windows, band_energies(windows, fleet.n_bands, frontend.fftshifted)
+
+    await deadline.check()
+    async with dsp_stage.slot(deadline):
+        samples, windows, bands = await run_in_threadpool(chunk_windows)
+    if start is None:
+        start = time.time() - samples / FS
+    times = start + np.arange(len(windows)) * max(1, K // 2) * frontend.hop / FS
+
+    # Windows that match the sensor's spectral baseline leave its state as it is
+    scores, anomalous, known = fleet.observe(sensor_id, bands, float(times[-1]))
+    run = np.ones(len(windows), dtype=bool)
+    if ANOMALY_GATE and known:
+        run = anomalous | np.isnan(scores)
+    events, state = [], aggregator.state(sensor_id)
+    if run.any():
+        await deadline.check()
+        async with inference_stage.slot(deadline):
+            window_probs, _ = await run_in_threadpool(
+                cascade.predict, model, windows if run.all() else windows[run])
+        events = aggregator.update(sensor_id, window_probs, times[run])
+        state = aggregator.state(sensor_id)
+        fleet.record(sensor_id, window_probs, state, float(times[-1]))
+    return {"state": state, "events": events, "windows": len(windows), "classified": int(run.sum()),
+            "anomalyScores": [None if np.isnan(x) else round(float(x), 3) for x in scores]}
+
+
+@app.get("/api/stream/{sensor_id}")
+async def stream_state(sensor_id: str) -> Dict:
+    """Current smoothed state of a sensor."""
+    state = aggregator.state(sensor_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown sensor")
+    return state
+
+
+@app.get("/api/events")
+async def event_stream(request: Request, sensor: Optional[str] = None):
+    """Server-sent events of alarm and class changes, optionally for one sensor."""
+    queue = aggregator.subscribe()
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15.0)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if sensor is None or event["sensor"] == sensor:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            aggregator.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/api/fleet")
+async def fleet_summary() -> Dict:
+    """Sensor count, capacity and alarm and label totals of the fleet."""
+    return fleet.summary()
+
+
+@app.get("/api/fleet/alarming")
+async def fleet_alarming(limit: int = 100) -> Dict:
+    """Sensors currently alarming, highest leak probability first."""
+    return {"sensors": fleet.alarming_sensors(limit)}
+
+
+@app.get("/api/fleet/top")
+async def fleet_top(n: int = 10, since: Optional[float] = None) -> Dict:
+    """Top `n` sensors by smoothed leak probability, optionally only those seen since `since`."""
+    return {"sensors": fleet.top(max(1, n), since)}
+
+
+@app.get("/api/fleet/{sensor_id}")
+async def fleet_sensor(sensor_id: str) -> Dict:
+    """Rolling summary of one sensor: recent window probabilities, band baseline, last seen."""
+    row = fleet.get(sensor_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Unknown sensor")
+    return row
+
+
+@app.get("/api/cascade/stats")
+async def cascade_stats() -> Dict:
+    """Per-stage hit rates of the No-leak screening cascade."""
+    return {
+        "enabled": cascade.enabled,
+        "threshold": cascade.screen.threshold if cascade.enabled else None,
+        **cascade.stats.snapshot()
+    }
+
+
 @app.get("/api/leak-types")
 async def get_leak_types() -> Dict:
     """Get information about all leak types."""
@@ -359,5 +678,6 @@ async def get_leak_types() -> Dict:
 
 
 if __name__ == "__main__":
+    # Development server with auto-reload; production runs serve.py
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
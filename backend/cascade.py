@@ -0,0 +1,134 @@
+"""
+Two-stage cascade: a band-energy screen in front of the CNN.
+
+Stage 1 is a logistic regression on `dsp.band_energies` that estimates
+P(No-leak) for each window in a few microseconds. Windows it is confident
+about are answered directly; only the rest are batched through the CNN.
+The screen's weights and its calibrated rejection threshold are produced by
+`code/calibrate_screen.py` and stored in `models/screen.npz`; without that
+file every window goes to the CNN.
+"""
+
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from dsp import band_energies
+from inference import LEAK_TYPES
+
+NO_LEAK = LEAK_TYPES.index("No-leak")
+SCREEN_FILE = "screen.npz"
+
+
+class BandEnergyScreen:
+    """Logistic regression P(No-leak | band energies) with a rejection threshold."""
+
+    def __init__(self, weights, bias, mean, std, threshold, n_bands=None, fftshifted=True):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.threshold = float(threshold)
+        self.n_bands = int(n_bands or len(self.weights))
+        self.fftshifted = bool(fftshifted)
+
+    @classmethod
+    def load(cls, path: Path) -> "BandEnergyScreen":
+        d = np.load(path)
+        # screens calibrated before pluggable front-ends were all on the STFT
+        fftshifted = bool(d["fftshifted"]) if "fftshifted" in d.files else True
+        return cls(d["weights"], d["bias"], d["mean"], d["std"], d["threshold"], int(d["n_bands"]),
+                   fftshifted)
+
+    def save(self, path: Path):
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, std=self.std,
+                 threshold=self.threshold, n_bands=self.n_bands, fftshifted=self.fftshifted)
+
+    def probability(self, energies: np.ndarray) -> np.ndarray:
+        """P(No-leak) from precomputed band energies (N, n_bands)."""
+        z = ((energies - self.mean) / self.std) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def no_leak_probability(self, windows: np.ndarray) -> np.ndarray:
+        """P(No-leak) per window, shape (N,)."""
+        return self.probability(band_energies(windows, self.n_bands, self.fftshifted))
+
+
+class CascadeStats:
+    """Thread-safe per-stage counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.windows = 0
+        self.screened = 0
+        self.full_model = 0
+
+    def record(self, screened: int, full_model: int):
+        with self._lock:
+            self.windows += screened + full_model
+            self.screened += screened
+            self.full_model += full_model
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            total = max(self.windows, 1)
+            return {
+                "windows": self.windows,
+                "stage1_screened": self.screened,
+                "stage2_full_model": self.full_model,
+                "stage1_hit_rate": self.screened / total,
+                "stage2_rate": self.full_model / total,
+            }
+
+
+class Cascade:
+    """Screen windows, run the CNN on the uncertain ones, merge the results."""
+
+    def __init__(self, screen: Optional[BandEnergyScreen] = None, num_classes: int = 5):
+        self.screen = screen
+        self.num_classes = num_classes
+        self.stats = CascadeStats()
+
+    @classmethod
+    def from_models_dir(cls, models_dir: Path, num_classes: int = 5) -> "Cascade":
+        path = Path(models_dir) / SCREEN_FILE
+        return cls(BandEnergyScreen.load(path) if path.exists() else None, num_classes)
+
+    @property
+    def enabled(self) -> bool:
+        return self.screen is not None
+
+    def predict(self, model, windows: np.ndarray, batch_size: int = 32) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Class probabilities for every window.
+
+        Args:
+            model: Predictor with `predict(batch) -> (n, num_classes)`
+            windows: Windows of shape (N, F, K, S); may be a strided view
+            batch_size: Maximum CNN batch size
+
+        Returns:
+            (probabilities (N, num_classes), stage (N,) with 1 for windows
+            answered by the screen and 2 for windows sent to the CNN)
+        """
+        n = len(windows)
+        probs = np.zeros((n, self.num_classes), dtype=np.float32)
+        uncertain = np.arange(n)
+        if self.screen is not None:
+            p_ok = self.screen.no_leak_probability(windows)
+            confident = p_ok >= self.screen.threshold
+            # answered by stage 1: remaining mass spread over the leak classes
+            probs[confident] = ((1.0 - p_ok[confident]) / (self.num_classes - 1))[:, np.newaxis]
+            probs[confident, NO_LEAK] = p_ok[confident]
+            uncertain = np.flatnonzero(~confident)
+
+        for b in range(0, len(uncertain), batch_size):
+            idx = uncertain[b:b + batch_size]
+            probs[idx] = model.predict(np.ascontiguousarray(windows[idx]))
+
+        stage = np.ones(n, dtype=np.int8)
+        stage[uncertain] = 2
+        self.stats.record(n - len(uncertain), len(uncertain))
+        return probs, stage
@@ -0,0 +1,173 @@
+"""
+Signal processing shared by the API and the offline tools.
+
+HLT-windowed STFT and the log-magnitude features the CNN was trained on,
+with the constants used when the training data was exported from pilot.jl.
+"""
+
+from typing import Optional
+
+import numpy as np
+import scipy.fft
+
+# Constants from training
+FS = 8000  # Sampling rate
+STEP = 16
+NWIN = 512
+CHUNK_SEC = 2.0
+
+# Threads of the STFT FFTs; set from the process configuration by resources.apply
+FFT_WORKERS = 1
+
+
+def frames_for_seconds(sec: float) -> int:
+    """Calculate number of frames for given seconds."""
+    return int(np.floor((sec * FS - NWIN) / STEP) + 1)
+
+
+def hlt_window(L: int, zeta: float = 8.0, n: float = 0.99) -> np.ndarray:
+    """
+    Hyperlet transform (HLT) window function.
+
+    Args:
+        L: Window length
+        zeta: Tapering parameter (default 8.0)
+        n: Exponent parameter (default 0.99)
+
+    Returns:
+        HLT window array
+    """
+    t = np.arange(-(L // 2), (L // 2) + (L % 2))
+    window = zeta / (zeta + np.abs(t) ** n)
+    return window.astype(np.float32)
+
+
+def _unit_rms_window(Nwin: int) -> np.ndarray:
+    w = hlt_window(Nwin)
+    return w / np.sqrt(np.mean(w ** 2))  # Normalize to unit RMS
+
+
+def radar_tfr_blocks(cube: np.ndarray, Nwin: int, step: int, block_frames: int = 1024,
+                     window: Optional[np.ndarray] = None):
+    """
+    Blockwise HLT STFT, yielding consecutive groups of frames.
+
+    Each block is computed with one vectorised FFT over a strided view of the
+    input, so memory stays bounded by `block_frames` regardless of the signal
+    length (the input itself may be a np.memmap).
+
+    Args:
+        cube: Input signal (samples, channels)
+        Nwin: Window size
+        step: Step size
+        block_frames: Frames per yielded block
+        window: Analysis window of length Nwin (default: HLT, unit RMS)
+
+    Yields:
+        (first_frame, block) with block of shape (Nwin, n_frames, channels), complex64
+    """
+    N, L = cube.shape
+    frames = max(0, (N - Nwin) // step + 1)
+    w = _unit_rms_window(Nwin) if window is None else np.asarray(window, dtype=np.float32)
+
+    for k0 in range(0, frames, block_frames):
+        k1 = min(frames, k0 + block_frames)
+        segment = np.asarray(cube[k0 * step:(k1 - 1) * step + Nwin], dtype=np.float32)
+        view = np.lib.stride_tricks.sliding_window_view(segment, Nwin, axis=0)[::step]  # (n, L, Nwin)
+        spec = np.fft.fftshift(scipy.fft.fft(view * w, axis=-1, workers=FFT_WORKERS), axes=-1)
+        yield k0, spec.transpose(2, 0, 1).astype(np.complex64)
+
+
+def radar_tfr(cube: np.ndarray, Nwin: int, step: int) -> np.ndarray:
+    """
+    Short-time Fourier transform with HLT window.
+
+    Args:
+        cube: Input signal (samples, channels)
+        Nwin: Window size
+        step: Step size
+
+    Returns:
+        4D STFT array (freq_bins, time_frames, channels)
+    """
+    N, L = cube.shape  # samples, channels
+    frames = max(0, (N - Nwin) // step + 1)
+
+    out = np.zeros((Nwin, frames, L), dtype=np.complex64)
+    for k0, block in radar_tfr_blocks(cube, Nwin, step):
+        out[:, k0:k0 + block.shape[1], :] = block
+
+    return out
+
+
+def process_audio_data(audio_data: np.ndarray) -> np.ndarray:
+    """
+    Process raw audio data into model input format.
+
+    Args:
+        audio_data: Raw audio signal (mono or stereo)
+
+    Returns:
+        Processed spectrogram ready for model input
+    """
+    # Ensure we have the right shape
+    if audio_data.ndim == 1:
+        audio_data = audio_data[:, np.newaxis]
+        audio_data = np.tile(audio_data, (1, 2))  # Duplicate to 2 channels
+
+    # Apply STFT with HLT window
+    stft_result = radar_tfr(audio_data, NWIN, STEP)
+
+    # Take magnitude and apply log compression
+    magnitude = np.log1p(np.abs(stft_result))
+
+    # Transpose to (freq, time, channels)
+    magnitude = magnitude.astype(np.float32)
+
+    return magnitude
+
+
+def window_spectrogram(spectrogram: np.ndarray, K: int, stride: int) -> np.ndarray:
+    """
+    Split a (freq, time, channels) spectrogram into model-sized windows.
+
+    Windows start every `stride` frames and a trailing partial window is
+    dropped, as in the training scripts; a recording shorter than one window
+    is zero-padded to `K` frames.
+
+    Args:
+        spectrogram: Array of shape (F, T, S)
+        K: Frames per window
+        stride: Frames between window starts
+
+    Returns:
+        Read-only view of shape (N, F, K, S)
+    """
+    if spectrogram.shape[1] < K:
+        pad_width = K - spectrogram.shape[1]
+        spectrogram = np.pad(spectrogram, ((0, 0), (0, pad_width), (0, 0)), mode='constant')
+    view = np.lib.stride_tricks.sliding_window_view(spectrogram, K, axis=1)  # (F, T-K+1, S, K)
+    return view[:, ::stride].transpose(1, 0, 3, 2)
+
+
+def band_energies(windows: np.ndarray, n_bands: int = 16, fftshifted: bool = True) -> np.ndarray:
+    """
+    Mean log-magnitude in equal-width bands over the positive frequencies.
+
+    Args:
+        windows: Log-magnitude windows (N, F, K, S)
+        n_bands: Number of bands between 0 Hz and FS/2
+        fftshifted: Frequency axis is a full fftshifted STFT; otherwise it
+            holds only positive frequencies in ascending order (filterbank
+            and CQT front-ends)
+
+    Returns:
+        Array of shape (N, n_bands), float32
+    """
+    F = windows.shape[1]
+    positive = windows[:, F // 2:] if fftshifted else windows
+    spectrum = positive.mean(axis=(2, 3), dtype=np.float64)  # (N, bins), DC first
+    edges = np.linspace(0, spectrum.shape[1], n_bands + 1).astype(int)[:-1]
+    sums = np.add.reduceat(spectrum, edges, axis=1)
+    widths = np.diff(np.append(edges, spectrum.shape[1]))
+    return (sums / widths).astype(np.float32)
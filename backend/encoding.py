@@ -0,0 +1,159 @@
+"""
+Response encodings for machine clients.
+
+`/api/analyze` negotiates its response format from the `Accept` header (or a
+`format` query parameter, which wins):
+
+- JSON (`application/json`, the default), serialised with orjson when it is
+  installed and with the standard library otherwise;
+- MessagePack (`application/msgpack`), where NumPy arrays travel as
+  `{"dtype": "<f4", "shape": [...], "data": <raw bytes>}` maps;
+- Arrow IPC stream (`application/vnd.apache.arrow.stream`, needs pyarrow),
+  one row per window with the scalar results in the schema metadata.
+
+Payloads may hold NumPy arrays anywhere (the per-window columns of a long
+recording); JSON turns them into lists, the binary formats keep them typed.
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+ALIASES = {
+    "application/json": "json",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+
+
+def available_formats():
+    """Formats this server can produce."""
+    return ["json"] + (["msgpack"] if msgpack else []) + (["arrow"] if pa else [])
+
+
+def negotiate(accept: Optional[str], override: Optional[str] = None) -> str:
+    """
+    Response format from an explicit override or the Accept header.
+
+    Media types are tried in order of their q-values; `*/*` or an unknown
+    header falls back to JSON. An explicit override that cannot be served is
+    an error (406).
+    """
+    formats = available_formats()
+    if override:
+        if override not in formats:
+            raise HTTPException(status_code=406, detail=f"format must be one of {formats}")
+        return override
+    ranked = []
+    for i, part in enumerate((accept or "").split(",")):
+        fields = [f.strip() for f in part.split(";")]
+        q = 1.0
+        for f in fields[1:]:
+            if f.startswith("q="):
+                try:
+                    q = float(f[2:])
+                except ValueError:
+                    q = 0.0
+        ranked.append((-q, i, fields[0].lower()))
+    for _, _, media in sorted(ranked):
+        fmt = ALIASES.get(media)
+        if fmt in formats:
+            return fmt
+    return "json"
+
+
+def _json_default(obj):
+    if isinstance(obj, np.ndarray):
+        # NaN (e.g. an anomaly score still in warm-up) as null, as orjson writes it
+        if obj.dtype.kind == "f" and np.isnan(obj).any():
+            return np.where(np.isnan(obj), None, obj.astype(object)).tolist()
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, np.ndarray):
+        arr = np.ascontiguousarray(obj)
+        return {"dtype": arr.dtype.str, "shape": list(arr.shape), "data": arr.tobytes()}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"{type(obj).__name__} is not MessagePack serializable")
+
+
+def encode_json(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_json_default, separators=(",", ":")).encode()
+
+
+def encode_msgpack(payload: Any) -> bytes:
+    return msgpack.packb(payload, default=_msgpack_default, use_bin_type=True)
+
+
+def encode_arrow(payload: Dict, table_key: str = "windowResults") -> bytes:
+    """
+    Arrow IPC stream of the per-window table with the rest as metadata.
+
+    `payload[table_key]` maps column names to equal-length arrays; 2-D
+    arrays become one column per entry of `payload[table_key + "Columns"]`
+    or `<name>_<i>`.
+    """
+    table = payload.get(table_key)
+    if not table:
+        raise HTTPException(status_code=406, detail="Arrow output needs per-window results (per_window=true)")
+    labels = payload.get(f"{table_key}Columns", {})
+    columns = {}
+    for name, values in table.items():
+        values = np.asarray(values)
+        if values.ndim == 2:
+            names = labels.get(name) or [f"{name}_{i}" for i in range(values.shape[1])]
+            for i, col in enumerate(names):
+                columns[col] = pa.array(values[:, i])
+        else:
+            columns[name] = pa.array(values)
+    rest = {k: v for k, v in payload.items() if k not in (table_key, f"{table_key}Columns")}
+    schema_meta = {"result": encode_json(rest)}
+    tbl = pa.table(columns).replace_schema_metadata(schema_meta)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, tbl.schema) as writer:
+        writer.write_table(tbl)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_response(payload: Dict, fmt: str = "json") -> Response:
+    """Response in the negotiated format, with `Vary: Accept`."""
+    if fmt == "msgpack":
+        body = encode_msgpack(payload)
+    elif fmt == "arrow":
+        body = encode_arrow(payload)
+    else:
+        body = encode_json(payload)
+    return Response(content=body, media_type=MEDIA_TYPES[fmt], headers={"Vary": "Accept"})
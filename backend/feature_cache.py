@@ -0,0 +1,202 @@
+"""
+Content-addressed on-disk cache of front-end features.
+
+Re-scoring archived recordings with a new model recomputes the identical
+STFT every time, although only the model changed. Features depend on
+nothing but the audio and the front-end config, so they are stored under
+
+    sha256(audio bytes) + sha256(front-end config + FEATURE_VERSION)
+
+as `.npy` files and read back memory-mapped: a hit costs a page-cache read
+instead of a transform, and the model's windows are strided views into the
+mapping. Next to the features an entry can hold small per-window extras
+(`<key>.extra.npz`), e.g. the cross-spectra localisation needs, so that no
+part of an analysis has to go back to the raw STFT.
+
+The directory is bounded by `max_bytes`; when a write takes it over, the
+least recently used entries (file mtime, refreshed on every hit) are deleted
+down to 90 %. Writes go through a temporary file and a rename, so several
+processes (prefork workers, job workers, offline tools) can share one cache.
+
+The job workers and the offline tools use `LEAK_FEATURE_CACHE_DIR` (default
+`backend/cache/features`) and `LEAK_FEATURE_CACHE_MB` (default 1024, 0
+disables the cache); `/api/analyze` only caches with `LEAK_ANALYZE_CACHE=1`.
+
+    python feature_cache.py stats
+    python feature_cache.py clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+
+# Bump when the features of an unchanged config change (e.g. a DSP fix)
+FEATURE_VERSION = 1
+DEFAULT_DIR = Path(__file__).parent / "cache" / "features"
+
+
+def audio_hash(data: Union[bytes, np.ndarray, str, Path], chunk: int = 1 << 22) -> str:
+    """SHA-256 of raw upload bytes, an array's contents, or a file (streamed)."""
+    h = hashlib.sha256()
+    if isinstance(data, (str, Path)):
+        with open(data, "rb") as f:
+            while block := f.read(chunk):
+                h.update(block)
+    elif isinstance(data, np.ndarray):
+        h.update(str((data.dtype.str, data.shape)).encode())
+        h.update(np.ascontiguousarray(data).data)
+    else:
+        h.update(data)
+    return h.hexdigest()
+
+
+def config_hash(config: Dict) -> str:
+    return hashlib.sha256(json.dumps({"frontend": config, "version": FEATURE_VERSION},
+                                     sort_keys=True).encode()).hexdigest()
+
+
+def cache_key(audio_digest: str, config: Dict, part: Optional[str] = None) -> str:
+    """Entry name for an audio digest, a front-end config and an optional part (e.g. a block)."""
+    key = hashlib.sha256(f"{audio_digest}:{config_hash(config)}:{part or ''}".encode()).hexdigest()
+    return key[:40]
+
+
+class FeatureCache:
+    """Memory-mapped `.npy` entries in one directory, size-bounded LRU."""
+
+    def __init__(self, root: Union[str, Path] = DEFAULT_DIR, max_bytes: int = 1 << 30):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = self._scan()[1]
+
+    def _paths(self, key: str) -> Tuple[Path, Path]:
+        return self.root / f"{key}.npy", self.root / f"{key}.extra.npz"
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        """
+        Cached entry, or None.
+
+        Returns:
+            (features memory-mapped read-only, extras dict (possibly empty))
+        """
+        path, extra_path = self._paths(key)
+        try:
+            features = np.load(path, mmap_mode="r")
+            extras = {}
+            if extra_path.exists():
+                with np.load(extra_path) as z:
+                    extras = {k: z[k] for k in z.files}
+            os.utime(path)  # LRU: most recently used
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return features, extras
+
+    def put(self, key: str, features: np.ndarray, extras: Optional[Dict[str, np.ndarray]] = None):
+        """Store an entry atomically, then evict down to the size bound if needed."""
+        path, extra_path = self._paths(key)
+        written = 0
+        if extras:
+            written += self._write(extra_path, lambda f: np.savez(f, **extras))
+        written += self._write(path, lambda f: np.save(f, np.ascontiguousarray(features)))
+        with self._lock:
+            self._size += written
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def _write(self, path: Path, save) -> int:
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                save(f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return path.stat().st_size
+
+    def _scan(self):
+        entries = []
+        total = 0
+        for e in os.scandir(self.root):
+            if e.name.endswith(".npy"):
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    continue
+                extra = self.root / (e.name[:-4] + ".extra.npz")
+                size = st.st_size + (extra.stat().st_size if extra.exists() else 0)
+                entries.append((st.st_mtime, e.name[:-4], size))
+                total += size
+        return entries, total
+
+    def evict(self, target: Optional[int] = None) -> int:
+        """Delete least recently used entries until the cache is below `target` bytes (90 % of the bound)."""
+        target = int(self.max_bytes * 0.9) if target is None else target
+        entries, total = self._scan()
+        removed = 0
+        for _, key, size in sorted(entries):
+            if total <= target:
+                break
+            for p in self._paths(key):
+                try:
+                    p.unlink()
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+        with self._lock:
+            self._size = total
+        return removed
+
+    def clear(self) -> int:
+        return self.evict(0)
+
+    def stats(self) -> Dict:
+        entries, total = self._scan()
+        with self._lock:
+            self._size = total
+            lookups = max(self.hits + self.misses, 1)
+            return {"dir": str(self.root), "entries": len(entries), "bytes": total,
+                    "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups}
+
+
+def from_env() -> Optional[FeatureCache]:
+    """The cache configured by LEAK_FEATURE_CACHE_DIR / LEAK_FEATURE_CACHE_MB, or None if disabled."""
+    mb = float(os.environ.get("LEAK_FEATURE_CACHE_MB", "1024"))
+    if mb <= 0:
+        return None
+    return FeatureCache(os.environ.get("LEAK_FEATURE_CACHE_DIR", DEFAULT_DIR), int(mb * 2 ** 20))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the feature cache")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--dir", default=os.environ.get("LEAK_FEATURE_CACHE_DIR", DEFAULT_DIR))
+    args = parser.parse_args()
+    cache = FeatureCache(args.dir, 0 if args.command == "clear" else 1 << 62)
+    if args.command == "clear":
+        print(f"Removed {cache.clear()} entries from {cache.root}")
+    else:
+        print(json.dumps(cache.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
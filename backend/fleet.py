@@ -0,0 +1,192 @@
+"""
+In-memory state of a fleet of sensors, one row per sensor.
+
+Every field is a column of a preallocated NumPy array indexed by a slot
+number, so tens of thousands of sensors cost a few hundred bytes each and
+fleet-wide queries ("which sensors are alarming", "top N by leak
+probability") are single vectorised passes instead of loops over objects.
+
+Per sensor the store keeps:
+
+- the last `history` window probabilities (ring buffer) and the smoothed
+  probabilities, leak probability and alarm flag from `aggregation`;
+- the spectral baseline of `anomaly` (moving mean and variance of the log
+  band energies) and the anomaly score of the latest window;
+- first/last seen times and the number of windows.
+
+When all `capacity` slots are taken, the least recently seen sensor is
+evicted.
+"""
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import anomaly
+from inference import LEAK_TYPES
+
+
+class FleetStore:
+    """Fixed-capacity, array-backed per-sensor summaries."""
+
+    def __init__(self, capacity: int = 50000, history: int = 16, n_bands: int = anomaly.N_BANDS,
+                 n_classes: int = len(LEAK_TYPES)):
+        self.capacity = capacity
+        self.history = history
+        self.n_bands = n_bands
+        self.slots: Dict[str, int] = {}
+        self.ids = np.full(capacity, None, dtype=object)
+        self.used = np.zeros(capacity, dtype=bool)
+        self.recent = np.zeros((capacity, history, n_classes), dtype=np.float16)
+        self.recent_pos = np.zeros(capacity, dtype=np.int32)
+        self.probs = np.zeros((capacity, n_classes), dtype=np.float32)
+        self.leak = np.zeros(capacity, dtype=np.float32)
+        self.alarming = np.zeros(capacity, dtype=bool)
+        self.band_mean = np.zeros((capacity, n_bands), dtype=np.float32)
+        self.band_var = np.ones((capacity, n_bands), dtype=np.float32)
+        self.band_count = np.zeros(capacity, dtype=np.int64)
+        self.band_dev = np.zeros(capacity, dtype=np.float32)
+        self.first_seen = np.zeros(capacity, dtype=np.float64)
+        self.last_seen = np.zeros(capacity, dtype=np.float64)
+        self.windows = np.zeros(capacity, dtype=np.int64)
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.recent, self.probs, self.leak, self.alarming, self.band_mean,
+                                      self.band_var, self.band_count, self.band_dev, self.first_seen, self.last_seen,
+                                      self.windows, self.recent_pos, self.used))
+
+    def _slot(self, sensor_id: str, t: float) -> int:
+        slot = self.slots.get(sensor_id)
+        if slot is not None:
+            return slot
+        if len(self.slots) < self.capacity:
+            slot = int(np.argmin(self.used))
+        else:
+            slot = int(np.argmin(self.last_seen))
+            del self.slots[self.ids[slot]]
+            self.evicted += 1
+        self.slots[sensor_id] = slot
+        self.ids[slot] = sensor_id
+        self.used[slot] = True
+        self.recent[slot] = 0
+        self.recent_pos[slot] = 0
+        self.windows[slot] = 0
+        self.probs[slot] = 0
+        self.leak[slot] = 0
+        self.alarming[slot] = False
+        self.band_count[slot] = 0
+        self.band_dev[slot] = 0
+        self.last_seen[slot] = t
+        self.first_seen[slot] = t
+        return slot
+
+    def record(self, sensor_id: str, window_probs: np.ndarray, state: Dict, t: Optional[float] = None):
+        """
+        Add a sensor's newest classified windows.
+
+        Args:
+            sensor_id: Sensor
+            window_probs: Raw per-window probabilities (N, classes)
+            state: Smoothed state after these windows (`SensorStream.state()`)
+            t: Time of the last window (defaults to the state's lastSeen)
+        """
+        t = float(state["lastSeen"] if t is None else t)
+        with self._lock:
+            slot = self._slot(sensor_id, t)
+            n = len(window_probs)
+            idx = (self.recent_pos[slot] + np.arange(n)) % self.history
+            self.recent[slot, idx[-self.history:]] = window_probs[-self.history:]
+            self.recent_pos[slot] = (self.recent_pos[slot] + n) % self.history
+            self.probs[slot] = [state["probabilities"][name] for name in LEAK_TYPES]
+            self.leak[slot] = state["leakProbability"]
+            self.alarming[slot] = state["alarming"]
+            self.windows[slot] += n
+            self.last_seen[slot] = t
+
+    def observe(self, sensor_id: str, bands: np.ndarray, t: float) -> Tuple[np.ndarray, np.ndarray, bool]:
+        """
+        Score a sensor's newest windows against its spectral baseline.
+
+        Args:
+            sensor_id: Sensor
+            bands: Log band energies of the windows (N, n_bands), time order
+            t: Time of the last window
+
+        Returns:
+            (scores, anomalous flags, whether the sensor already has a
+            classified state the unclassified windows can keep)
+        """
+        with self._lock:
+            slot = self._slot(sensor_id, t)
+            known = bool(self.windows[slot])
+            count = int(self.band_count[slot])
+            scores, anomalous, self.band_count[slot] = anomaly.score_and_update(
+                bands, self.band_mean[slot], self.band_var[slot], count)
+            if len(scores) and not np.isnan(scores[-1]):
+                self.band_dev[slot] = scores[-1]
+            self.last_seen[slot] = t
+            return scores, anomalous, known
+
+    def _row(self, slot: int, detail: bool = False) -> Dict:
+        row = {
+            "sensor": self.ids[slot],
+            "leakProbability": float(self.leak[slot]),
+            "alarming": bool(self.alarming[slot]),
+            "label": LEAK_TYPES[int(np.argmax(self.probs[slot]))],
+            "anomalyScore": float(self.band_dev[slot]),
+            "windows": int(self.windows[slot]),
+            "lastSeen": float(self.last_seen[slot]),
+        }
+        if detail:
+            n = min(int(self.windows[slot]), self.history)
+            order = (self.recent_pos[slot] - n + np.arange(n)) % self.history
+            row.update({
+                "firstSeen": float(self.first_seen[slot]),
+                "probabilities": {name: float(p) for name, p in zip(LEAK_TYPES, self.probs[slot])},
+                "recent": self.recent[slot, order].astype(np.float32).round(4).tolist(),
+                "bandBaseline": {"mean": self.band_mean[slot].round(4).tolist(),
+                                 "std": np.sqrt(self.band_var[slot]).round(4).tolist()},
+            })
+        return row
+
+    def get(self, sensor_id: str) -> Optional[Dict]:
+        with self._lock:
+            slot = self.slots.get(sensor_id)
+            return None if slot is None else self._row(slot, detail=True)
+
+    def alarming_sensors(self, limit: int = 100) -> List[Dict]:
+        """Sensors whose alarm is on, highest leak probability first."""
+        with self._lock:
+            slots = np.flatnonzero(self.used & self.alarming)
+            slots = slots[np.argsort(-self.leak[slots], kind="stable")][:limit]
+            return [self._row(s) for s in slots]
+
+    def top(self, n: int = 10, since: Optional[float] = None) -> List[Dict]:
+        """The `n` sensors with the highest leak probability, optionally seen since `since`."""
+        with self._lock:
+            mask = self.used if since is None else self.used & (self.last_seen >= since)
+            slots = np.flatnonzero(mask)
+            if len(slots) > n:
+                slots = slots[np.argpartition(-self.leak[slots], n - 1)[:n]]
+            slots = slots[np.argsort(-self.leak[slots], kind="stable")]
+            return [self._row(s) for s in slots]
+
+    def summary(self) -> Dict:
+        with self._lock:
+            used = self.used
+            return {
+                "sensors": len(self.slots),
+                "capacity": self.capacity,
+                "alarming": int((used & self.alarming).sum()),
+                "evicted": self.evicted,
+                "memoryBytes": self.nbytes,
+                "labels": {name: int(((np.argmax(self.probs, axis=1) == i) & used).sum())
+                           for i, name in enumerate(LEAK_TYPES)},
+            }
@@ -0,0 +1,261 @@
+"""
+Time-frequency front-ends: how raw hydrophone audio becomes CNN input.
+
+The default is the 512-bin linear HLT STFT at STEP = 16 that the models in
+this repo were trained on (512 x 969 x 2 per 2 s window). The alternatives
+reduce that tensor by one to two orders of magnitude:
+
+- "logfreq" / "mel": triangular filterbank on the STFT magnitude, applied as
+  one sparse matrix multiply, with a configurable hop;
+- "cqt": constant-Q transform computed with a sparse spectral kernel
+  (Brown & Puckette) on longer FFT frames; needs raw audio.
+
+A front-end is described by a small config dict, e.g.
+`{"name": "mel", "n_bands": 64, "hop": 32}`. Training stores it in the
+feature store's meta.json, `sweep.py promote` copies it into the
+`leak_detector.json` sidecar, and the backend builds the same front-end from
+there with `get_frontend`.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+import scipy.fft
+from scipy import sparse
+
+import dsp
+from dsp import FS, NWIN, STEP, radar_tfr
+
+DEFAULT_CONFIG = {"name": "stft"}
+
+
+class STFTFrontEnd:
+    """log1p |HLT STFT|, fftshifted frequency axis (the original features)."""
+
+    name = "stft"
+    fftshifted = True
+
+    def __init__(self, hop: int = STEP):
+        if hop % STEP:
+            raise ValueError(f"hop must be a multiple of STEP={STEP}, got {hop}")
+        self.hop = int(hop)
+        self.frame_length = NWIN
+
+    @property
+    def config(self) -> Dict:
+        return {"name": self.name, "hop": self.hop}
+
+    @property
+    def n_features(self) -> int:
+        return NWIN
+
+    @property
+    def frame_ratio(self) -> int:
+        """STFT frames (at STEP) per front-end frame."""
+        return self.hop // STEP
+
+    def frames_for_seconds(self, sec: float) -> int:
+        return int(np.floor((sec * FS - self.frame_length) / self.hop) + 1)
+
+    def bytes_per_sample(self) -> float:
+        """
+        Peak memory of analysing one input sample of one channel.
+
+        The float32 input, the complex64 spectrum (twice: localisation takes
+        a reordered copy of it) and the float32 features.
+        """
+        return 4 + 2 * 8 * self.frame_length / self.hop + 4 * self.n_features / self.hop
+
+    def features(self, stft: np.ndarray) -> np.ndarray:
+        """Features from complex STFT frames (NWIN, T, S) already at this hop."""
+        return np.log1p(np.abs(stft)).astype(np.float32)
+
+    def transform(self, audio: np.ndarray) -> np.ndarray:
+        """
+        Features of a raw signal.
+
+        Args:
+            audio: Signal of shape (samples,) or (samples, channels); mono is
+                duplicated to two channels
+
+        Returns:
+            Array of shape (n_features, frames, channels), float32
+        """
+        return self.analyze(audio)[0]
+
+    def analyze(self, audio: np.ndarray):
+        """
+        Features and the complex STFT they were computed from.
+
+        Returns:
+            (features (n_features, frames, channels), STFT (NWIN, frames,
+            channels) complex64 at this hop, or None if the front-end does
+            not use one)
+        """
+        stft = radar_tfr(_as_channels(audio), NWIN, self.hop)
+        return self.features(stft), stft
+
+
+class FilterbankFrontEnd(STFTFrontEnd):
+    """Triangular log-frequency or mel filterbank on the positive STFT bins."""
+
+    fftshifted = False
+
+    def __init__(self, name: str = "mel", n_bands: int = 64, hop: int = 32,
+                 fmin: float = 50.0, fmax: Optional[float] = None):
+        super().__init__(hop)
+        self.name = name
+        self.n_bands = int(n_bands)
+        self.fmin = float(fmin)
+        self.fmax = float(fmax or FS / 2)
+        self.matrix = filterbank(name, self.n_bands, self.fmin, self.fmax)
+
+    @property
+    def config(self) -> Dict:
+        return {"name": self.name, "n_bands": self.n_bands, "hop": self.hop,
+                "fmin": self.fmin, "fmax": self.fmax}
+
+    @property
+    def n_features(self) -> int:
+        return self.n_bands
+
+    def features(self, stft: np.ndarray) -> np.ndarray:
+        mag = np.abs(stft[NWIN // 2:])  # fftshifted: DC .. FS/2 - 1 bin
+        _, T, S = mag.shape
+        bands = self.matrix @ mag.reshape(NWIN // 2, T * S)
+        return np.log1p(bands).reshape(self.n_bands, T, S).astype(np.float32)
+
+
+class CQTFrontEnd(STFTFrontEnd):
+    """Constant-Q transform, log1p magnitude, from a sparse spectral kernel."""
+
+    name = "cqt"
+    fftshifted = False
+
+    def __init__(self, bins_per_octave: int = 12, fmin: float = 125.0, fmax: Optional[float] = None,
+                 hop: int = 32, threshold: float = 0.0054):
+        super().__init__(hop)
+        self.bins_per_octave = int(bins_per_octave)
+        self.fmin = float(fmin)
+        self.fmax = float(fmax or FS / 2 * 0.95)
+        self.kernel, self.frame_length = cqt_kernel(self.fmin, self.fmax, self.bins_per_octave, threshold)
+
+    @property
+    def config(self) -> Dict:
+        return {"name": self.name, "bins_per_octave": self.bins_per_octave, "hop": self.hop,
+                "fmin": self.fmin, "fmax": self.fmax}
+
+    @property
+    def n_features(self) -> int:
+        return self.kernel.shape[0]
+
+    def features(self, stft: np.ndarray) -> np.ndarray:
+        raise ValueError("The CQT front-end needs raw audio; STFT datasets cannot be converted")
+
+    def analyze(self, audio: np.ndarray):
+        x = _as_channels(audio).astype(np.float32)
+        N, S = x.shape
+        if N < self.frame_length:
+            x = np.pad(x, ((0, self.frame_length - N), (0, 0)))
+        view = np.lib.stride_tricks.sliding_window_view(x, self.frame_length, axis=0)[::self.hop]
+        T = view.shape[0]
+        spec = scipy.fft.fft(view, axis=-1, workers=dsp.FFT_WORKERS)  # (T, S, nfft)
+        out = self.kernel @ spec.reshape(T * S, -1).T  # (bins, T*S)
+        return np.log1p(np.abs(out)).reshape(-1, T, S).astype(np.float32), None
+
+
+def _as_channels(audio: np.ndarray) -> np.ndarray:
+    if audio.ndim == 1:
+        audio = np.tile(audio[:, np.newaxis], (1, 2))
+    return audio
+
+
+def _hz_to_mel(f):
+    return 2595.0 * np.log10(1.0 + np.asarray(f) / 700.0)
+
+
+def _mel_to_hz(m):
+    return 700.0 * (10 ** (np.asarray(m) / 2595.0) - 1.0)
+
+
+def filterbank(scale: str, n_bands: int, fmin: float, fmax: float) -> sparse.csr_matrix:
+    """
+    Area-normalized triangular filters over the NWIN // 2 positive STFT bins.
+
+    Args:
+        scale: "mel" or "logfreq" (geometrically spaced centres)
+        n_bands: Number of filters
+        fmin, fmax: Frequency range in Hz
+
+    Returns:
+        Sparse matrix of shape (n_bands, NWIN // 2)
+    """
+    if scale == "mel":
+        edges = _mel_to_hz(np.linspace(_hz_to_mel(fmin), _hz_to_mel(fmax), n_bands + 2))
+    elif scale == "logfreq":
+        edges = np.geomspace(fmin, fmax, n_bands + 2)
+    else:
+        raise ValueError(f"Unknown filterbank scale {scale!r}")
+    freqs = np.arange(NWIN // 2) * FS / NWIN
+    bin_width = FS / NWIN
+    fb = np.zeros((n_bands, NWIN // 2), dtype=np.float32)
+    for b in range(n_bands):
+        lo, mid, hi = edges[b:b + 3]
+        # at least one bin wide so narrow low bands are not empty
+        up = (freqs - lo) / max(mid - lo, bin_width)
+        down = (hi - freqs) / max(hi - mid, bin_width)
+        tri = np.maximum(0.0, np.minimum(up, down))
+        if not tri.any():
+            tri[int(np.argmin(np.abs(freqs - mid)))] = 1.0
+        fb[b] = tri / tri.sum()
+    return sparse.csr_matrix(fb)
+
+
+def cqt_kernel(fmin: float, fmax: float, bins_per_octave: int = 12, threshold: float = 0.0054):
+    """
+    Sparse spectral kernel of a constant-Q transform.
+
+    Each bin k is a Hann-windowed complex exponential of length Q * FS / f_k,
+    centred in an FFT frame of the next power of two above the longest one.
+    Its conjugate spectrum, with values below `threshold` dropped, turns the
+    CQT of a frame into one sparse product with the frame's FFT.
+
+    Returns:
+        (kernel csr_matrix (n_bins, nfft), nfft)
+    """
+    Q = 1.0 / (2 ** (1.0 / bins_per_octave) - 1)
+    n_bins = int(np.ceil(bins_per_octave * np.log2(fmax / fmin)))
+    freqs = fmin * 2 ** (np.arange(n_bins) / bins_per_octave)
+    lengths = np.ceil(Q * FS / freqs).astype(int)
+    nfft = int(2 ** np.ceil(np.log2(lengths[0])))
+    rows = []
+    for f, n in zip(freqs, lengths):
+        t = np.arange(n) - n // 2
+        atom = np.zeros(nfft, dtype=np.complex128)
+        start = nfft // 2 - n // 2
+        atom[start:start + n] = np.hanning(n) / n * np.exp(2j * np.pi * f * t / FS)
+        spec = np.fft.fft(atom)
+        spec[np.abs(spec) < threshold] = 0
+        rows.append(np.conj(spec) / nfft)
+    return sparse.csr_matrix(np.array(rows, dtype=np.complex64)), nfft
+
+
+FRONTENDS = {
+    "stft": STFTFrontEnd,
+    "mel": lambda **kw: FilterbankFrontEnd("mel", **kw),
+    "logfreq": lambda **kw: FilterbankFrontEnd("logfreq", **kw),
+    "cqt": CQTFrontEnd,
+}
+
+
+def get_frontend(config: Optional[Dict] = None):
+    """
+    Front-end from a config dict such as `{"name": "mel", "n_bands": 64, "hop": 32}`.
+
+    None or an empty dict gives the default linear STFT.
+    """
+    config = dict(config or DEFAULT_CONFIG)
+    name = config.pop("name", "stft")
+    if name not in FRONTENDS:
+        raise ValueError(f"Unknown front-end {name!r}; choose from {sorted(FRONTENDS)}")
+    return FRONTENDS[name](**config)
@@ -0,0 +1,293 @@
+"""
+Model artifacts the backend can serve.
+
+`load_predictor` looks in the models directory for, in order of preference,
+an exported TFLite flatbuffer, an exported SavedModel and the Keras `.h5`
+written by the training scripts. Each is wrapped in a predictor with the same
+`predict(batch) -> probabilities` interface so the API does not care which
+format is deployed.
+
+Models trained from a feature store (`code/sweep.py`) expect z-scored
+features. Their training statistics are shipped as `<name>_norm.npz` (per
+frequency x channel `mean` and `std`) and applied by `NormalizedPredictor`,
+so callers always pass the front-end's raw features.
+
+Exports are only served while they belong to the model next to them: the
+`"export"` entry of the `<name>.json` sidecar holds the SHA-256 of each
+exported artifact and of the `.h5` it was exported from, and an export whose
+hashes no longer match (e.g. after a new `.h5` was promoted) is skipped.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "leak_detector"
+
+# Output classes of every model, in training label order
+LEAK_TYPES = [
+    "Circumferential Crack",
+    "Gasket Leak",
+    "Longitudinal Crack",
+    "No-leak",
+    "Orifice Leak"
+]
+
+
+def _tflite_interpreter_class():
+    """TFLite interpreter from tflite-runtime if installed, else from TensorFlow."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        import tensorflow as tf
+        return tf.lite.Interpreter
+    except ImportError:
+        return None
+
+
+class KerasPredictor:
+    """Keras model loaded from `.h5`, called directly instead of `model.predict`."""
+
+    format = "keras"
+
+    def __init__(self, model):
+        import tensorflow as tf
+
+        self.model = model
+        self._fn = tf.function(lambda x: model(x, training=False), reduce_retracing=True)
+
+    @classmethod
+    def from_path(cls, path: Path) -> "KerasPredictor":
+        import tensorflow as tf
+        return cls(tf.keras.models.load_model(str(path), compile=False))
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self._fn(np.asarray(batch, dtype=np.float32)))
+
+
+class SavedModelPredictor:
+    """SavedModel produced by `code/export_model.py` (serving_default signature)."""
+
+    format = "savedmodel"
+
+    def __init__(self, path: Path):
+        import tensorflow as tf
+
+        self._loaded = tf.saved_model.load(str(path))
+        self._fn = self._loaded.signatures["serving_default"]
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        import tensorflow as tf
+
+        out = self._fn(tf.constant(np.asarray(batch, dtype=np.float32)))
+        return np.asarray(next(iter(out.values())))
+
+
+class TFLitePredictor:
+    """TFLite flatbuffer; the interpreter is resized when the batch size changes."""
+
+    format = "tflite"
+
+    def __init__(self, path: Path, num_threads: Optional[int] = None):
+        Interpreter = _tflite_interpreter_class()
+        if Interpreter is None:
+            raise ImportError("Neither tflite-runtime nor TensorFlow is installed")
+        self.path = Path(path)
+        self._interp = Interpreter(model_path=str(path), num_threads=num_threads)
+        self._interp.allocate_tensors()
+        self._in = self._interp.get_input_details()[0]
+        self._out = self._interp.get_output_details()[0]
+        self._batch = int(self._in["shape"][0])
+        # Interpreter objects are not thread-safe
+        self._lock = threading.Lock()
+
+    def _quantize(self, batch: np.ndarray) -> np.ndarray:
+        scale, zero = self._in.get("quantization", (0.0, 0))
+        if self._in["dtype"] in (np.int8, np.uint8) and scale:
+            info = np.iinfo(self._in["dtype"])
+            batch = np.clip(np.round(batch / scale + zero), info.min, info.max)
+        return batch.astype(self._in["dtype"])
+
+    def _dequantize(self, out: np.ndarray) -> np.ndarray:
+        scale, zero = self._out.get("quantization", (0.0, 0))
+        if self._out["dtype"] in (np.int8, np.uint8) and scale:
+            return (out.astype(np.float32) - zero) * scale
+        return out.astype(np.float32)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            if batch.shape[0] != self._batch:
+                self._interp.resize_tensor_input(self._in["index"], list(batch.shape))
+                self._interp.allocate_tensors()
+                self._in = self._interp.get_input_details()[0]
+                self._out = self._interp.get_output_details()[0]
+                self._batch = batch.shape[0]
+            self._interp.set_tensor(self._in["index"], self._quantize(batch))
+            self._interp.invoke()
+            return self._dequantize(self._interp.get_tensor(self._out["index"]))
+
+
+class LinearProbePredictor:
+    """
+    Deterministic NumPy stand-in for the CNN (demo mode without TensorFlow).
+
+    A fixed linear probe on each window's spectral shape: the log band
+    energies (`dsp.band_energies`) minus their mean, times weights drawn from
+    a fixed seed, then a softmax. The same window always gets the same
+    probabilities, and a request pays for the real ingestion, front-end and
+    post-processing; only the CNN's own cost is missing. The probabilities
+    mean nothing.
+    """
+
+    format = "demo"
+
+    def __init__(self, fftshifted: bool = True, n_bands: int = 16, num_classes: int = len(LEAK_TYPES),
+                 seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.fftshifted = fftshifted
+        self.n_bands = n_bands
+        self.weights = (rng.standard_normal((n_bands, num_classes)) * 2.0 / np.sqrt(n_bands)).astype(np.float32)
+        self.bias = np.zeros(num_classes, dtype=np.float32)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        from dsp import band_energies
+
+        energies = band_energies(np.asarray(batch, dtype=np.float32), self.n_bands, self.fftshifted)
+        logits = (energies - energies.mean(axis=1, keepdims=True)) @ self.weights + self.bias
+        e = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return e / e.sum(axis=1, keepdims=True)
+
+
+class NormalizedPredictor:
+    """Applies the training split's mean/std to raw features before the model."""
+
+    def __init__(self, predictor, mean: np.ndarray, std: np.ndarray):
+        self.predictor = predictor
+        self.format = predictor.format
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.predictor.predict((np.asarray(batch, dtype=np.float32) - self.mean) / self.std)
+
+
+def load_normalization(models_dir: Path, name: str = MODEL_NAME) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """(mean, std) of shape (F, 1, S) from `<name>_norm.npz`, or None if absent."""
+    path = Path(models_dir) / f"{name}_norm.npz"
+    if not path.exists():
+        return None
+    with np.load(path) as z:
+        return z["mean"], z["std"]
+
+
+def with_normalization(predictor, models_dir: Path, name: str = MODEL_NAME):
+    """`predictor` wrapped in its model's input normalisation, if it has one."""
+    norm = load_normalization(models_dir, name)
+    return predictor if norm is None else NormalizedPredictor(predictor, *norm)
+
+
+def artifact_sha256(path: Path) -> str:
+    """SHA-256 of a model file (of `saved_model.pb` for a SavedModel directory)."""
+    path = Path(path)
+    if path.is_dir():
+        path = path / "saved_model.pb"
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _export_is_current(fmt: str, path: Path, info: dict, h5: Path) -> bool:
+    """Whether the exported `path` matches the sidecar's export record and `.h5`."""
+    record = info.get("export")
+    if record is None:
+        # exported before the sidecar recorded exports: only trusted when
+        # there is no .h5 it could be stale against
+        return not h5.exists()
+    try:
+        if record.get(fmt) != artifact_sha256(path):
+            return False
+        source = record.get("source_sha256")
+        # no source: a standalone export such as a distilled student
+        return source is None or not h5.exists() or source == artifact_sha256(h5)
+    except OSError:
+        return False
+
+
+def find_artifact(models_dir: Path, name: str = MODEL_NAME) -> Optional[Tuple[str, Path]]:
+    """
+    First available (format, path) in preference order, or None.
+
+    Exported artifacts that are stale against `<name>.h5` and the sidecar
+    are skipped with a warning.
+    """
+    models_dir = Path(models_dir)
+    candidates = [
+        ("tflite", models_dir / f"{name}.tflite"),
+        ("savedmodel", models_dir / f"{name}_savedmodel"),
+        ("keras", models_dir / f"{name}.h5"),
+    ]
+    info = load_model_info(models_dir, name)
+    h5 = models_dir / f"{name}.h5"
+    for fmt, path in candidates:
+        if not path.exists():
+            continue
+        if fmt != "keras" and not _export_is_current(fmt, path, info, h5):
+            logger.warning(f"Ignoring {path.name}: not exported from the current {h5.name} "
+                           f"(re-run code/export_model.py)")
+            continue
+        return fmt, path
+    return None
+
+
+def load_model_info(models_dir: Path, name: str = MODEL_NAME) -> dict:
+    """
+    Metadata written next to the model by the training tools (`<name>.json`).
+
+    Holds e.g. the `dataset_version` the model was trained on; empty if the
+    file is missing or unreadable.
+    """
+    path = Path(models_dir) / f"{name}.json"
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def load_predictor(models_dir: Path, name: str = MODEL_NAME, num_threads: Optional[int] = None):
+    """
+    Load the preferred model artifact from `models_dir`.
+
+    Args:
+        models_dir: Directory holding the exported model(s)
+        name: Artifact base name
+        num_threads: Interpreter threads of a TFLite model (TensorFlow models
+            use the process-wide intra-op setting)
+
+    Returns:
+        (predictor, path) or (None, None) if no artifact is present; the
+        predictor takes raw features (see `NormalizedPredictor`)
+    """
+    found = find_artifact(models_dir, name)
+    if found is None:
+        return None, None
+    fmt, path = found
+    if fmt == "tflite":
+        predictor = TFLitePredictor(path, num_threads)
+    elif fmt == "savedmodel":
+        predictor = SavedModelPredictor(path)
+    else:
+        predictor = KerasPredictor.from_path(path)
+    return with_normalization(predictor, models_dir, name), path
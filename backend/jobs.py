@@ -0,0 +1,440 @@
+"""
+Asynchronous analysis jobs for recordings too long for `/api/analyze`.
+
+Uploads are written to `<jobs dir>/<id>/input.<ext>` and queued in a SQLite
+table. A small pool of local worker processes claims jobs by priority
+(highest first, then oldest), reads the input through a memmap in blocks of
+windows, runs the same front-end / cascade / model pipeline as the API and
+appends one JSON line per window to `results.jsonl` as it goes. Progress is
+the number of windows written; a cancellation request is honoured between
+blocks. No external services are involved.
+
+The jobs directory defaults to `backend/job_data` (`LEAK_JOBS_DIR`), the
+worker count to 1 (`LEAK_JOB_WORKERS`, 0 disables the pool). Each claim
+records the worker's pid; the pool respawns a worker process that dies and
+requeues the job it held, failing the job instead once it has killed
+`MAX_ATTEMPTS` workers.
+"""
+
+import json
+import logging
+import multiprocessing as mp
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from dsp import CHUNK_SEC, FS, window_spectrogram
+import feature_cache
+from feature_cache import audio_hash, cache_key
+from inference import LEAK_TYPES
+import resources
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = Path(os.environ.get("LEAK_JOBS_DIR", Path(__file__).parent / "job_data"))
+MODELS_DIR = Path(__file__).parent / "models"
+INPUT_TYPES = (".npy", ".raw")
+BLOCK_WINDOWS = 32
+POLL_SEC = 0.5
+WATCH_SEC = 2.0
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    priority INTEGER DEFAULT 0,
+    filename TEXT,
+    input_path TEXT,
+    created REAL,
+    started REAL,
+    finished REAL,
+    windows_total INTEGER,
+    windows_done INTEGER DEFAULT 0,
+    cancel_requested INTEGER DEFAULT 0,
+    summary TEXT,
+    error TEXT,
+    worker INTEGER,
+    attempts INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created);
+"""
+# Columns added after the first release, for job stores created before them
+MIGRATIONS = {"worker": "INTEGER", "attempts": "INTEGER DEFAULT 0"}
+
+
+@contextmanager
+def connect(jobs_dir: Path = JOBS_DIR):
+    """Job store connection in autocommit mode (claims use explicit transactions); always closes."""
+    jobs_dir = Path(jobs_dir)
+    jobs_dir.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(jobs_dir / "jobs.db"), timeout=30.0, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        have = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+        for column, decl in MIGRATIONS.items():
+            if column not in have:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {decl}")
+        yield conn
+    finally:
+        conn.close()
+
+
+def job_dir(job_id: str, jobs_dir: Path = JOBS_DIR) -> Path:
+    return Path(jobs_dir) / job_id
+
+
+def create_job(filename: str, priority: int = 0, jobs_dir: Path = JOBS_DIR) -> Dict:
+    """
+    Register a job and reserve its directory; the caller writes the input.
+
+    Returns:
+        Dict with id and input_path
+    """
+    suffix = Path(filename).suffix.lower()
+    if suffix not in INPUT_TYPES:
+        raise ValueError(f"Unsupported input {suffix!r}; jobs accept {', '.join(INPUT_TYPES)}")
+    job_id = uuid.uuid4().hex
+    d = job_dir(job_id, jobs_dir)
+    d.mkdir(parents=True)
+    return {"id": job_id, "input_path": str(d / f"input{suffix}"), "filename": filename,
+            "priority": int(priority)}
+
+
+def enqueue(job: Dict, jobs_dir: Path = JOBS_DIR):
+    """Queue a job whose input has been written."""
+    with connect(jobs_dir) as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, status, priority, filename, input_path, created) "
+            "VALUES (:id, 'queued', :priority, :filename, :input_path, :created)",
+            {**job, "created": time.time()})
+
+
+def get_job(job_id: str, jobs_dir: Path = JOBS_DIR) -> Optional[Dict]:
+    with connect(jobs_dir) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _public(row) if row else None
+
+
+def list_jobs(limit: int = 50, jobs_dir: Path = JOBS_DIR) -> List[Dict]:
+    with connect(jobs_dir) as conn:
+        rows = conn.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+    return [_public(r) for r in rows]
+
+
+def _public(row) -> Dict:
+    d = dict(row)
+    total, done = d.get("windows_total"), d.get("windows_done") or 0
+    d["progress"] = (done / total) if total else (1.0 if d["status"] == "done" else 0.0)
+    d["summary"] = json.loads(d["summary"]) if d.get("summary") else None
+    d["cancel_requested"] = bool(d["cancel_requested"])
+    d.pop("input_path", None)
+    return d
+
+
+def cancel_job(job_id: str, jobs_dir: Path = JOBS_DIR) -> Optional[str]:
+    """
+    Cancel a queued job at once, or ask the worker to stop a running one.
+
+    Returns:
+        The job's status after the request, or None if there is no such job
+    """
+    with connect(jobs_dir) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            conn.execute("ROLLBACK")
+            return None
+        if row["status"] == "queued":
+            conn.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ?",
+                         (time.time(), job_id))
+        elif row["status"] == "running":
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+        conn.execute("COMMIT")
+        return conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()["status"]
+
+
+def requeue_interrupted(jobs_dir: Path = JOBS_DIR) -> int:
+    """Put jobs left 'running' by a previous server process back in the queue."""
+    with connect(jobs_dir) as conn:
+        cur = conn.execute("UPDATE jobs SET status = 'queued', windows_done = 0, started = NULL, "
+                           "worker = NULL WHERE status = 'running'")
+        return cur.rowcount
+
+
+def requeue_worker(pid: int, jobs_dir: Path = JOBS_DIR, max_attempts: int = MAX_ATTEMPTS) -> Dict:
+    """
+    Recover the jobs a dead worker process left 'running'.
+
+    A job goes back in the queue unless it has already been claimed
+    `max_attempts` times, in which case it is failed so that an input which
+    crashes the worker cannot take the pool down in a loop.
+
+    Returns:
+        Dict with the number of jobs requeued and failed
+    """
+    with connect(jobs_dir) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        failed = conn.execute(
+            "UPDATE jobs SET status = 'failed', finished = ?, worker = NULL, "
+            "error = 'worker process died ' || attempts || ' time(s) on this job' "
+            "WHERE status = 'running' AND worker = ? AND attempts >= ?",
+            (time.time(), pid, max_attempts)).rowcount
+        requeued = conn.execute(
+            "UPDATE jobs SET status = 'queued', windows_done = 0, started = NULL, worker = NULL "
+            "WHERE status = 'running' AND worker = ?", (pid,)).rowcount
+        conn.execute("COMMIT")
+    return {"requeued": requeued, "failed": failed}
+
+
+def claim_next(jobs_dir: Path = JOBS_DIR) -> Optional[Dict]:
+    """Atomically move the best queued job to 'running', owned by this process."""
+    with connect(jobs_dir) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' "
+                           "ORDER BY priority DESC, created ASC LIMIT 1").fetchone()
+        if row is None:
+            conn.execute("ROLLBACK")
+            return None
+        conn.execute("UPDATE jobs SET status = 'running', started = ?, worker = ?, "
+                     "attempts = attempts + 1 WHERE id = ?", (time.time(), os.getpid(), row["id"]))
+        conn.execute("COMMIT")
+        return dict(row)
+
+
+# ---------------- worker ----------------
+def read_input(path: str) -> np.ndarray:
+    """Memory-map an uploaded .npy (float) or .raw (int32) recording."""
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    return np.memmap(path, dtype=np.int32, mode="r")
+
+
+def load_pipeline(models_dir: Path = MODELS_DIR, demo: bool = False):
+    """
+    (predictor, front-end, cascade) as `app.load_model` builds them.
+
+    Without a loadable model this raises, unless `demo` is set: then the
+    deterministic `LinearProbePredictor` of demo mode stands in for the CNN.
+    """
+    from cascade import Cascade
+    from frontends import get_frontend
+    from inference import LinearProbePredictor, load_model_info, load_predictor
+
+    try:
+        predictor, path = load_predictor(models_dir, num_threads=resources.resolve()["tf_intra_op"])
+    except ImportError:
+        if not demo:
+            raise
+        predictor = None
+    frontend = get_frontend(load_model_info(models_dir).get("frontend") if predictor is not None else None)
+    if predictor is None:
+        if not demo:
+            raise FileNotFoundError(f"No model in {models_dir}")
+        logger.warning(f"No loadable model in {models_dir}; jobs run in DEMO mode (linear probe)")
+        predictor = LinearProbePredictor(frontend.fftshifted)
+    return predictor, frontend, Cascade.from_models_dir(models_dir)
+
+
+def window_count(samples: int, frontend, K: int, stride: int) -> int:
+    """Windows `/api/analyze` produces for a recording of `samples` samples."""
+    frames = max(0, (samples - frontend.frame_length) // frontend.hop + 1)
+    return 1 if frames < K else (frames - K) // stride + 1
+
+
+def block_features(audio: np.ndarray, w0: int, w1: int, frontend, K: int, stride: int,
+                   cache=None) -> np.ndarray:
+    """
+    Features of the samples behind windows [w0, w1) of a recording.
+
+    With a `feature_cache.FeatureCache`, the block is looked up by the hash of
+    its samples first, so re-running an archive recording with another model
+    skips the transform.
+
+    Returns:
+        Features (n_features, frames, channels); `window_spectrogram(features,
+        K, stride)[:w1 - w0]` are the block's windows
+    """
+    # samples covering frames [w0*stride, (w1-1)*stride + K)
+    s0 = w0 * stride * frontend.hop
+    s1 = ((w1 - 1) * stride + K - 1) * frontend.hop + frontend.frame_length
+    block = audio[s0:s1]
+    key = cache_key(audio_hash(np.asarray(block)), frontend.config) if cache else None
+    cached = cache.get(key) if cache else None
+    if cached is not None:
+        return cached[0]
+    features, _ = frontend.analyze(np.asarray(block, dtype=np.float32))
+    if cache:
+        cache.put(key, features)
+    return features
+
+
+def run_job(job: Dict, pipeline, jobs_dir: Path = JOBS_DIR, block_windows: int = BLOCK_WINDOWS,
+            cache=None) -> str:
+    """
+    Analyze one claimed job block by block, streaming per-window results.
+
+    Returns:
+        Final status ("done" or "cancelled")
+    """
+    predictor, frontend, cascade = pipeline
+    audio = read_input(job["input_path"])
+    K = frontend.frames_for_seconds(CHUNK_SEC)
+    stride = max(1, K // 2)
+    total = window_count(len(audio), frontend, K, stride)
+    with connect(jobs_dir) as conn:
+        conn.execute("UPDATE jobs SET windows_total = ?, windows_done = 0 WHERE id = ?", (total, job["id"]))
+
+    out_path = job_dir(job["id"], jobs_dir) / "results.jsonl"
+    prob_sum = np.zeros(len(LEAK_TYPES), dtype=np.float64)
+    stages = np.zeros(3, dtype=np.int64)
+    with open(out_path, "w") as out:
+        for w0 in range(0, total, block_windows):
+            w1 = min(total, w0 + block_windows)
+            features = block_features(audio, w0, w1, frontend, K, stride, cache)
+            windows = window_spectrogram(features, K, stride)[:w1 - w0]
+            probs, stage = cascade.predict(predictor, windows)
+            for i in range(len(probs)):
+                out.write(json.dumps({
+                    "window": w0 + i,
+                    "startSec": (w0 + i) * stride * frontend.hop / FS,
+                    "stage": int(stage[i]),
+                    "probabilities": [round(float(p), 6) for p in probs[i]],
+                }) + "\n")
+            out.flush()
+            prob_sum += probs.sum(axis=0)
+            stages += np.bincount(stage, minlength=3)
+
+            with connect(jobs_dir) as conn:
+                conn.execute("UPDATE jobs SET windows_done = ? WHERE id = ?", (w1, job["id"]))
+                cancel = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?",
+                                      (job["id"],)).fetchone()[0]
+            if cancel:
+                _finish(job["id"], "cancelled", jobs_dir)
+                return "cancelled"
+
+    mean = prob_sum / max(total, 1)
+    best = int(np.argmax(mean))
+    summary = {
+        "prediction": LEAK_TYPES[best],
+        "confidence": float(mean[best]) * 100,
+        "probabilities": {LEAK_TYPES[i]: float(mean[i]) * 100 for i in range(len(LEAK_TYPES))},
+        "windows": total,
+        "durationSec": len(audio) / FS,
+        "cascade": {"screened": int(stages[1]), "fullModel": int(stages[2])},
+    }
+    (job_dir(job["id"], jobs_dir) / "summary.json").write_text(json.dumps(summary, indent=2))
+    _finish(job["id"], "done", jobs_dir, summary=summary)
+    return "done"
+
+
+def _finish(job_id, status, jobs_dir, summary=None, error=None):
+    with connect(jobs_dir) as conn:
+        conn.execute("UPDATE jobs SET status = ?, finished = ?, summary = ?, error = ? WHERE id = ?",
+                     (status, time.time(), json.dumps(summary) if summary else None, error, job_id))
+
+
+def worker_main(jobs_dir: str, models_dir: str, threads: int = 1, poll_sec: float = POLL_SEC):
+    """Worker process loop: claim, run, repeat."""
+    os.environ.update(resources.thread_env(threads))
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    logging.basicConfig(level=logging.INFO)
+    resources.apply()
+
+    pipeline = None
+    cache = feature_cache.from_env()
+    while True:
+        job = claim_next(jobs_dir)
+        if job is None:
+            time.sleep(poll_sec)
+            continue
+        try:
+            if pipeline is None:
+                pipeline = load_pipeline(Path(models_dir), demo=True)
+            status = run_job(job, pipeline, jobs_dir, cache=cache)
+            logger.info(f"job {job['id']}: {status}")
+        except Exception as e:
+            logger.error(f"job {job['id']} failed: {e}")
+            _finish(job["id"], "failed", jobs_dir, error=str(e))
+
+
+class WorkerPool:
+    """
+    Local job worker processes, started and stopped with the API.
+
+    A watcher thread checks the processes every `WATCH_SEC`; a dead one has
+    its jobs recovered (`requeue_worker`) and is replaced, so the pool keeps
+    its size.
+    """
+
+    def __init__(self, workers: int = 1, threads: int = 1, jobs_dir: Path = JOBS_DIR,
+                 models_dir: Path = MODELS_DIR, watch_sec: float = WATCH_SEC):
+        self.workers = workers
+        self.threads = threads
+        self.jobs_dir = Path(jobs_dir)
+        self.models_dir = Path(models_dir)
+        self.watch_sec = watch_sec
+        self._procs: List[mp.Process] = []
+        self._stopping = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    def _spawn(self) -> mp.Process:
+        p = mp.get_context("spawn").Process(
+            target=worker_main, daemon=True,
+            args=(str(self.jobs_dir), str(self.models_dir), self.threads))
+        p.start()
+        return p
+
+    def start(self):
+        n = requeue_interrupted(self.jobs_dir)
+        if n:
+            logger.info(f"Requeued {n} interrupted job(s)")
+        self._stopping.clear()
+        self._procs = [self._spawn() for _ in range(self.workers)]
+        self._watcher = threading.Thread(target=self._watch, name="job-pool-watcher", daemon=True)
+        self._watcher.start()
+
+    def check(self) -> int:
+        """Replace dead workers and recover their jobs; returns how many were replaced."""
+        replaced = 0
+        for i, p in enumerate(self._procs):
+            if p.is_alive() or self._stopping.is_set():
+                continue
+            p.join(0)
+            n = requeue_worker(p.pid, self.jobs_dir)
+            logger.warning(f"Job worker {p.pid} died (exit code {p.exitcode}); "
+                           f"requeued {n['requeued']} job(s), failed {n['failed']}")
+            self._procs[i] = self._spawn()
+            replaced += 1
+        return replaced
+
+    def _watch(self):
+        while not self._stopping.wait(self.watch_sec):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Job pool check failed: {e}")
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout)
+            self._watcher = None
+        for p in self._procs:
+            p.terminate()
+        for p in self._procs:
+            p.join(timeout)
+        self._procs = []
+
+    @property
+    def alive(self) -> int:
+        return sum(p.is_alive() for p in self._procs)
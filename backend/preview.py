@@ -0,0 +1,111 @@
+"""
+Small spectrogram previews for the webapp.
+
+A 2 s spectrogram is 512 x 969 x 2 float32 (~4 MB), far too much to send
+to a browser. `render_preview` reduces the features inference already
+computed to at most `max_height` x `max_width` uint8 pixels: positive
+frequencies only, block-averaged in both axes, converted to dB and scaled
+over a fixed dynamic range. The result is served either as a grayscale PNG
+(`encode_png`, standard library only) or as raw bytes with the scale needed
+to map pixels back to dB.
+
+Previews are content-addressed (hash of the uploaded bytes and the front-end)
+and kept in a bounded in-memory LRU (`PreviewCache`), so the endpoint never
+recomputes an STFT and the responses can be cached by the client indefinitely.
+"""
+
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+MAX_WIDTH = 512
+MAX_HEIGHT = 128
+DYNAMIC_RANGE_DB = 80.0
+
+
+def _block_mean(x: np.ndarray, axis: int, size: int) -> np.ndarray:
+    """Average `x` along `axis` into at most `size` nearly equal blocks."""
+    n = x.shape[axis]
+    if n <= size:
+        return x
+    edges = np.linspace(0, n, size + 1).astype(int)[:-1]
+    widths = np.diff(np.append(edges, n))
+    shape = [1] * x.ndim
+    shape[axis] = len(widths)
+    return np.add.reduceat(x, edges, axis=axis) / widths.reshape(shape)
+
+
+def render_preview(features: np.ndarray, fftshifted: bool = True, channel: int = 0,
+                   max_width: int = MAX_WIDTH, max_height: int = MAX_HEIGHT,
+                   dynamic_range_db: float = DYNAMIC_RANGE_DB) -> Dict:
+    """
+    Downsampled uint8 dB image of one channel of a log1p-magnitude spectrogram.
+
+    Args:
+        features: Front-end output (F, T, S), log1p magnitudes
+        fftshifted: Frequency axis is a full fftshifted STFT (keep the upper half)
+        channel: Channel to render
+        max_width, max_height: Bounds on the image size in pixels
+        dynamic_range_db: dB range below the maximum mapped onto 0..255
+
+    Returns:
+        Dict with `pixels` (H, W) uint8, lowest frequency in the bottom row,
+        plus `db_max` and `db_min` of the scale
+    """
+    spec = features[..., channel]
+    if fftshifted:
+        spec = spec[spec.shape[0] // 2:]
+    # average power, not log values, so narrow tones survive the downsampling
+    power = np.expm1(spec.astype(np.float64)) ** 2
+    power = _block_mean(_block_mean(power, 0, max_height), 1, max_width)
+    db = 10.0 * np.log10(power + 1e-12)
+    db_max = float(db.max())
+    db_min = db_max - dynamic_range_db
+    pixels = np.clip((db - db_min) / dynamic_range_db * 255.0, 0, 255).astype(np.uint8)
+    return {"pixels": np.ascontiguousarray(pixels[::-1]), "db_max": db_max, "db_min": db_min}
+
+
+def encode_png(pixels: np.ndarray) -> bytes:
+    """8-bit grayscale PNG of an (H, W) uint8 array."""
+    h, w = pixels.shape
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    # filter type 0 (None) at the start of every row
+    raw = np.hstack([np.zeros((h, 1), dtype=np.uint8), pixels]).tobytes()
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+class PreviewCache:
+    """Thread-safe LRU of rendered previews, bounded by entry count."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key: str, preview: Dict):
+        with self._lock:
+            self._items[key] = preview
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            preview = self._items.get(key)
+            if preview is not None:
+                self._items.move_to_end(key)
+            return preview
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
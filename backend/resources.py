@@ -0,0 +1,277 @@
+"""
+Thread pools of an inference process.
+
+TensorFlow (intra-op and inter-op pools), the BLAS/OpenMP libraries behind
+NumPy and SciPy, and the FFT each size their thread pools to every core of
+the machine by default. With several workers on one host that means many
+times more runnable threads than cores, and tail latency suffers. This
+module sets all of them from one place:
+
+| Setting       | Env                    | Applies to                                 |
+|---------------|------------------------|--------------------------------------------|
+| `tf_intra_op` | `LEAK_TF_INTRA_THREADS`| TensorFlow intra-op pool, TFLite threads   |
+| `tf_inter_op` | `LEAK_TF_INTER_THREADS`| TensorFlow inter-op pool                   |
+| `blas`        | `LEAK_BLAS_THREADS`    | BLAS and OpenMP pools (threadpoolctl)      |
+| `fft_workers` | `LEAK_FFT_WORKERS`     | `scipy.fft` workers of the STFT and CQT    |
+
+Unset values default to `LEAK_THREADS` (set by `serve.py` per worker), or
+to the CPUs this process may run on, except `tf_inter_op`, which defaults to
+1: the CNN is a chain of layers with little independent work to overlap.
+
+`apply` must run before TensorFlow executes its first op; `effective` reports
+what the libraries actually use, for `/api/health`.
+
+`python resources.py --benchmark --cores 4` times the analysis pipeline under
+every split of the cores into workers x threads and thread assignment, and
+prints the combinations ranked by throughput.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+try:
+    from threadpoolctl import threadpool_info, threadpool_limits
+except ImportError:
+    threadpool_info = threadpool_limits = None
+
+logger = logging.getLogger(__name__)
+
+ENV = {
+    "tf_intra_op": "LEAK_TF_INTRA_THREADS",
+    "tf_inter_op": "LEAK_TF_INTER_THREADS",
+    "blas": "LEAK_BLAS_THREADS",
+    "fft_workers": "LEAK_FFT_WORKERS",
+}
+
+_applied: Dict = {}
+_limits = None  # keeps the threadpoolctl limits alive
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def resolve(overrides: Optional[Dict] = None) -> Dict[str, int]:
+    """Settings from `overrides`, then the environment, then the defaults."""
+    threads = _env_int("LEAK_THREADS") or available_cpus()
+    defaults = {"tf_intra_op": threads, "tf_inter_op": 1, "blas": threads, "fft_workers": threads}
+    config = {key: _env_int(var) or defaults[key] for key, var in ENV.items()}
+    config.update({k: int(v) for k, v in (overrides or {}).items() if v})
+    return config
+
+
+def thread_env(threads: int) -> Dict[str, str]:
+    """
+    Environment for a child process running `threads` threads.
+
+    The OpenMP/BLAS variables take effect when those libraries load, which
+    is before `apply` can run.
+    """
+    env = {var: str(threads) for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")}
+    env["LEAK_THREADS"] = str(threads)
+    return env
+
+
+def apply(overrides: Optional[Dict] = None) -> Dict[str, int]:
+    """
+    Configure every thread pool of this process.
+
+    Returns:
+        The resolved settings (also used for TFLite `num_threads` and the FFT)
+    """
+    global _limits
+    config = resolve(overrides)
+
+    if threadpool_limits is not None:
+        _limits = threadpool_limits(limits=config["blas"])
+    import dsp
+    dsp.FFT_WORKERS = config["fft_workers"]
+
+    try:
+        import tensorflow as tf
+    except ImportError:
+        tf = None
+    if tf is not None:
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(config["tf_intra_op"])
+            tf.config.threading.set_inter_op_parallelism_threads(config["tf_inter_op"])
+        except RuntimeError as e:
+            # the runtime is already initialised; its pools keep their size
+            logger.warning(f"TensorFlow threads not changed: {e}")
+
+    _applied.clear()
+    _applied.update(config)
+    return config
+
+
+def effective() -> Dict:
+    """Settings in force, as reported by the libraries themselves."""
+    import dsp
+
+    report = {"cpus": available_cpus(), "requested": dict(_applied), "fft_workers": dsp.FFT_WORKERS}
+    if "tensorflow" in sys.modules:
+        tf = sys.modules["tensorflow"]
+        report["tf_intra_op"] = tf.config.threading.get_intra_op_parallelism_threads()
+        report["tf_inter_op"] = tf.config.threading.get_inter_op_parallelism_threads()
+    if threadpool_info is not None:
+        report["threadpools"] = [
+            {"api": p["user_api"], "library": p["internal_api"], "threads": p["num_threads"]}
+            for p in threadpool_info()
+        ]
+    return report
+
+
+# ---------------- benchmark ----------------
+def _probe(requests: int, seconds: float):
+    """One benchmark process: time `requests` analyses of a synthetic recording."""
+    import numpy as np
+
+    apply()
+    from cascade import Cascade
+    from dsp import CHUNK_SEC, FS, window_spectrogram
+    from frontends import get_frontend
+    from inference import KerasPredictor, LinearProbePredictor, load_model_info, load_predictor
+
+    models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+    frontend = get_frontend(load_model_info(models_dir).get("frontend"))
+    predictor, _ = load_predictor(models_dir, num_threads=resolve()["tf_intra_op"])
+    if predictor is None:
+        import app
+        predictor = (KerasPredictor(app.build_demo_model()) if app.TF_AVAILABLE
+                     else LinearProbePredictor(frontend.fftshifted))
+    cascade = Cascade.from_models_dir(models_dir)
+
+    audio = np.random.default_rng(0).standard_normal((int(FS * seconds), 2)).astype(np.float32)
+    K = frontend.frames_for_seconds(CHUNK_SEC)
+
+    def analyze():
+        features, _ = frontend.analyze(audio)
+        cascade.predict(predictor, window_spectrogram(features, K, max(1, K // 2)))
+
+    analyze()  # warm-up: graph tracing, interpreter allocation
+    print("ready", flush=True)
+    sys.stdin.readline()  # start together with the other workers
+    latencies = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        analyze()
+        latencies.append(time.perf_counter() - t0)
+    print(json.dumps(latencies), flush=True)
+
+
+def candidates(cores: int) -> List[Dict[str, int]]:
+    """Worker/thread layouts that use exactly `cores` CPUs."""
+    out = []
+    for workers in range(1, cores + 1):
+        if cores % workers:
+            continue
+        threads = cores // workers
+        # with one thread per worker every pool is 1; otherwise try giving the
+        # extra threads to each stage alone and to all of them
+        assignments = {(threads, threads, threads)}
+        if threads > 1:
+            assignments |= {(threads, 1, 1), (1, threads, threads), (threads, 1, threads)}
+        for intra, blas, fft in sorted(assignments, reverse=True):
+            out.append({"workers": workers, "threads": threads, "tf_intra_op": intra,
+                        "tf_inter_op": 1, "blas": blas, "fft_workers": fft})
+    return out
+
+
+def run_candidate(cand: Dict[str, int], requests: int, seconds: float) -> Dict:
+    """Run `workers` pinned probe processes concurrently and summarise their latencies."""
+    cpus = sorted(os.sched_getaffinity(0))
+    env = {**os.environ, **thread_env(cand["threads"]), "TF_CPP_MIN_LOG_LEVEL": "3"}
+    for key, var in ENV.items():
+        env[var] = str(cand[key])
+    procs = []
+    for w in range(cand["workers"]):
+        block = {cpus[(w * cand["threads"] + j) % len(cpus)] for j in range(cand["threads"])}
+        p = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--probe", "--requests", str(requests),
+             "--seconds", str(seconds)],
+            env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            preexec_fn=lambda block=block: os.sched_setaffinity(0, block))
+        procs.append(p)
+    for p in procs:
+        if p.stdout.readline().strip() != "ready":
+            raise RuntimeError(f"probe failed for {cand}")
+    t0 = time.perf_counter()
+    for p in procs:
+        p.stdin.write("\n")
+        p.stdin.flush()
+    latencies = []
+    for p in procs:
+        latencies += json.loads(p.stdout.readline())
+        p.wait()
+    wall = time.perf_counter() - t0
+
+    import numpy as np
+    lat = np.array(latencies) * 1e3
+    return {**cand, "throughput_rps": len(lat) / wall,
+            "p50_ms": float(np.percentile(lat, 50)), "p99_ms": float(np.percentile(lat, 99))}
+
+
+def benchmark(cores: int, requests: int = 20, seconds: float = 10.0) -> List[Dict]:
+    """All candidate layouts for `cores` CPUs, best throughput first."""
+    results = []
+    for cand in candidates(cores):
+        res = run_candidate(cand, requests, seconds)
+        logger.info(f"{cand['workers']} x {cand['threads']} (tf {cand['tf_intra_op']}, blas {cand['blas']}, "
+                    f"fft {cand['fft_workers']}): {res['throughput_rps']:.2f} req/s, "
+                    f"p99 {res['p99_ms']:.0f} ms")
+        results.append(res)
+    return sorted(results, key=lambda r: -r["throughput_rps"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Thread pool settings of the inference backend")
+    parser.add_argument("--benchmark", action="store_true", help="Search worker/thread layouts")
+    parser.add_argument("--cores", type=int, default=available_cpus(), help="CPUs to plan for")
+    parser.add_argument("--requests", type=int, default=20, help="Analyses per worker and layout")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Length of the test recording")
+    parser.add_argument("--out", help="Write the ranked results as JSON")
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        _probe(args.requests, args.seconds)
+        return
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if not args.benchmark:
+        apply()
+        print(json.dumps(effective(), indent=2))
+        return
+
+    results = benchmark(args.cores, args.requests, args.seconds)
+    print(f"\n{'workers':>7} {'threads':>7} {'tf':>3} {'blas':>4} {'fft':>3} {'req/s':>7} {'p50 ms':>7} {'p99 ms':>7}")
+    for r in results:
+        print(f"{r['workers']:>7} {r['threads']:>7} {r['tf_intra_op']:>3} {r['blas']:>4} {r['fft_workers']:>3} "
+              f"{r['throughput_rps']:>7.2f} {r['p50_ms']:>7.0f} {r['p99_ms']:>7.0f}")
+    best = results[0]
+    print(f"\nBest: LEAK_WORKERS={best['workers']} LEAK_THREADS={best['threads']} "
+          f"LEAK_TF_INTRA_THREADS={best['tf_intra_op']} LEAK_BLAS_THREADS={best['blas']} "
+          f"LEAK_FFT_WORKERS={best['fft_workers']}")
+    if best["workers"] > 1:
+        print("(more than one worker needs LEAK_STATELESS=1: streaming, fleet and preview state is per worker)")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Production server: one master process, N forked uvicorn workers.
+
+`uvicorn app:app` runs a single process; starting several of them loads
+NumPy, SciPy, TensorFlow and the model N times. Here the master imports the
+application once (every library, the front-end matrices and the model
+metadata), warms the model file into the page cache, binds the listening
+socket and then forks the workers, which share all of that copy-on-write.
+
+What each added worker costs depends on the model format:
+
+- TFLite: the interpreter memory-maps the flatbuffer read-only, so the
+  weights are the same physical pages in every worker; a worker adds only
+  its interpreter arena (activations) and Python heap. This is the format
+  to deploy with more than one worker (`code/export_model.py --format tflite`).
+- SavedModel / Keras `.h5`: TensorFlow's runtime cannot be initialised
+  before a fork, so every worker loads its own copy of the weights.
+
+Each worker runs `threads` inference threads (TFLite `num_threads`,
+TensorFlow intra-op threads, BLAS/OpenMP and FFT, see `resources.py`; the
+individual pools can be overridden there) and with `--pin` is restricted to
+its own block of `threads` CPUs, so workers do not oversubscribe the machine.
+Workers that exit unexpectedly are restarted. The asynchronous job workers
+(`jobs.WorkerPool`) are started once, by the master, not by every worker.
+
+Per-worker state: the streaming aggregation (`/api/stream`), the fleet
+summaries (`/api/fleet*`), the alarm event stream (`/api/events`) and the
+spectrogram previews (`/api/preview`) live in each worker's memory. With
+more than one worker a sensor's chunks are smoothed by whichever worker
+accepts them, the fleet and event endpoints see one worker's share and a
+preview id may not be found. `serve.py` therefore refuses more than one
+worker unless `--stateless` (`LEAK_STATELESS=1`) confirms that clients only
+use the stateless endpoints (`/api/analyze` without previews, `/api/jobs`).
+
+Usage:
+    python serve.py --workers 4 --threads 1 --pin --stateless
+    LEAK_THREADS=4 python serve.py --port $PORT
+"""
+
+import argparse
+import logging
+import mmap
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("serve")
+
+
+def cpu_blocks(workers: int, threads: int) -> List[List[int]]:
+    """CPU set of each worker: consecutive blocks of `threads` allowed CPUs, wrapping around."""
+    cpus = sorted(os.sched_getaffinity(0))
+    return [[cpus[(i * threads + j) % len(cpus)] for j in range(threads)] for i in range(workers)]
+
+
+def warm_model_file(models_dir) -> Optional[mmap.mmap]:
+    """
+    Map the TFLite flatbuffer and pull it into the page cache.
+
+    The workers' interpreters map the same file, so its pages are shared
+    instead of read once per worker. The mapping is kept for the master's
+    lifetime so the pages stay resident.
+    """
+    from inference import find_artifact
+
+    found = find_artifact(models_dir)
+    if found is None:
+        logger.warning(f"No model in {models_dir}; workers will serve the demo model")
+        return None
+    fmt, path = found
+    if fmt != "tflite":
+        logger.warning(f"{path.name} is a {fmt} model: each worker loads its own copy of the weights. "
+                       f"Export it with code/export_model.py --format tflite to share them.")
+        return None
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapped, "madvise"):
+        mapped.madvise(mmap.MADV_WILLNEED)
+    for offset in range(0, len(mapped), mmap.PAGESIZE):
+        mapped[offset]
+    logger.info(f"Mapped {path.name} ({len(mapped) / 1e6:.1f} MB) for the workers")
+    return mapped
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, application, cpus: Optional[List[int]], args):
+    """Body of a forked worker: pin, then serve on the inherited socket."""
+    import uvicorn
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    config = uvicorn.Config(application, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Master:
+    """Forks, supervises and stops the HTTP workers."""
+
+    def __init__(self, sock: socket.socket, application, args):
+        self.sock = sock
+        self.application = application
+        self.args = args
+        self.cpus = cpu_blocks(args.workers, args.threads) if args.pin else [None] * args.workers
+        self.children: Dict[int, int] = {}  # pid -> worker index
+        self.stopping = False
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.sock, self.application, self.cpus[index], self.args)
+            except BaseException:
+                logger.exception(f"worker {index} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = index
+        pinned = f" on CPUs {self.cpus[index]}" if self.cpus[index] else ""
+        logger.info(f"worker {index} started (pid {pid}){pinned}")
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for i in range(self.args.workers):
+            self.spawn(i)
+        while self.children:
+            # poll our own children only: the job pool's processes are the master's too
+            for pid in list(self.children):
+                try:
+                    done, status = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done, status = pid, 0
+                if not done:
+                    continue
+                index = self.children.pop(pid)
+                if not self.stopping:
+                    logger.warning(f"worker {index} (pid {pid}) exited with status {status}; restarting")
+                    self.spawn(index)
+            time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefork production server for the leak detection API")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("LEAK_WORKERS", "1")),
+                        help="HTTP worker processes (LEAK_WORKERS)")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("LEAK_THREADS", "1")),
+                        help="Inference threads per worker (LEAK_THREADS)")
+    parser.add_argument("--pin", action="store_true", default=os.environ.get("LEAK_PIN_CPUS") == "1",
+                        help="Pin each worker to its own block of --threads CPUs (LEAK_PIN_CPUS=1)")
+    parser.add_argument("--stateless", action="store_true", default=os.environ.get("LEAK_STATELESS") == "1",
+                        help="Allow --workers > 1: stream, fleet, event and preview state is per worker "
+                             "(LEAK_STATELESS=1)")
+    parser.add_argument("--keep-alive", type=int, default=5, help="HTTP keep-alive timeout in seconds")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    if args.workers > 1 and not args.stateless:
+        parser.error("streaming, fleet, event and preview state is per worker process: with "
+                     f"--workers {args.workers} it would be split between them. Run one worker, or pass "
+                     "--stateless (LEAK_STATELESS=1) if clients only use /api/analyze and /api/jobs.")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if args.workers > 1:
+        logger.warning("Stateless mode: /api/stream, /api/fleet, /api/events and /api/preview "
+                       "only see the state of the worker that serves the request")
+    # must be in place before TensorFlow or BLAS are imported
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import resources
+    os.environ.update(resources.thread_env(args.threads))
+    job_workers = int(os.environ.get("LEAK_JOB_WORKERS", "1"))
+    os.environ["LEAK_JOB_WORKERS"] = "0"  # the HTTP workers must not start job pools
+
+    import app as application  # the preload: libraries and module state shared copy-on-write
+    import jobs
+
+    mapped = warm_model_file(application.MODELS_DIR)
+    sock = bind(args.host, args.port)
+    logger.info(f"Listening on {args.host}:{args.port} with {args.workers} worker(s) x {args.threads} thread(s)")
+
+    pool = None
+    if job_workers > 0:
+        pool = jobs.WorkerPool(workers=job_workers, threads=int(os.environ.get("LEAK_JOB_THREADS", "1")))
+        pool.start()
+    try:
+        Master(sock, application.app, args).run()
+    finally:
+        if pool is not None:
+            pool.stop()
+        sock.close()
+        if mapped is not None:
+            mapped.close()
+
+
+if __name__ == "__main__":
+    main()
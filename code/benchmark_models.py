@@ -0,0 +1,168 @@
+"""
+Benchmark the latency tiers of `model_zoo` on this CPU.
+
+For every tier x precision the harness reports parameters, analytic FLOPs,
+single-request and batched latency and, when a feature store is given,
+test accuracy after a short training run (or from saved weights). With
+`--budget-ms` it recommends the most accurate tier whose batch-1 latency fits
+the per-request CPU budget.
+
+Usage:
+    python benchmark_models.py --threads 2
+    python benchmark_models.py --store features/ --train-epochs 30 --budget-ms 50
+    python benchmark_models.py --weights-dir trained/ --store features/ --json bench.json
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+import leak_training as lt
+import model_zoo as zoo
+
+
+def benchmark(tier, precision, input_shape, store=None, weights_dir=None,
+              train_epochs=0, fold_bn=True, batch_sizes=(1, 8)):
+    """
+    Measure one tier/precision combination.
+
+    Returns:
+        Dict of metrics; `accuracy` is None without a feature store
+    """
+    import tensorflow as tf
+
+    model = zoo.build_model(tier, input_shape, len(lt.CLASS_NAMES), precision)
+    trained = False
+    if weights_dir is not None:
+        path = Path(weights_dir) / f"{tier}_{precision}.weights.h5"
+        if path.exists():
+            model.load_weights(str(path))
+            trained = True
+
+    train_time = None
+    if store is not None and not trained and train_epochs > 0:
+        _, arrays = store
+        model.compile(optimizer=tf.keras.optimizers.Adam(1e-3),
+                      loss=tf.keras.losses.SparseCategoricalCrossentropy(),
+                      metrics=["accuracy"])
+        t0 = time.perf_counter()
+        model.fit(lt.make_ds(arrays["train_X"], arrays["train_y"], train=True, bs=16, seed=0),
+                  validation_data=lt.make_ds(arrays["val_X"], arrays["val_y"], train=False, bs=32),
+                  epochs=train_epochs, class_weight=lt.class_weights(arrays["train_y"]),
+                  callbacks=[tf.keras.callbacks.EarlyStopping(monitor="val_loss", patience=10,
+                                                              restore_best_weights=True)],
+                  verbose=0)
+        train_time = time.perf_counter() - t0
+        trained = True
+        if weights_dir is not None:
+            Path(weights_dir).mkdir(parents=True, exist_ok=True)
+            model.save_weights(str(Path(weights_dir) / f"{tier}_{precision}.weights.h5"))
+
+    accuracy = None
+    if store is not None and trained:
+        _, arrays = store
+        probs = model.predict(lt.make_ds(arrays["test_X"], arrays["test_y"], train=False, bs=32),
+                              verbose=0)
+        if len(arrays["test_y"]):
+            accuracy = float(np.mean(probs.argmax(axis=1) == arrays["test_y"]))
+
+    served = zoo.fold_batchnorm(model) if fold_bn else model
+    infer = tf.function(lambda x: served(x, training=False))
+    latency = {}
+    for bs in batch_sizes:
+        x = tf.constant(np.random.randn(bs, *input_shape).astype(np.float32))
+        lat = lt.measure_latency(infer, x)
+        latency[bs] = {**lat, "per_sample_ms": lat["median_ms"] / bs}
+
+    compute_dtype, variable_dtype = zoo.precision_dtypes(precision)
+    return {
+        "tier": tier,
+        "precision": precision,
+        "compute_dtype": compute_dtype,
+        "variable_dtype": variable_dtype,
+        "native_precision": zoo.cpu_supports(precision),
+        "bn_folded": served is not model,
+        "params": int(model.count_params()),
+        "mflops": zoo.count_flops(model, fold_bn=fold_bn) / 1e6,
+        "latency": latency,
+        "accuracy": accuracy,
+        "train_time_s": train_time,
+    }
+
+
+def pick_for_budget(results, budget_ms):
+    """Most accurate (else cheapest-FLOPs-first largest) result within budget at batch 1."""
+    fits = [r for r in results if r["latency"][1]["median_ms"] <= budget_ms]
+    if not fits:
+        return None
+    if any(r["accuracy"] is not None for r in fits):
+        return max(fits, key=lambda r: (r["accuracy"] or 0.0, -r["latency"][1]["median_ms"]))
+    return max(fits, key=lambda r: r["mflops"])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tiers", nargs="+", default=list(zoo.TIERS), choices=zoo.TIERS)
+    ap.add_argument("--precisions", nargs="+", default=["float32"], choices=zoo.PRECISIONS)
+    ap.add_argument("--store", help="feature store from `sweep.py prepare` (enables accuracy)")
+    ap.add_argument("--weights-dir", help="load/save per-tier weights here")
+    ap.add_argument("--train-epochs", type=int, default=0)
+    ap.add_argument("--threads", type=int, help="TF intra-op threads (default: TF's choice)")
+    ap.add_argument("--no-fold-bn", action="store_true", help="time the unfolded graph")
+    ap.add_argument("--budget-ms", type=float, help="per-request CPU budget at batch size 1")
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    if args.threads:
+        os.environ["OMP_NUM_THREADS"] = str(args.threads)
+    import tensorflow as tf
+    if args.threads:
+        tf.config.threading.set_intra_op_parallelism_threads(args.threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    store = None
+    if args.store:
+        store = lt.open_feature_store(args.store)
+        shape = store[0]["shape"]
+        input_shape = (shape["F"], shape["K"], shape["S"])
+    else:
+        input_shape = (lt.NWIN, lt.frames_for_seconds(lt.CHUNK_SEC), 2)
+
+    results = []
+    for tier in args.tiers:
+        for precision in args.precisions:
+            if not zoo.cpu_supports(precision):
+                print(f"note: {precision} is emulated on this CPU; latency will not be representative")
+            r = benchmark(tier, precision, input_shape, store, args.weights_dir,
+                          args.train_epochs, fold_bn=not args.no_fold_bn)
+            results.append(r)
+
+    print(f"\n{'tier':<9}{'precision':<16}{'params':>9}{'MFLOPs':>10}"
+          f"{'b1 ms':>9}{'b8 ms/s':>9}{'acc':>7}")
+    for r in results:
+        acc = f"{r['accuracy']:.3f}" if r["accuracy"] is not None else "-"
+        print(f"{r['tier']:<9}{r['precision']:<16}{r['params']:>9}{r['mflops']:>10.1f}"
+              f"{r['latency'][1]['median_ms']:>9.2f}{r['latency'][8]['per_sample_ms']:>9.2f}{acc:>7}")
+    for precision in args.precisions:
+        compute_dtype, variable_dtype = zoo.precision_dtypes(precision)
+        if compute_dtype != variable_dtype:
+            print(f"note: {precision} is mixed precision: {compute_dtype} compute with "
+                  f"{variable_dtype} weights, so model size and saved weights are unchanged")
+
+    if args.budget_ms is not None:
+        best = pick_for_budget(results, args.budget_ms)
+        if best is None:
+            print(f"\nNo tier fits {args.budget_ms} ms at batch size 1")
+        else:
+            print(f"\nRecommended for {args.budget_ms} ms: {best['tier']} ({best['precision']})")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Python port of `pilot.jl`: build the HLT STFT training dataset.
+
+Walks `<data_dir>/<sensor>/<network>`, keeps the files of one flow rate with
+background noise (the `N`, not `NN`, recordings), labels them by their leak
+directory and runs the same HLT STFT (`backend/dsp.py`). Unlike `pilot.jl`:
+
+- input files are read through `np.memmap` and transformed in blocks, and
+  each recording is processed in its own worker process;
+- recordings are not truncated to the shortest one in the dataset (only the
+  hydrophone channels of a recording are aligned with each other);
+- the H1/H2 files of a capture are paired by name rather than by position,
+  and labels come from the fixed class list, never from the directory order;
+- every recording is written to its own shard `recordings/<id>.npy`,
+  (F, T, S) complex64, block by block, so the full cube is never in memory.
+
+`index.json` lists the shards with their labels. `leak_training` (and so
+`sweep.py prepare --dataset`) reads this layout directly.
+
+Rebuilds are incremental. `index.json` is also the manifest: it records the
+SHA-256, size and mtime of every input file and the transform parameters, and
+each recording carries a key derived from both. On the next run only
+recordings whose key changed are transformed again, shards of recordings
+that disappeared are removed, and the label index is rewritten. The dataset
+`version` is a hash over all recording keys; feature stores, trained models
+and the backend's `/api/health` carry it.
+
+The window is `dsp.hlt_window`, the one the backend serves with; it is the
+time reverse of the `pilot.jl` window (sample grid -L/2..L/2-1 instead of
+-L/2+1..L/2).
+
+With `--index corpus.db` (see `corpus_index.py`) the file list comes from the
+metadata index instead of a walk over the tree.
+
+Usage:
+    python build_dataset.py --data-dir "<...>/Dataset of Leak Simulations ..." --out dataset/
+    python build_dataset.py --index corpus.db --network Looped --flow-rate 0.18 --out dataset_looped/
+    python build_dataset.py --data-dir ... --flow-rate 0.18 --network Looped --workers 4 --out dataset_looped/
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from dsp import FS, NWIN, STEP, radar_tfr_blocks  # noqa: E402
+
+import corpus_index  # noqa: E402
+
+LEAK_TYPES = ["Circumferential Crack", "Gasket Leak", "Longitudinal Crack", "No-leak", "Orifice Leak"]
+BLOCK_FRAMES = 2048
+PARAMS = {"fs": FS, "nwin": NWIN, "step": STEP, "window": "hlt", "zeta": 8.0, "n": 0.99}
+
+
+def file_digest(path, previous=None, rehash=False):
+    """
+    Content hash, size and mtime of an input file.
+
+    The SHA-256 of an unchanged file (same size and mtime_ns as `previous`)
+    is reused unless `rehash` is set.
+    """
+    st = os.stat(path)
+    entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if (not rehash and previous and previous.get("size") == entry["size"]
+            and previous.get("mtime_ns") == entry["mtime_ns"]):
+        return {**entry, "sha256": previous["sha256"]}
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return {**entry, "sha256": h.hexdigest()}
+
+
+def recording_key(rec, files):
+    """Hash of the transform parameters and the recording's input contents."""
+    payload = json.dumps({"params": PARAMS, "files": [files[f]["sha256"] for f in rec["files"]]},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def dataset_version(recordings):
+    """Short ID over all recording keys and labels."""
+    payload = json.dumps(sorted((r["id"], r["label_id"], r["key"]) for r in recordings))
+    return hashlib.sha256(payload.encode()).hexdigest()[:12]
+
+
+def read_flow_data(path):
+    """Memory-map an int32 hydrophone file (pilot.jl `read_flowData`)."""
+    return np.memmap(path, dtype=np.int32, mode="r")
+
+
+def select_files(data_dir, sensor="Hydrophone", network="Branched", flow_rate="0.47"):
+    """
+    Files of one flow rate with background noise, as selected in pilot.jl.
+
+    The noise condition is the `N` / `NN` token of the file name
+    (`BR_CC_0.47 LPS_N_H1.raw`). pilot.jl's `r"N(?!N)"` on the full path
+    also matches the second letter of `NN`, so it is not reused here.
+
+    Returns:
+        Sorted list of Paths
+    """
+    root = Path(data_dir) / sensor / network
+    files = [p for p in sorted(root.rglob("*")) if p.is_file()]
+    return [p for p in files if flow_rate in p.name and "N" in p.stem.split("_")]
+
+
+def group_recordings(files):
+    """
+    Pair the hydrophone files of each capture into a two-channel recording.
+
+    pilot.jl reshapes its file axis into (2, L/2), pairing consecutive files
+    (hydrophones H1/H2 of the same leak) as the two channels of a recording.
+    Here the pair is found by name instead: files in the same leak directory
+    whose stems match once the H1/H2 token is removed (`corpus_index`'s
+    channel token) are one capture, so adding a capture adds a recording
+    and leaves the others' keys unchanged. Files without exactly one H1 and
+    one H2 partner are skipped with a warning.
+
+    Labels are fixed by `LEAK_TYPES` (1-based, pilot.jl's label order);
+    leak directories outside it raise ValueError.
+
+    Returns:
+        List of dicts with id, label, label_id and files (H1, H2)
+    """
+    unknown = sorted({f.parent.name for f in files} - set(LEAK_TYPES))
+    if unknown:
+        raise ValueError(f"Unknown leak classes {unknown}, expected directories named {LEAK_TYPES}")
+
+    captures = {}
+    for f in files:
+        tokens = f.stem.split("_")
+        channel = next((t.upper() for t in tokens if corpus_index.CHANNEL.match(t)), None)
+        stem = "_".join(t for t in tokens if not corpus_index.CHANNEL.match(t))
+        captures.setdefault((f.parent.name, stem), {}).setdefault(channel, []).append(f)
+
+    recordings = []
+    for (name, stem), channels in sorted(captures.items()):
+        if sorted(channels) != ["H1", "H2"] or any(len(c) != 1 for c in channels.values()):
+            found = ", ".join(str(p) for c in channels.values() for p in c)
+            print(f"warning: skipping {name}/{stem}: needs one H1 and one H2 file, found {found}")
+            continue
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", f"{name} {stem}").strip("_").lower()
+        recordings.append({
+            "id": slug,
+            "label": name,
+            "label_id": LEAK_TYPES.index(name) + 1,
+            "files": [str(channels["H1"][0]), str(channels["H2"][0])],
+        })
+    return recordings
+
+
+def transform_recording(rec, out_dir, nwin=NWIN, step=STEP, block_frames=BLOCK_FRAMES):
+    """
+    STFT one recording into its shard. Runs in a worker process.
+
+    The two channels are aligned to the shorter of them.
+
+    Returns:
+        Recording dict with samples, frames and shard path added
+    """
+    channels = [read_flow_data(f) for f in rec["files"]]
+    n = min(len(c) for c in channels)
+    frames = max(0, (n - nwin) // step + 1)
+
+    shard = Path(out_dir) / "recordings" / f"{rec['id']}.npy"
+    tmp = shard.with_suffix(".tmp.npy")
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.complex64,
+                                    shape=(nwin, frames, len(channels)))
+    # column view over the memmaps, materialised one block at a time
+    cube = _Columns(channels, n)
+    for k0, block in radar_tfr_blocks(cube, nwin, step, block_frames):
+        out[:, k0:k0 + block.shape[1], :] = block
+    out.flush()
+    del out
+    os.replace(tmp, shard)
+    return {**rec, "samples": int(n), "frames": int(frames), "shard": str(shard.relative_to(out_dir))}
+
+
+class _Columns:
+    """(samples, channels) float32 view over several 1-D int32 memmaps."""
+
+    def __init__(self, channels, n):
+        self.channels = channels
+        self.shape = (n, len(channels))
+
+    def __getitem__(self, sl):
+        return np.stack([np.asarray(c[sl], dtype=np.float32) for c in self.channels], axis=1)
+
+
+def build(data_dir, out_dir, sensor="Hydrophone", network="Branched", flow_rate="0.47",
+          workers=None, rehash=False, index_db=None):
+    """
+    Build or incrementally update the sharded dataset.
+
+    Args:
+        data_dir: Dataset root to walk (ignored when `index_db` is given)
+        out_dir: Output directory
+        sensor, network, flow_rate: Selection
+        workers: Transform processes (default: one per recording up to the CPU count)
+        rehash: Hash every input even if its size and mtime are unchanged
+        index_db: Metadata index from `corpus_index.py` to select files from
+
+    Returns:
+        Index dict (also written to out_dir/index.json)
+    """
+    out_dir = Path(out_dir)
+    (out_dir / "recordings").mkdir(parents=True, exist_ok=True)
+    if index_db is not None:
+        files = corpus_index.select(index_db, sensor=sensor, network=network,
+                                    flow_rate=flow_rate, noise="N")
+    else:
+        files = select_files(data_dir, sensor, network, flow_rate)
+    if not files:
+        raise FileNotFoundError(f"No {sensor}/{network} files at flow rate {flow_rate} in "
+                                f"{index_db or data_dir}")
+    recordings = group_recordings(files)
+    if not recordings:
+        raise FileNotFoundError(f"No H1/H2 file pairs among the {len(files)} selected files")
+
+    index_path = out_dir / "index.json"
+    previous = json.loads(index_path.read_text()) if index_path.exists() else {}
+    prev_files = previous.get("files", {})
+    prev_recs = {r["id"]: r for r in previous.get("recordings", [])}
+
+    digests = {str(f): file_digest(f, prev_files.get(str(f)), rehash) for f in files}
+    todo, done = [], []
+    for rec in recordings:
+        rec["key"] = recording_key(rec, digests)
+        old = prev_recs.get(rec["id"])
+        if old and old.get("key") == rec["key"] and (out_dir / old["shard"]).exists():
+            done.append({**old, **rec})
+        else:
+            todo.append(rec)
+
+    for rid, old in prev_recs.items():
+        if rid not in {r["id"] for r in recordings}:
+            (out_dir / old["shard"]).unlink(missing_ok=True)
+            print(f"{rid}: removed")
+
+    print(f"{len(todo)} of {len(recordings)} recordings new or changed")
+    if todo:
+        workers = workers or min(len(todo), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(transform_recording, rec, out_dir) for rec in todo]
+            for fut in futures:
+                rec = fut.result()
+                print(f"{rec['id']}: {len(rec['files'])} ch, {rec['samples'] / FS:.1f}s, {rec['frames']} frames")
+                done.append(rec)
+
+    done.sort(key=lambda r: r["id"])
+    index = {
+        "version": dataset_version(done),
+        "params": PARAMS,
+        "selection": {"sensor": sensor, "network": network, "flow_rate": flow_rate, "noise": "N"},
+        "files": digests,
+        "recordings": done,
+    }
+    tmp = index_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(index, indent=2))
+    os.replace(tmp, index_path)
+    return index
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--data-dir", help="root of the leak-simulation dataset")
+    src.add_argument("--index", help="metadata index built by corpus_index.py")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--sensor", default="Hydrophone")
+    ap.add_argument("--network", default="Branched")
+    ap.add_argument("--flow-rate", default="0.47")
+    ap.add_argument("--workers", type=int)
+    ap.add_argument("--rehash", action="store_true", help="hash every input even if size/mtime match")
+    args = ap.parse_args()
+    index = build(args.data_dir, args.out, args.sensor, args.network, args.flow_rate,
+                  args.workers, args.rehash, args.index)
+    print(f"{len(index['recordings'])} recordings -> {args.out} (version {index['version']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Score a directory tree of archived recordings offline.
+
+Walks `<archive>` for `.raw` (int32) and `.npy` recordings and scores every
+window with the backend's own pipeline (`backend/jobs.py`: model, front-end
+and cascade from `backend/models/`), without going through HTTP:
+
+- producer: a process pool computes the front-end features block by block;
+  each worker memory-maps its file and reads only the samples of its block,
+  and blocks go through the feature cache (`backend/feature_cache.py`), so
+  re-scoring the archive with a new model skips the transform;
+- consumer: the main process runs the cascade on whole blocks
+  (`--batch-windows` windows per CNN call) while the pool works ahead on the
+  next `2 x --workers` blocks.
+
+Per-window scores go to `windows-<n>.parquet` (or `.csv`) part files in the
+output directory, one row per window with the class probabilities, and
+`files.parquet` summarises every recording (mean-probability prediction and
+the alarms of the backend's HMM aggregation). `checkpoint.json` records each
+finished recording with the part holding its rows; an interrupted run picks
+up where it stopped and rescores only new or modified files (the rows of a
+modified file's earlier version stay in their part; the `part` column of
+`files` names the current one).
+
+Parquet needs pyarrow; without it, or with `--format csv`, CSV is written.
+
+Usage:
+    python bulk_score.py /data/archive --out scores/
+    python bulk_score.py /data/archive --out scores/ --workers 6 --threads 2 --batch-windows 64
+    python bulk_score.py /data/archive --out scores_csv/ --format csv --no-cache
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from aggregation import aggregate_recording  # noqa: E402
+from dsp import CHUNK_SEC, FS, window_spectrogram  # noqa: E402
+import feature_cache  # noqa: E402
+from inference import LEAK_TYPES, MODEL_NAME, artifact_sha256, find_artifact, load_model_info  # noqa: E402
+import jobs  # noqa: E402
+import resources  # noqa: E402
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+CHECKPOINT = "checkpoint.json"
+PART_WINDOWS = 200_000
+
+
+def discover(root, suffixes=jobs.INPUT_TYPES):
+    """Recordings below `root`, sorted."""
+    return sorted(p for p in Path(root).rglob("*") if p.suffix in suffixes and p.is_file())
+
+
+# ---------------- producer (worker processes) ----------------
+_worker = {}
+
+
+def _init_worker(frontend_config, cache_dir, cache_mb):
+    """One FFT and BLAS thread per worker; the pool provides the parallelism."""
+    import dsp
+    from frontends import get_frontend
+
+    dsp.FFT_WORKERS = 1
+    try:
+        from threadpoolctl import threadpool_limits
+        _worker["limits"] = threadpool_limits(limits=1)
+    except ImportError:
+        pass
+    _worker["frontend"] = get_frontend(frontend_config)
+    _worker["cache"] = feature_cache.FeatureCache(cache_dir, int(cache_mb * 2 ** 20)) if cache_mb > 0 else None
+
+
+def _block_features(path, w0, w1, K, stride):
+    audio = jobs.read_input(path)
+    return jobs.block_features(audio, w0, w1, _worker["frontend"], K, stride, _worker["cache"])
+
+
+# ---------------- output ----------------
+def write_table(columns, path, fmt):
+    """Write {name: array} atomically as Parquet or CSV."""
+    tmp = path.with_name(path.name + ".tmp")
+    if fmt == "parquet":
+        pq.write_table(pa.table({k: np.asarray(v) for k, v in columns.items()}), tmp)
+    else:
+        with open(tmp, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(columns)
+            w.writerows(zip(*(np.asarray(v).tolist() for v in columns.values())))
+    os.replace(tmp, path)
+
+
+def model_identity(models_dir):
+    """
+    The served model by content: its artifact's SHA-256 (from the sidecar's
+    export record when that is current, else hashed here) and that of its
+    input normalisation. A copy or `touch` keeps it; any new weights change it.
+    """
+    fmt, artifact = find_artifact(models_dir)
+    digest = (load_model_info(models_dir).get("export") or {}).get(fmt)
+    if fmt == "keras" or digest is None:
+        digest = artifact_sha256(artifact)
+    norm = models_dir / f"{MODEL_NAME}_norm.npz"
+    return {"model": artifact.name, "model_sha256": digest,
+            "norm_sha256": artifact_sha256(norm) if norm.exists() else None}
+
+
+def load_checkpoint(out_dir, identity, restart=False):
+    """
+    Checkpoint of a previous run into `out_dir`, or a new one.
+
+    Part files the checkpoint does not list (written by a run that stopped
+    before recording them) are deleted, so no window is written twice.
+    """
+    path = out_dir / CHECKPOINT
+    ckpt = {"identity": identity, "files": {}, "parts": []}
+    if path.exists() and not restart:
+        ckpt = json.loads(path.read_text())
+        if ckpt["identity"] != identity:
+            raise SystemExit(f"{path} was written with another model or front-end; "
+                             f"use a new --out or --restart")
+    for part in out_dir.glob("windows-*"):
+        if part.name not in ckpt["parts"]:
+            part.unlink()
+    return ckpt
+
+
+def save_checkpoint(out_dir, ckpt):
+    tmp = out_dir / (CHECKPOINT + ".tmp")
+    tmp.write_text(json.dumps(ckpt, indent=1))
+    os.replace(tmp, out_dir / CHECKPOINT)
+
+
+class Recording:
+    """Blocks of one recording, collected until its last block is scored."""
+
+    def __init__(self, path, rel, stat, total):
+        self.path = path
+        self.rel = rel
+        self.stat = stat
+        self.total = total
+        self.done = 0
+        self.probs = []
+        self.stages = []
+        self.failed = None
+
+    def summary(self, step_sec):
+        probs = np.concatenate(self.probs)
+        stage = np.concatenate(self.stages)
+        mean = probs.mean(axis=0)
+        best = int(np.argmax(mean))
+        agg = aggregate_recording(probs, np.arange(len(probs)) * step_sec, step_sec)
+        return {
+            "size": self.stat.st_size,
+            "mtime_ns": self.stat.st_mtime_ns,
+            "windows": len(probs),
+            "prediction": LEAK_TYPES[best],
+            "confidence": float(mean[best]),
+            "leakProbability": agg["leakProbability"],
+            "alarming": agg["alarming"],
+            "alarms": sum(e["type"] == "alarm_on" for e in agg["events"]),
+            "screened": int(np.sum(stage == 1)),
+        }
+
+
+def score_archive(root, out_dir, models_dir=jobs.MODELS_DIR, workers=None, batch_windows=64,
+                  fmt="parquet", part_windows=PART_WINDOWS, cache_mb=None, restart=False):
+    """
+    Score every recording below `root` that the checkpoint does not cover yet.
+
+    Args:
+        root: Archive directory
+        out_dir: Output directory (part files, files table, checkpoint)
+        models_dir: Model, front-end and screen to score with
+        workers: Feature processes
+        batch_windows: Windows per block, i.e. per cascade/CNN call
+        fmt: "parquet" or "csv"
+        part_windows: Rows per part file (finished recordings are flushed
+            together once this many windows are buffered)
+        cache_mb: Feature cache bound (default LEAK_FEATURE_CACHE_MB, 0 disables)
+        restart: Ignore an existing checkpoint
+
+    Returns:
+        Checkpoint dict
+    """
+    root, out_dir = Path(root), Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ext = "parquet" if fmt == "parquet" else "csv"
+    predictor, frontend, cascade = jobs.load_pipeline(Path(models_dir))
+    identity = {**model_identity(Path(models_dir)), "frontend": frontend.config,
+                "screen": cascade.enabled}
+    ckpt = load_checkpoint(out_dir, identity, restart)
+
+    K = frontend.frames_for_seconds(CHUNK_SEC)
+    stride = max(1, K // 2)
+    step_sec = stride * frontend.hop / FS
+
+    todo = []
+    for path in discover(root):
+        rel = str(path.relative_to(root))
+        st = path.stat()
+        prev = ckpt["files"].get(rel)
+        if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+            continue
+        try:
+            n = len(jobs.read_input(str(path)))
+        except (OSError, ValueError) as e:
+            print(f"{rel}: skipped ({e})")
+            continue
+        todo.append(Recording(str(path), rel, st, jobs.window_count(n, frontend, K, stride)))
+    print(f"{len(todo)} recording(s) to score, {len(ckpt['files'])} already in {out_dir}")
+
+    tasks = ((rec, w0, min(rec.total, w0 + batch_windows))
+             for rec in todo for w0 in range(0, rec.total, batch_windows))
+    pending, buffered = [], 0
+    scored = 0
+    t0 = time.time()
+
+    def flush():
+        nonlocal pending, buffered
+        if not pending:
+            return
+        part = f"windows-{len(ckpt['parts']):05d}.{ext}"
+        counts = [sum(len(p) for p in rec.probs) for rec in pending]
+        probs = np.concatenate([p for rec in pending for p in rec.probs])
+        window = np.concatenate([np.arange(n) for n in counts])
+        columns = {
+            "file": np.repeat([rec.rel for rec in pending], counts),
+            "window": window,
+            "start_sec": window * step_sec,
+            "stage": np.concatenate([s for rec in pending for s in rec.stages]),
+            **{name: probs[:, i] for i, name in enumerate(LEAK_TYPES)},
+        }
+        write_table(columns, out_dir / part, fmt)
+        ckpt["parts"].append(part)
+        for rec in pending:
+            ckpt["files"][rec.rel] = {**rec.summary(step_sec), "part": part}
+        save_checkpoint(out_dir, ckpt)
+        pending, buffered = [], 0
+
+    cache_dir = os.environ.get("LEAK_FEATURE_CACHE_DIR", feature_cache.DEFAULT_DIR)
+    if cache_mb is None:
+        cache_mb = float(os.environ.get("LEAK_FEATURE_CACHE_MB", "1024"))
+    workers = workers or max(1, (os.cpu_count() or 2) // 2)
+    try:
+        # spawn: TensorFlow does not survive fork() once initialised
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                 initializer=_init_worker,
+                                 initargs=(frontend.config, str(cache_dir), cache_mb)) as pool:
+            inflight = deque()
+
+            def refill():
+                for rec, w0, w1 in tasks:
+                    inflight.append((rec, w0, w1, pool.submit(_block_features, rec.path, w0, w1, K, stride)))
+                    if len(inflight) >= 2 * workers:
+                        break
+
+            refill()
+            while inflight:
+                rec, w0, w1, fut = inflight.popleft()
+                refill()
+                if rec.failed:
+                    continue
+                try:
+                    windows = window_spectrogram(fut.result(), K, stride)[:w1 - w0]
+                    probs, stage = cascade.predict(predictor, windows, batch_size=batch_windows)
+                except Exception as e:  # one unreadable file must not stop the archive
+                    rec.failed, rec.probs, rec.stages = str(e), [], []
+                    print(f"{rec.rel}: failed ({e})")
+                    continue
+                rec.probs.append(probs)
+                rec.stages.append(stage)
+                rec.done = w1
+                scored += len(probs)
+                if rec.done == rec.total:
+                    pending.append(rec)
+                    buffered += rec.total
+                    print(f"{rec.rel}: {rec.total} windows")
+                    if buffered >= part_windows:
+                        flush()
+    finally:
+        # keep whatever finished, also on Ctrl-C
+        flush()
+
+    elapsed = time.time() - t0
+    print(f"{scored} windows in {elapsed:.1f}s ({scored / max(elapsed, 1e-9):.1f} windows/s)")
+    files = ckpt["files"]
+    if files:
+        names = sorted(files)
+        keys = [k for k in files[names[0]]]
+        write_table({"file": names, **{k: [files[n][k] for n in names] for k in keys}},
+                    out_dir / f"files.{ext}", fmt)
+    return ckpt
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("archive", help="directory tree of .raw / .npy recordings")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--models", default=str(jobs.MODELS_DIR))
+    ap.add_argument("--workers", type=int, help="feature processes (default: half the CPUs)")
+    ap.add_argument("--threads", type=int, default=None,
+                    help="inference threads of the main process (default: the other half)")
+    ap.add_argument("--batch-windows", type=int, default=64)
+    ap.add_argument("--part-windows", type=int, default=PART_WINDOWS)
+    ap.add_argument("--format", choices=["parquet", "csv"], default="parquet" if pa is not None else "csv")
+    ap.add_argument("--no-cache", action="store_true", help="do not read or fill the feature cache")
+    ap.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = ap.parse_args()
+    if args.format == "parquet" and pa is None:
+        ap.error("Parquet output needs pyarrow; install it or use --format csv")
+
+    cpus = resources.available_cpus()
+    workers = args.workers or max(1, cpus // 2)
+    threads = args.threads or max(1, cpus - workers)
+    # NumPy and BLAS are loaded already, so `resources.apply` sizes this
+    # process's pools (from LEAK_THREADS); the OpenMP/BLAS variables are for
+    # the spawned feature workers, which read them before importing NumPy
+    os.environ.update({**resources.thread_env(1), "LEAK_THREADS": str(threads)})
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    resources.apply()
+
+    score_archive(args.archive, args.out, Path(args.models), workers, args.batch_windows, args.format,
+                  args.part_windows, 0 if args.no_cache else None, args.restart)
+
+
+if __name__ == "__main__":
+    main()
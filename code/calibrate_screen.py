@@ -0,0 +1,107 @@
+"""
+Fit and calibrate the stage-1 No-leak screen of the backend cascade.
+
+A logistic regression on band energies (`backend/dsp.band_energies`) is fitted
+on the train split of a feature store. Its rejection threshold is then chosen
+on the validation split as the lowest P(No-leak) at which at most
+`--max-missed-leaks` of the leak windows would be screened out, so the
+cascade's extra error is bounded by construction. The result is written to
+`backend/models/screen.npz`, which the backend picks up on startup.
+
+Usage:
+    python calibrate_screen.py --store features/
+    python calibrate_screen.py --store features/ --max-missed-leaks 0.001 --bands 24
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+import leak_training as lt
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from cascade import NO_LEAK, SCREEN_FILE, BandEnergyScreen  # noqa: E402
+from dsp import band_energies  # noqa: E402
+from frontends import get_frontend  # noqa: E402
+
+
+def store_band_energies(store_dir, split, n_bands, bs=64):
+    """
+    Band energies of one split, computed batch by batch from the memmap.
+
+    The store holds normalized windows; they are mapped back to raw
+    log-magnitudes, which is what the backend feeds the screen.
+    """
+    store_dir = Path(store_dir)
+    meta, arrays = lt.open_feature_store(store_dir)
+    fftshifted = get_frontend(meta.get("frontend")).fftshifted
+    mean = np.load(store_dir / "norm_mean.npy")
+    std = np.load(store_dir / "norm_std.npy")
+    X, y = arrays[f"{split}_X"], arrays[f"{split}_y"]
+    feats = np.zeros((len(X), n_bands), dtype=np.float32)
+    for b in range(0, len(X), bs):
+        feats[b:b + bs] = band_energies(np.asarray(X[b:b + bs]) * std + mean, n_bands, fftshifted)
+    return feats, y
+
+
+def choose_threshold(p_ok, is_leak, max_missed):
+    """Lowest threshold screening out at most `max_missed` of the leak windows."""
+    leak_p = np.sort(p_ok[is_leak])[::-1]
+    if len(leak_p) == 0:
+        return 0.5
+    allowed = int(np.floor(max_missed * len(leak_p)))
+    # a window is screened if p >= t; keep the (allowed+1)-th highest leak score below t
+    return float(np.nextafter(leak_p[allowed], np.inf)) if allowed < len(leak_p) else 0.0
+
+
+def report(name, screen, feats, y):
+    p_ok = screen.probability(feats)
+    screened = p_ok >= screen.threshold
+    is_leak = y != NO_LEAK
+    missed = np.sum(screened & is_leak) / max(np.sum(is_leak), 1)
+    print(f"{name:<5} stage-1 hit rate={screened.mean():.3f}  "
+          f"no-leak screened={screened[~is_leak].mean() if np.any(~is_leak) else 0:.3f}  "
+          f"leaks screened={missed:.4f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--store", required=True, help="feature store from `sweep.py prepare`")
+    ap.add_argument("--bands", type=int, default=16)
+    ap.add_argument("--max-missed-leaks", type=float, default=0.005,
+                    help="fraction of validation leak windows the screen may reject")
+    ap.add_argument("--out", default=str(BACKEND_DIR / "models" / SCREEN_FILE))
+    args = ap.parse_args()
+
+    from sklearn.linear_model import LogisticRegression
+
+    f_train, y_train = store_band_energies(args.store, "train", args.bands)
+    f_val, y_val = store_band_energies(args.store, "val", args.bands)
+    mean = f_train.mean(axis=0)
+    std = f_train.std(axis=0) + 1e-6
+
+    clf = LogisticRegression(class_weight="balanced", max_iter=1000)
+    clf.fit((f_train - mean) / std, (y_train == NO_LEAK).astype(int))
+
+    meta, _ = lt.open_feature_store(args.store)
+    fftshifted = get_frontend(meta.get("frontend")).fftshifted
+    screen = BandEnergyScreen(clf.coef_[0], clf.intercept_[0], mean, std, 1.0, args.bands, fftshifted)
+    screen.threshold = choose_threshold(screen.probability(f_val), y_val != NO_LEAK, args.max_missed_leaks)
+    print(f"threshold P(No-leak) >= {screen.threshold:.4f}")
+
+    report("train", screen, f_train, y_train)
+    report("val", screen, f_val, y_val)
+    f_test, y_test = store_band_energies(args.store, "test", args.bands)
+    if len(y_test):
+        report("test", screen, f_test, y_test)
+
+    screen.save(args.out)
+    print(f"saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Metadata index over the leak-simulation corpus.
+
+Every file under the dataset root is parsed once into sensor type, network
+type, leak class, flow rate, noise condition, hydrophone channel, sample
+count and duration, and stored in a SQLite table. Selections then become
+indexed queries instead of walks over the tree with string matching, and
+`build_dataset.py --index` takes its file list straight from a query.
+
+The layout is `<root>/<sensor>/<network>/<leak class>/<file>`, with file
+names such as `BR_CC_0.47 LPS_N_H1.raw` (network, class code, flow rate,
+N = background noise / NN = no noise, hydrophone channel).
+
+Usage:
+    python corpus_index.py build --data-dir "<...>/Dataset of Leak Simulations ..." --db corpus.db
+    python corpus_index.py query --db corpus.db --network Looped --flow-rate 0.18 --noise N
+    python corpus_index.py summary --db corpus.db
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+FS = 8000
+RAW_SAMPLE_BYTES = 4  # int32 hydrophone samples
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    sensor TEXT,
+    network TEXT,
+    leak_class TEXT,
+    flow_rate TEXT,
+    noise TEXT,
+    channel TEXT,
+    samples INTEGER,
+    duration_s REAL,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_selection ON files (sensor, network, flow_rate, noise, leak_class);
+"""
+
+FLOW_RATE = re.compile(r"(\d+(?:\.\d+)?)\s*LPS", re.IGNORECASE)
+CHANNEL = re.compile(r"^H\d+$", re.IGNORECASE)
+
+
+@contextmanager
+def connect(db_path):
+    """Index connection; commits on success and always closes."""
+    conn = sqlite3.connect(str(db_path))
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.executescript(SCHEMA)
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def parse_path(path, root):
+    """
+    Metadata of one corpus file from its location and name.
+
+    Args:
+        path: File path
+        root: Dataset root
+
+    Returns:
+        Dict of column values (None where a field cannot be parsed)
+    """
+    path = Path(path)
+    parts = path.relative_to(root).parts
+    tokens = path.stem.split("_")
+    flow = FLOW_RATE.search(path.name)
+    noise = "NN" if "NN" in tokens else ("N" if "N" in tokens else None)
+    channel = next((t.upper() for t in tokens if CHANNEL.match(t)), None)
+    st = path.stat()
+    samples = st.st_size // RAW_SAMPLE_BYTES if path.suffix.lower() == ".raw" else None
+    return {
+        "path": str(path),
+        "sensor": parts[0] if len(parts) > 1 else None,
+        "network": parts[1] if len(parts) > 2 else None,
+        "leak_class": parts[-2] if len(parts) > 3 else None,
+        "flow_rate": flow.group(1) if flow else None,
+        "noise": noise,
+        "channel": channel,
+        "samples": samples,
+        "duration_s": samples / FS if samples is not None else None,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+    }
+
+
+def _walk(root):
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file() and not entry.name.startswith("."):
+                    yield entry
+
+
+def build_index(data_dir, db_path):
+    """
+    Create or refresh the index. Unchanged files (size and mtime) are skipped.
+
+    Returns:
+        (files seen, files (re)parsed, rows removed)
+    """
+    root = Path(data_dir)
+    with connect(db_path) as conn:
+        known = {r["path"]: (r["size"], r["mtime_ns"]) for r in conn.execute(
+            "SELECT path, size, mtime_ns FROM files")}
+        seen, rows = set(), []
+        for entry in _walk(root):
+            seen.add(entry.path)
+            st = entry.stat()
+            if known.get(entry.path) == (st.st_size, st.st_mtime_ns):
+                continue
+            rows.append(parse_path(entry.path, root))
+        conn.executemany(
+            "INSERT OR REPLACE INTO files VALUES (:path, :sensor, :network, :leak_class, :flow_rate, "
+            ":noise, :channel, :samples, :duration_s, :size, :mtime_ns)", rows)
+        gone = [(p,) for p in known if p not in seen]
+        conn.executemany("DELETE FROM files WHERE path = ?", gone)
+    return len(seen), len(rows), len(gone)
+
+
+def select(db_path, sensor=None, network=None, flow_rate=None, noise=None, leak_class=None,
+           min_duration_s=None):
+    """
+    Files matching every given field, sorted by path.
+
+    Args:
+        db_path: Index database
+        sensor, network, flow_rate, noise: Exact matches (flow rate as in
+            the file name, e.g. "0.47")
+        leak_class: One class name or a list of them
+        min_duration_s: Drop shorter recordings
+
+    Returns:
+        List of Paths
+    """
+    where, args = [], []
+    for col, val in (("sensor", sensor), ("network", network), ("flow_rate", flow_rate), ("noise", noise)):
+        if val is not None:
+            where.append(f"{col} = ?")
+            args.append(val)
+    if leak_class is not None:
+        classes = [leak_class] if isinstance(leak_class, str) else list(leak_class)
+        where.append(f"leak_class IN ({', '.join('?' * len(classes))})")
+        args.extend(classes)
+    if min_duration_s is not None:
+        where.append("duration_s >= ?")
+        args.append(min_duration_s)
+    sql = "SELECT path FROM files"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    with connect(db_path) as conn:
+        return [Path(r["path"]) for r in conn.execute(sql + " ORDER BY path", args)]
+
+
+def summary(db_path):
+    """Recording counts and hours per sensor/network/flow rate/noise/class."""
+    with connect(db_path) as conn:
+        return [dict(r) for r in conn.execute(
+            "SELECT sensor, network, flow_rate, noise, leak_class, COUNT(*) AS files, "
+            "ROUND(SUM(duration_s) / 3600.0, 3) AS hours FROM files "
+            "GROUP BY sensor, network, flow_rate, noise, leak_class ORDER BY 1, 2, 3, 4, 5")]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("build", help="create or refresh the index")
+    p.add_argument("--data-dir", required=True)
+    p.add_argument("--db", required=True)
+
+    p = sub.add_parser("query", help="print matching file paths")
+    p.add_argument("--db", required=True)
+    p.add_argument("--sensor")
+    p.add_argument("--network")
+    p.add_argument("--flow-rate")
+    p.add_argument("--noise", choices=["N", "NN"])
+    p.add_argument("--leak-class", nargs="+")
+    p.add_argument("--min-duration", type=float)
+
+    p = sub.add_parser("summary", help="counts per selection field")
+    p.add_argument("--db", required=True)
+
+    args = ap.parse_args()
+    if args.cmd == "build":
+        seen, parsed, removed = build_index(args.data_dir, args.db)
+        print(f"{seen} files, {parsed} parsed, {removed} removed -> {args.db}")
+    elif args.cmd == "query":
+        for path in select(args.db, args.sensor, args.network, args.flow_rate, args.noise,
+                           args.leak_class, args.min_duration):
+            print(path)
+    else:
+        for r in summary(args.db):
+            print(f"{r['sensor']}/{r['network']} {r['flow_rate']} {r['noise']} "
+                  f"{r['leak_class']}: {r['files']} files, {r['hours']} h")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Knowledge distillation of the leak CNN into a gateway-sized student.
+
+The teacher is a trained `hydrophone_leak_cnn_4.py` model (.h5). The student
+is a `model_zoo` tier, by default `tiny` (the compact AveragePooling2D((4,1))
+network of `hydrophone_leak_cnn.py`, pooled in time as well). It is trained on
+a mix of the hard labels and the teacher's temperature-softened predictions,
+then exported as a quantised TFLite flatbuffer that `backend/inference.py`
+serves directly. A JSON report puts size, FLOPs, latency and test accuracy of
+teacher and student side by side.
+
+Usage:
+    python distill.py --teacher ../backend/models/leak_detector.h5 --store features/
+    python distill.py --teacher t.h5 --store features/ --student fast --quantize int8 --out gateway/
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+import export_model
+import leak_training as lt
+import model_zoo as zoo
+
+sys.path.insert(0, str(export_model.BACKEND_DIR))
+
+from inference import MODEL_NAME, KerasPredictor, TFLitePredictor, artifact_sha256  # noqa: E402
+
+
+def soften(probs, temperature):
+    """Temperature-scaled softmax of probability outputs (via their logs)."""
+    import tensorflow as tf
+
+    logits = tf.math.log(tf.clip_by_value(probs, 1e-7, 1.0))
+    return tf.nn.softmax(logits / temperature, axis=-1)
+
+
+def distill(teacher, student, arrays, epochs=200, temperature=4.0, alpha=0.3,
+            lr=1e-3, bs=16, patience=20, seed=0):
+    """
+    Train `student` against `teacher` with the Hinton et al. objective.
+
+    loss = alpha * CE(y, student) + (1 - alpha) * T^2 * KL(teacher_T || student_T)
+
+    Args:
+        teacher: Trained Keras model (frozen)
+        student: Keras model to train in place
+        arrays: Feature store arrays from `leak_training.open_feature_store`
+        epochs: Maximum epochs
+        temperature: Softening temperature T
+        alpha: Weight of the hard-label term
+        lr: Adam learning rate
+        bs: Batch size
+        patience: Early stopping patience on validation loss
+
+    Returns:
+        History dict with per-epoch train and validation loss
+    """
+    import tensorflow as tf
+
+    ce = tf.keras.losses.SparseCategoricalCrossentropy()
+    kl = tf.keras.losses.KLDivergence()
+    opt = tf.keras.optimizers.Adam(lr)
+    weights = lt.class_weights(arrays["train_y"])
+    cw = tf.constant([weights[i] for i in range(len(weights))], tf.float32)
+
+    @tf.function
+    def train_step(x, y):
+        soft_t = soften(teacher(x, training=False), temperature)
+        with tf.GradientTape() as tape:
+            p_s = student(x, training=True)
+            hard = ce(y, p_s, sample_weight=tf.gather(cw, y))
+            soft = kl(soft_t, soften(p_s, temperature)) * temperature ** 2
+            loss = alpha * hard + (1.0 - alpha) * soft
+        grads = tape.gradient(loss, student.trainable_variables)
+        opt.apply_gradients(zip(grads, student.trainable_variables))
+        return loss
+
+    @tf.function
+    def val_step(x, y):
+        return ce(y, student(x, training=False))
+
+    history = {"loss": [], "val_loss": []}
+    best, best_weights, wait = np.inf, student.get_weights(), 0
+    for epoch in range(epochs):
+        ds = lt.make_ds(arrays["train_X"], arrays["train_y"], train=True, bs=bs, seed=seed + epoch)
+        losses = [float(train_step(x, y)) for x, y in ds]
+        val = [float(val_step(x, y)) for x, y in lt.make_ds(arrays["val_X"], arrays["val_y"],
+                                                             train=False, bs=32)]
+        history["loss"].append(float(np.mean(losses)))
+        history["val_loss"].append(float(np.mean(val)) if val else float("nan"))
+        print(f"epoch {epoch + 1}: loss={history['loss'][-1]:.4f} val_loss={history['val_loss'][-1]:.4f}")
+        if history["val_loss"][-1] < best:
+            best, best_weights, wait = history["val_loss"][-1], student.get_weights(), 0
+        else:
+            wait += 1
+            if wait >= patience:
+                break
+    student.set_weights(best_weights)
+    return history
+
+
+def accuracy(predict_fn, X, y, bs=32):
+    """Test accuracy streamed over a (memory-mapped) array."""
+    if len(y) == 0:
+        return None
+    correct = 0
+    for b in range(0, len(y), bs):
+        probs = predict_fn(np.asarray(X[b:b + bs], dtype=np.float32))
+        correct += int(np.sum(probs.argmax(axis=1) == y[b:b + bs]))
+    return correct / len(y)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--teacher", required=True, help="trained teacher .h5")
+    ap.add_argument("--store", required=True, help="feature store from `sweep.py prepare`")
+    ap.add_argument("--student", choices=zoo.TIERS, default="tiny")
+    ap.add_argument("--epochs", type=int, default=200)
+    ap.add_argument("--temperature", type=float, default=4.0)
+    ap.add_argument("--alpha", type=float, default=0.3, help="weight of the hard-label loss")
+    ap.add_argument("--quantize", choices=export_model.QUANTIZE_MODES, default="int8")
+    ap.add_argument("--out", default="distilled", help="output directory")
+    args = ap.parse_args()
+
+    import tensorflow as tf
+
+    meta, arrays = lt.open_feature_store(args.store)
+    shape = meta["shape"]
+    input_shape = (shape["F"], shape["K"], shape["S"])
+
+    teacher = tf.keras.models.load_model(args.teacher, compile=False)
+    teacher.trainable = False
+    student = zoo.build_model(args.student, input_shape, len(lt.CLASS_NAMES))
+    history = distill(teacher, student, arrays, args.epochs, args.temperature, args.alpha)
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    student_h5 = out / f"{MODEL_NAME}_student.h5"
+    student.save(str(student_h5))
+
+    # quantised flatbuffer in the name the backend loads
+    folded = zoo.fold_batchnorm(student)
+    sm_dir = export_model.save_savedmodel(folded, Path(tempfile.mkdtemp()) / "savedmodel")
+    calib = np.asarray(arrays["train_X"][:min(64, len(arrays["train_X"]))], dtype=np.float32)
+    tfl = export_model.convert_tflite(sm_dir, out / f"{MODEL_NAME}.tflite",
+                                      export_model.quantizer(args.quantize, calib))
+
+    X_test, y_test = arrays["test_X"], arrays["test_y"]
+    one = np.asarray(X_test[:1] if len(X_test) else np.zeros((1,) + input_shape), dtype=np.float32)
+    teacher_p = KerasPredictor(teacher)
+    student_p = TFLitePredictor(tfl)
+    teacher_flops = zoo.count_flops(teacher)
+    student_flops = zoo.count_flops(student)
+    report = {
+        "teacher": {
+            "path": args.teacher,
+            "params": int(teacher.count_params()),
+            "size_mb": Path(args.teacher).stat().st_size / 1e6,
+            "mflops": teacher_flops / 1e6,
+            "latency_ms": lt.measure_latency(teacher_p.predict, one)["median_ms"],
+            "test_acc": accuracy(teacher_p.predict, X_test, y_test),
+        },
+        "student": {
+            "tier": args.student,
+            "path": str(tfl),
+            "quantize": args.quantize,
+            "params": int(student.count_params()),
+            "size_mb": tfl.stat().st_size / 1e6,
+            "mflops": student_flops / 1e6,
+            "latency_ms": lt.measure_latency(student_p.predict, one)["median_ms"],
+            "test_acc": accuracy(student_p.predict, X_test, y_test),
+        },
+        "distillation": {"temperature": args.temperature, "alpha": args.alpha,
+                         "epochs": len(history["loss"]), "history": history},
+    }
+    t, s = report["teacher"], report["student"]
+    report["flops_reduction"] = teacher_flops / max(student_flops, 1)
+    report["speedup"] = t["latency_ms"] / s["latency_ms"]
+    if t["test_acc"] is not None:
+        report["accuracy_drop"] = t["test_acc"] - s["test_acc"]
+    (out / "distill_report.json").write_text(json.dumps(report, indent=2))
+    # sidecar so the backend builds the same front-end for the student
+    sidecar = {"dataset_version": meta.get("dataset_version"), "frontend": meta.get("frontend"),
+               "export": {"source_sha256": None, "quantize": args.quantize,
+                          "tflite": artifact_sha256(tfl)}}
+    (out / f"{MODEL_NAME}.json").write_text(json.dumps(sidecar, indent=2))
+    # the student was trained on the store's z-scored features
+    np.savez(out / f"{MODEL_NAME}_norm.npz", mean=np.load(Path(args.store) / "norm_mean.npy"),
+             std=np.load(Path(args.store) / "norm_std.npy"))
+
+    print(f"\n{'':<9}{'params':>9}{'MB':>8}{'MFLOPs':>10}{'ms':>8}{'acc':>7}")
+    for name, r in (("teacher", t), ("student", s)):
+        acc = f"{r['test_acc']:.3f}" if r["test_acc"] is not None else "-"
+        print(f"{name:<9}{r['params']:>9}{r['size_mb']:>8.2f}{r['mflops']:>10.1f}{r['latency_ms']:>8.2f}{acc:>7}")
+    print(f"\n{report['flops_reduction']:.1f}x fewer FLOPs, {report['speedup']:.1f}x faster; "
+          f"report: {out / 'distill_report.json'}")
+
+
+if __name__ == "__main__":
+    main()
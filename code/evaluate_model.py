@@ -0,0 +1,375 @@
+"""
+Evaluate saved models on held-out data, with accuracy and latency side by side.
+
+The training scripts end with `classification_report`, a confusion matrix and
+a blocking `plt.show()`; this tool evaluates any saved model instead and
+writes the results headlessly as JSON and HTML. A model is a models
+directory (`backend/models/`, an export or distillation output; the artifact
+is picked like the backend picks it) or a single `.h5`/`.tflite` file such as
+a sweep trial. Several models are evaluated on the same test windows.
+
+The test set is either
+
+- the `test` split of a feature store (`sweep.py prepare`), read from its
+  memmap, or
+- a sharded dataset (`build_dataset.py`): each recording is split with the
+  blocked time split of `hydrophone_leak_cnn_4.py` (left 20 % validation,
+  right 20 % test, `--gap` frames dropped around each boundary, default one
+  window) and the test windows go through the model's front-end. The
+  features of each recording's test windows are kept in the feature cache
+  (`backend/feature_cache.py`) under the recording's content key, so the
+  next evaluation reads them memory-mapped.
+
+Either way the models get what the backend feeds them: raw front-end
+features, which a model loaded with its `_norm.npz` normalises itself
+(`inference.NormalizedPredictor`). Store windows are mapped back to raw
+features with the store's statistics. The report records the convention
+and, per model, whether it applies a normalisation.
+
+Metrics are accumulated batch by batch (confusion matrix, log loss, Brier
+score, calibration bins), so the test set is never in memory at once. From
+them: accuracy, balanced accuracy, per-class and macro F1, leak recall and
+false-alarm rate (any leak vs No-leak) and the expected calibration error.
+Latency is the median/p90 of `predict` at each of `--batch-sizes`.
+
+Usage:
+    python evaluate_model.py --store features/ --models ../backend/models
+    python evaluate_model.py --dataset dataset/ --models ../backend/models sweeps/trial_7.h5 --out eval/
+    python evaluate_model.py --store features/ --models ../backend/models --batch-sizes 1 8 32 --threads 2
+"""
+
+import argparse
+import html
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import leak_training as lt
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import feature_cache  # noqa: E402
+from feature_cache import cache_key  # noqa: E402
+from frontends import get_frontend  # noqa: E402
+from inference import (MODEL_NAME, KerasPredictor, NormalizedPredictor, TFLitePredictor,  # noqa: E402
+                       find_artifact, load_model_info, load_predictor, with_normalization)
+import resources  # noqa: E402
+
+NO_LEAK = lt.CLASS_NAMES.index("No-leak")
+ECE_BINS = 15
+EPS = 1e-7
+
+
+class StreamingMetrics:
+    """Classification metrics accumulated over batches in O(classes^2 + bins) memory."""
+
+    def __init__(self, num_classes=len(lt.CLASS_NAMES), bins=ECE_BINS):
+        self.num_classes = num_classes
+        self.bins = bins
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.log_loss = 0.0
+        self.brier = 0.0
+        self.bin_count = np.zeros(bins, dtype=np.int64)
+        self.bin_conf = np.zeros(bins)
+        self.bin_correct = np.zeros(bins)
+
+    def update(self, probs, y):
+        probs = np.asarray(probs, dtype=np.float64)
+        y = np.asarray(y, dtype=np.int64)
+        pred = probs.argmax(axis=1)
+        C = self.num_classes
+        self.confusion += np.bincount(y * C + pred, minlength=C * C).reshape(C, C)
+        p_true = probs[np.arange(len(y)), y]
+        self.log_loss += float(-np.log(np.clip(p_true, EPS, 1.0)).sum())
+        onehot = np.eye(C)[y]
+        self.brier += float(((probs - onehot) ** 2).sum())
+        conf = probs.max(axis=1)
+        b = np.minimum((conf * self.bins).astype(np.int64), self.bins - 1)
+        self.bin_count += np.bincount(b, minlength=self.bins)
+        self.bin_conf += np.bincount(b, weights=conf, minlength=self.bins)
+        self.bin_correct += np.bincount(b, weights=(pred == y), minlength=self.bins)
+
+    def result(self):
+        cm = self.confusion
+        n = int(cm.sum())
+        tp = np.diag(cm).astype(np.float64)
+        support = cm.sum(axis=1)
+        predicted = cm.sum(axis=0)
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros_like(tp),
+                       where=(precision + recall) > 0)
+        present = support > 0
+        leak = np.arange(self.num_classes) != NO_LEAK
+        leaks = cm[leak].sum()
+        no_leaks = cm[NO_LEAK].sum()
+        ece = float(np.abs(self.bin_correct - self.bin_conf).sum() / max(n, 1))
+        return {
+            "windows": n,
+            "accuracy": float(tp.sum() / max(n, 1)),
+            "balancedAccuracy": float(recall[present].mean()) if present.any() else 0.0,
+            "macroF1": float(f1[present].mean()) if present.any() else 0.0,
+            "leakRecall": float(cm[leak][:, leak].sum() / leaks) if leaks else None,
+            "falseAlarmRate": float(cm[NO_LEAK, leak].sum() / no_leaks) if no_leaks else None,
+            "logLoss": self.log_loss / max(n, 1),
+            "brier": self.brier / max(n, 1),
+            "ece": ece,
+            "perClass": {name: {"precision": float(precision[i]), "recall": float(recall[i]),
+                                "f1": float(f1[i]), "support": int(support[i])}
+                         for i, name in enumerate(lt.CLASS_NAMES)},
+            "confusion": cm.tolist(),
+        }
+
+
+# ---------------- models ----------------
+def load_model(spec, threads=None):
+    """
+    Predictor and metadata for a models directory or a single model file.
+
+    Returns:
+        (predictor, info) where info holds the artifact path, format,
+        front-end config and dataset version
+    """
+    path = Path(spec)
+    if path.is_dir() and find_artifact(path) is not None:
+        predictor, artifact = load_predictor(path, num_threads=threads)
+        meta = load_model_info(path)
+    elif path.suffix == ".tflite":
+        predictor, artifact, meta = TFLitePredictor(path, threads), path, {}
+    elif path.suffix in (".h5", ".keras"):
+        predictor, artifact, meta = KerasPredictor.from_path(path), path, {}
+    else:
+        raise FileNotFoundError(f"No {MODEL_NAME} artifact in {path} and not a .h5/.tflite file")
+    if not path.is_dir():
+        # e.g. a sweep trial with its trial_<id>_norm.npz
+        predictor = with_normalization(predictor, artifact.parent, artifact.stem)
+    if not meta:
+        meta = load_model_info(artifact.parent, artifact.stem)
+    frontend = get_frontend(meta.get("frontend")).config
+    return predictor, {"model": str(spec), "artifact": str(artifact), "format": predictor.format,
+                       "frontend": frontend, "dataset_version": meta.get("dataset_version"),
+                       "normalization": isinstance(predictor, NormalizedPredictor)}
+
+
+# ---------------- test sets ----------------
+class _Raw:
+    """Normalised store windows mapped back to raw features, slice by slice."""
+
+    def __init__(self, X, mean, std):
+        self.X, self.mean, self.std = X, mean, std
+
+    def __len__(self):
+        return len(self.X)
+
+    def __getitem__(self, sl):
+        return np.asarray(self.X[sl]) * self.std + self.mean
+
+
+def store_test_set(store_dir):
+    """
+    Test split of a feature store, memory-mapped, as raw features.
+
+    Returns:
+        (list of (X, y) parts, description)
+    """
+    store_dir = Path(store_dir)
+    meta, arrays = lt.open_feature_store(store_dir)
+    X = _Raw(arrays["test_X"], np.load(store_dir / "norm_mean.npy"), np.load(store_dir / "norm_std.npy"))
+    desc = {"source": "store", "path": str(store_dir), "frontend": meta.get("frontend"),
+            "dataset_version": meta.get("dataset_version"), "inputs": "raw"}
+    return [(X, arrays["test_y"])], desc
+
+
+def dataset_test_set(dataset_dir, frontend_config, gap=None, chunk_sec=lt.CHUNK_SEC, cache=None):
+    """
+    Test windows of every recording of a sharded dataset, for one front-end.
+
+    Raw features, as the backend computes them.
+    With a cache, each recording's test features are stored under its
+    content key (from `index.json`) and read back memory-mapped.
+
+    Returns:
+        (list of (X, y) parts, one per recording, description)
+    """
+    dataset_dir = Path(dataset_dir)
+    index = json.loads((dataset_dir / "index.json").read_text())
+    fe = get_frontend(frontend_config)
+    r = fe.frame_ratio
+    K = max(1, fe.frames_for_seconds(chunk_sec))
+    stride = max(1, K // 2)
+    gap = K if gap is None else gap
+
+    parts = []
+    for rec in index["recordings"]:
+        key = cache_key(rec.get("key") or rec["id"], fe.config, f"test:{chunk_sec}:{gap}")
+        cached = cache.get(key) if cache and rec.get("key") else None
+        if cached is not None:
+            X = cached[0]
+        else:
+            stft = np.load(dataset_dir / rec["shard"], mmap_mode="r")
+            starts = lt.split_windows((stft.shape[1] - 1) // r + 1, K, stride, gap)["test"]
+            X = np.zeros((len(starts), fe.n_features, K, stft.shape[2]), dtype=np.float32)
+            for i, t0 in enumerate(starts):
+                X[i] = fe.features(stft[:, t0 * r:(t0 + K - 1) * r + 1:r, :])
+            if cache and rec.get("key"):
+                cache.put(key, X)
+        parts.append((X, np.full(len(X), int(rec["label_id"]) - 1, dtype=np.int64)))
+    desc = {"source": "dataset", "path": str(dataset_dir), "frontend": fe.config,
+            "dataset_version": index.get("version"), "inputs": "raw", "gapFrames": gap}
+    return parts, desc
+
+
+# ---------------- evaluation ----------------
+def evaluate(predictor, parts, batch_size=64):
+    """Streaming metrics of `predictor` over the test parts."""
+    metrics = StreamingMetrics()
+    t0 = time.perf_counter()
+    for X, y in parts:
+        for b in range(0, len(X), batch_size):
+            metrics.update(predictor.predict(np.asarray(X[b:b + batch_size], dtype=np.float32)),
+                           y[b:b + batch_size])
+    result = metrics.result()
+    result["eval_time_s"] = time.perf_counter() - t0
+    return result
+
+
+def latency_profile(predictor, sample, batch_sizes=(1, 8, 32, 64), runs=20):
+    """Latency of `predict` at each batch size, on real test windows."""
+    out = {}
+    for bs in batch_sizes:
+        x = np.ascontiguousarray(np.resize(sample, (bs,) + sample.shape[1:]), dtype=np.float32)
+        lat = lt.measure_latency(predictor.predict, x, runs=runs)
+        out[bs] = {**lat, "per_window_ms": lat["median_ms"] / bs,
+                   "windows_per_s": 1000.0 * bs / lat["median_ms"]}
+    return out
+
+
+# ---------------- reports ----------------
+def _fmt(v, digits=3):
+    return "-" if v is None else f"{v:.{digits}f}"
+
+
+def render_html(report):
+    """Self-contained HTML report: summary table, then per-model details."""
+    batch_sizes = sorted({int(bs) for m in report["models"] for bs in m["latency"]})
+    rows = []
+    for m in report["models"]:
+        r, lat = m["metrics"], m["latency"]
+        cells = [html.escape(m["model"]), m["format"], _fmt(r["accuracy"]), _fmt(r["balancedAccuracy"]),
+                 _fmt(r["macroF1"]), _fmt(r["leakRecall"]), _fmt(r["falseAlarmRate"]),
+                 _fmt(r["logLoss"]), _fmt(r["ece"])]
+        cells += [_fmt(lat[bs]["median_ms"], 2) if bs in lat else "-" for bs in batch_sizes]
+        rows.append("<tr>" + "".join(f"<td>{c}</td>" for c in cells) + "</tr>")
+    head = ["model", "format", "accuracy", "balanced acc", "macro F1", "leak recall", "false alarms",
+            "log loss", "ECE"] + [f"b{bs} ms" for bs in batch_sizes]
+
+    details = []
+    for m in report["models"]:
+        r = m["metrics"]
+        cm = np.asarray(r["confusion"])
+        norm = cm / np.maximum(cm.sum(axis=1, keepdims=True), 1)
+        cm_rows = "".join(
+            f"<tr><th>{html.escape(name)}</th>" + "".join(
+                f'<td style="background: rgba(31,119,180,{norm[i, j]:.2f})">{cm[i, j]}</td>'
+                for j in range(len(cm))) + "</tr>"
+            for i, name in enumerate(lt.CLASS_NAMES))
+        per_class = "".join(
+            f"<tr><th>{html.escape(name)}</th><td>{_fmt(c['precision'])}</td><td>{_fmt(c['recall'])}</td>"
+            f"<td>{_fmt(c['f1'])}</td><td>{c['support']}</td></tr>"
+            for name, c in r["perClass"].items())
+        lat_rows = "".join(
+            f"<tr><td>{bs}</td><td>{_fmt(v['median_ms'], 2)}</td><td>{_fmt(v['p90_ms'], 2)}</td>"
+            f"<td>{_fmt(v['per_window_ms'], 2)}</td><td>{_fmt(v['windows_per_s'], 1)}</td></tr>"
+            for bs, v in sorted(m["latency"].items()))
+        details.append(f"""
+<h2>{html.escape(m['model'])}</h2>
+<p>{html.escape(m['artifact'])} ({m['format']}), front-end {html.escape(json.dumps(m['frontend']))},
+dataset {html.escape(str(m['dataset_version']))}</p>
+<h3>Confusion matrix (rows: true, columns: predicted)</h3>
+<table><tr><th></th>{''.join(f'<th>{html.escape(n)}</th>' for n in lt.CLASS_NAMES)}</tr>{cm_rows}</table>
+<h3>Per class</h3>
+<table><tr><th></th><th>precision</th><th>recall</th><th>F1</th><th>support</th></tr>{per_class}</table>
+<h3>Latency</h3>
+<table><tr><th>batch</th><th>median ms</th><th>p90 ms</th><th>ms / window</th><th>windows / s</th></tr>{lat_rows}</table>""")
+
+    test = report["testSet"]
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Model evaluation</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 1em; }}
+td, th {{ border: 1px solid #ccc; padding: 4px 8px; text-align: right; }}
+</style></head><body>
+<h1>Model evaluation</h1>
+<p>Test set: {html.escape(test['source'])} {html.escape(test['path'])}, {test['windows']} windows,
+dataset {html.escape(str(test.get('dataset_version')))}; generated {html.escape(report['generated'])}</p>
+<table><tr>{''.join(f'<th>{h}</th>' for h in head)}</tr>{''.join(rows)}</table>
+{''.join(details)}
+</body></html>
+"""
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--store", help="feature store from `sweep.py prepare` (its test split)")
+    src.add_argument("--dataset", help="sharded dataset from `build_dataset.py`")
+    ap.add_argument("--models", nargs="+", default=[str(BACKEND_DIR / "models")],
+                    help="models directories or .h5/.tflite files")
+    ap.add_argument("--gap", type=int, help="safety gap in frames for --dataset (default: one window)")
+    ap.add_argument("--batch-size", type=int, default=64, help="batch size of the accuracy pass")
+    ap.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64],
+                    help="batch sizes to time")
+    ap.add_argument("--runs", type=int, default=20, help="timed calls per batch size")
+    ap.add_argument("--threads", type=int, help="inference threads (default: LEAK_THREADS or all CPUs)")
+    ap.add_argument("--no-cache", action="store_true", help="do not read or fill the feature cache")
+    ap.add_argument("--out", default="evaluation", help="directory for report.json and report.html")
+    args = ap.parse_args()
+
+    if args.threads:
+        os.environ.update(resources.thread_env(args.threads))
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    threads = resources.apply()["tf_intra_op"]
+    cache = None if args.no_cache else feature_cache.from_env()
+
+    results = []
+    test_sets = {}
+    for spec in args.models:
+        predictor, info = load_model(spec, threads)
+        key = json.dumps(info["frontend"], sort_keys=True)
+        if key not in test_sets:
+            test_sets[key] = (store_test_set(args.store) if args.store else
+                              dataset_test_set(args.dataset, info["frontend"], args.gap, cache=cache))
+        parts, desc = test_sets[key]
+        if desc["frontend"] is not None and get_frontend(desc["frontend"]).config != info["frontend"]:
+            raise SystemExit(f"{spec} uses front-end {info['frontend']}, the store {desc['frontend']}; "
+                             f"evaluate it on a store with its front-end or with --dataset")
+        if not any(len(X) for X, _ in parts):
+            raise SystemExit("The test set is empty")
+
+        metrics = evaluate(predictor, parts, args.batch_size)
+        sample = next(np.asarray(X[:max(args.batch_sizes)]) for X, _ in parts if len(X))
+        latency = latency_profile(predictor, sample, args.batch_sizes, args.runs)
+        results.append({**info, "metrics": metrics, "latency": latency})
+        print(f"{spec}: acc={metrics['accuracy']:.3f} macroF1={metrics['macroF1']:.3f} "
+              f"leak recall={_fmt(metrics['leakRecall'])} false alarms={_fmt(metrics['falseAlarmRate'])} "
+              f"ECE={metrics['ece']:.3f} b1={latency[min(latency)]['median_ms']:.2f}ms "
+              f"({metrics['windows']} windows)")
+
+    desc = dict(desc, windows=results[0]["metrics"]["windows"])
+    report = {"generated": time.strftime("%Y-%m-%d %H:%M:%S"), "testSet": desc,
+              "threads": threads, "models": results}
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    (out / "report.json").write_text(json.dumps(report, indent=2))
+    (out / "report.html").write_text(render_html(report))
+    print(f"wrote {out / 'report.json'} and {out / 'report.html'}")
+
+
+if __name__ == "__main__":
+    main()
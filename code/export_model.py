@@ -0,0 +1,195 @@
+"""
+Export a trained Keras model as an optimised inference graph.
+
+BatchNormalization layers are folded into the preceding convolutions and
+Dropout is stripped (`model_zoo.fold_batchnorm`), then the folded model is
+written as a SavedModel with a fixed serving signature and/or a TFLite
+flatbuffer under the names `backend/inference.py` looks for. The export is
+checked for numerical equivalence against the source `.h5` and the latency of
+both is reported side by side. An export that passes the check is recorded,
+with the hashes of the artifacts and of the source `.h5`, under `"export"` in
+the `<name>.json` sidecar; the backend only serves exports recorded there.
+
+Usage:
+    python export_model.py ../backend/models/leak_detector.h5
+    python export_model.py model.h5 --format tflite --out ../backend/models --samples test_X.npy
+"""
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+import leak_training as lt
+import model_zoo as zoo
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from inference import (MODEL_NAME, KerasPredictor, SavedModelPredictor, TFLitePredictor,  # noqa: E402
+                       artifact_sha256, load_model_info)
+
+ATOL = 1e-4
+QUANTIZE_MODES = ("none", "float16", "dynamic", "int8")
+
+
+def save_savedmodel(model, path):
+    """SavedModel with a `serving_default` signature over a float32 batch."""
+    import tensorflow as tf
+
+    path = Path(path)
+    if path.exists():
+        shutil.rmtree(path)
+    if hasattr(model, "export"):
+        model.export(str(path), format="tf_saved_model", verbose=False)
+        return path
+    spec = tf.TensorSpec((None,) + tuple(model.input.shape[1:]), tf.float32, name="inputs")
+    fn = tf.function(lambda x: {"output_0": model(x, training=False)}, input_signature=[spec])
+    tf.saved_model.save(model, str(path), signatures={"serving_default": fn})
+    return path
+
+
+def convert_tflite(savedmodel_dir, path, optimize=None):
+    """
+    Convert an exported SavedModel to a TFLite flatbuffer.
+
+    Args:
+        savedmodel_dir: SavedModel directory
+        path: Output .tflite path
+        optimize: Optional callable(converter) to set quantisation options
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(str(savedmodel_dir))
+    if optimize is not None:
+        optimize(converter)
+    Path(path).write_bytes(converter.convert())
+    return Path(path)
+
+
+def quantizer(mode, representative=None):
+    """
+    Converter options for a TFLite quantisation mode.
+
+    Args:
+        mode: "none", "float16" (fp16 weights), "dynamic" (int8 weights) or
+            "int8" (int8 weights and activations, float I/O)
+        representative: Array of sample inputs, required for "int8"
+
+    Returns:
+        Callable(converter) or None
+    """
+    import tensorflow as tf
+
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"Unknown quantisation mode {mode!r}, expected one of {QUANTIZE_MODES}")
+    if mode == "none":
+        return None
+    if mode == "int8" and representative is None:
+        raise ValueError("int8 quantisation needs representative inputs")
+
+    def apply(converter):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if mode == "float16":
+            converter.target_spec.supported_types = [tf.float16]
+        elif mode == "int8":
+            def gen():
+                for x in representative:
+                    yield [np.asarray(x, dtype=np.float32)[np.newaxis]]
+            converter.representative_dataset = gen
+
+    return apply
+
+
+def check_equivalence(reference, predictor, inputs, atol=ATOL):
+    """
+    Compare a reference Keras model with an exported predictor.
+
+    Returns:
+        Dict with the max absolute probability difference and argmax agreement
+    """
+    ref = np.asarray(reference(inputs, training=False))
+    got = predictor.predict(inputs)
+    diff = float(np.max(np.abs(ref - got)))
+    agree = float(np.mean(ref.argmax(axis=1) == got.argmax(axis=1)))
+    return {"max_abs_diff": diff, "argmax_agreement": agree, "ok": diff <= atol and agree == 1.0}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("model", help="trained Keras .h5")
+    ap.add_argument("--out", default=str(BACKEND_DIR / "models"))
+    ap.add_argument("--name", default=MODEL_NAME)
+    ap.add_argument("--format", choices=["savedmodel", "tflite", "both"], default="both")
+    ap.add_argument("--quantize", choices=QUANTIZE_MODES, default="none",
+                    help="TFLite quantisation; the equivalence check then uses --quant-atol")
+    ap.add_argument("--samples", help=".npy of model inputs (N, F, K, S) for the equivalence check"
+                                      " and int8 calibration")
+    ap.add_argument("--quant-atol", type=float, default=0.05)
+    ap.add_argument("--atol", type=float, default=ATOL)
+    args = ap.parse_args()
+
+    import tensorflow as tf
+
+    source = tf.keras.models.load_model(args.model, compile=False)
+    try:
+        folded = zoo.fold_batchnorm(source)
+    except ValueError as e:
+        print(f"warning: {e}; exporting without BN folding")
+        folded = source
+    print(f"layers: {len(source.layers)} -> {len(folded.layers)}")
+
+    input_shape = tuple(source.input.shape[1:])
+    if args.samples:
+        inputs = np.load(args.samples, mmap_mode="r")[:16].astype(np.float32)
+    else:
+        inputs = np.random.RandomState(0).randn(8, *input_shape).astype(np.float32)
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    exported, paths = {}, {}
+    sm_dir = out / f"{args.name}_savedmodel"
+    if args.format == "tflite":
+        sm_dir = Path(tempfile.mkdtemp()) / "savedmodel"
+    save_savedmodel(folded, sm_dir)
+    if args.format in ("savedmodel", "both"):
+        exported["savedmodel"], paths["savedmodel"] = SavedModelPredictor(sm_dir), sm_dir
+    if args.format in ("tflite", "both"):
+        tfl = convert_tflite(sm_dir, out / f"{args.name}.tflite", quantizer(args.quantize, inputs))
+        exported["tflite"], paths["tflite"] = TFLitePredictor(tfl), tfl
+        print(f"tflite: {tfl} ({tfl.stat().st_size / 1e6:.2f} MB)")
+
+    failed = False
+    for fmt, predictor in exported.items():
+        quantized = fmt == "tflite" and args.quantize != "none"
+        res = check_equivalence(source, predictor, inputs, args.quant_atol if quantized else args.atol)
+        failed |= not res["ok"]
+        print(f"{fmt:<11} max|dp|={res['max_abs_diff']:.2e} argmax agreement={res['argmax_agreement']:.3f}"
+              f" {'OK' if res['ok'] else 'MISMATCH'}")
+
+    # latency: the backend used to call load_model(...).predict() per request
+    one = inputs[:1]
+    rows = [("h5 predict()", lt.measure_latency(lambda x: source.predict(x, verbose=0), one)),
+            ("h5 __call__", lt.measure_latency(KerasPredictor(source).predict, one))]
+    rows += [(fmt, lt.measure_latency(p.predict, one)) for fmt, p in exported.items()]
+    base = rows[0][1]["median_ms"]
+    print(f"\n{'artifact':<14}{'median ms':>11}{'p90 ms':>9}{'speedup':>9}")
+    for name, lat in rows:
+        print(f"{name:<14}{lat['median_ms']:>11.2f}{lat['p90_ms']:>9.2f}{base / lat['median_ms']:>8.1f}x")
+
+    if failed:
+        sys.exit(f"exported model differs from {args.model} by more than atol={args.atol}; "
+                 f"not recorded in {args.name}.json, the backend will not serve it")
+
+    sidecar = load_model_info(out, args.name)
+    sidecar["export"] = {"source_sha256": artifact_sha256(args.model), "quantize": args.quantize,
+                         **{fmt: artifact_sha256(path) for fmt, path in paths.items()}}
+    (out / f"{args.name}.json").write_text(json.dumps(sidecar, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Shared training helpers for the hydrophone leak CNN.
+
+The numbered `hydrophone_leak_cnn_*.py` scripts run end to end at import time,
+so nothing in them can be reused. This module carries the pieces of
+`hydrophone_leak_cnn_4.py` (windowing, blocked time split with safety gaps,
+per-frequency normalization, model) as importable functions, plus an on-disk
+feature store so several training processes can share one memory-mapped copy
+of the windowed, normalized features.
+
+Features come from a front-end in `backend/frontends.py`; the default is the
+log-magnitude linear STFT of the original scripts.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from frontends import get_frontend  # noqa: E402
+
+# ---------------- STFT params (from export) ----------------
+FS, STEP, NWIN = 8000, 16, 512
+CHUNK_SEC = 2.0
+
+CLASS_NAMES = ["Circumferential Crack", "Gasket Leak", "Longitudinal Crack", "No-leak", "Orifice Leak"]
+SPLITS = ("train", "val", "test")
+
+
+def load_np_any(path, mmap_mode=None):
+    """Load a .npy or .npz (as written by Julia's NPZ) array."""
+    arr = np.load(path, allow_pickle=False, mmap_mode=mmap_mode)
+    if isinstance(arr, np.lib.npyio.NpzFile):
+        arr = arr[list(arr.files)[0]]
+    return arr
+
+
+def frames_for_seconds(sec):
+    # K frames span samples = (K-1)*STEP + NWIN  >= sec*FS
+    return int(np.floor((sec * FS - NWIN) / STEP) + 1)
+
+
+def window_starts(T, K, stride):
+    """Start frames of all K-frame windows that fit into T frames."""
+    if T < K:
+        return np.zeros(0, dtype=np.int64)
+    return np.arange(0, T - K + 1, stride, dtype=np.int64)
+
+
+def which_split(t0, T, K, gap=None):
+    """
+    Blocked time split of `hydrophone_leak_cnn_4.py`.
+
+    The left 20% of each recording is validation, the right 20% is test and
+    the centre is train; windows overlapping a `gap`-frame band around either
+    boundary are dropped so no frame is shared across splits.
+
+    Args:
+        t0: Window start frame
+        T: Total frames in the recording
+        K: Window length in frames
+        gap: Safety gap in frames (default K)
+
+    Returns:
+        One of "train", "val", "test" or "drop"
+    """
+    gap = K if gap is None else gap
+    left, right = int(0.2 * T), int(0.8 * T)
+    tend = t0 + K
+    if tend <= left - gap:
+        return "val"
+    if t0 >= right + gap:
+        return "test"
+    if tend <= right - gap and t0 >= left + gap:
+        return "train"
+    return "drop"
+
+
+def split_windows(T, K, stride, gap=None):
+    """
+    Window start frames per split for one recording.
+
+    Train windows use `stride` (50% overlap in the scripts); val/test windows
+    are re-windowed without overlap.
+
+    Returns:
+        Dict split name -> array of start frames
+    """
+    out = {}
+    for name, st in (("train", stride), ("val", K), ("test", K)):
+        starts = window_starts(T, K, st)
+        out[name] = np.asarray([t for t in starts if which_split(t, T, K, gap) == name], dtype=np.int64)
+    return out
+
+
+def log_magnitude(x):
+    """log1p(|x|) as float32, the feature used by every training script."""
+    return np.log1p(np.abs(x)).astype(np.float32)
+
+
+# ---------------- recordings ----------------
+def cube_recordings(x_path, y_path):
+    """
+    Recordings of a pilot.jl cube as (F, T, S) views with 1-based labels.
+
+    Args:
+        x_path: STFT cube of shape (F, T, S, L), complex
+        y_path: Labels of shape (L,), values in [1..5]
+    """
+    X = load_np_any(x_path, mmap_mode="r")
+    Y = load_np_any(y_path)
+    assert X.shape[3] == len(Y)
+    return [(X[..., li], int(Y[li])) for li in range(len(Y))]
+
+
+def dataset_version(dataset_dir):
+    """Version ID of a sharded dataset (None for datasets built before versioning)."""
+    return json.loads((Path(dataset_dir) / "index.json").read_text()).get("version")
+
+
+def dataset_recordings(dataset_dir):
+    """Recordings of a sharded dataset written by `build_dataset.py`, memory-mapped."""
+    dataset_dir = Path(dataset_dir)
+    index = json.loads((dataset_dir / "index.json").read_text())
+    return [(np.load(dataset_dir / r["shard"], mmap_mode="r"), int(r["label_id"]))
+            for r in index["recordings"]]
+
+
+# ---------------- memory-mapped feature store ----------------
+def build_feature_store(recordings, out_dir, chunk_sec=CHUNK_SEC, source=None, frontend=None):
+    """
+    Window, split and normalize STFT recordings into a feature store.
+
+    Each split is written as `<split>_X.npy` (normalized front-end features,
+    float32, (N, F, K, S)) and `<split>_y.npy`. Windows are written one at a
+    time into an `open_memmap` so the full windowed tensor never sits in RAM.
+    Normalization statistics come from the train split only. Recordings may
+    differ in length; each is split on its own timeline.
+
+    Args:
+        recordings: List of (complex STFT (F, T, S), label in [1..5]), see
+            `cube_recordings` and `dataset_recordings`
+        out_dir: Output directory
+        chunk_sec: Window length in seconds
+        source: Description of the input stored in meta.json; its
+            `dataset_version`, if any, is copied to the top level
+        frontend: Front-end config (see `frontends.get_frontend`); its hop
+            must be a multiple of the recordings' STEP. Stored in meta.json.
+
+    Returns:
+        Store metadata dict (also written to meta.json)
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    fe = get_frontend(frontend)
+    r = fe.frame_ratio
+    _, _, S = recordings[0][0].shape
+    F = fe.n_features
+    K = max(1, fe.frames_for_seconds(chunk_sec))
+    stride = max(1, K // 2)
+
+    def features(rec, t0):
+        # K front-end frames = every r-th STFT frame from t0 * r
+        return fe.features(rec[:, t0 * r:(t0 + K - 1) * r + 1:r, :])
+
+    plan = [(rec, label, split_windows((rec.shape[1] - 1) // r + 1, K, stride)) for rec, label in recordings]
+
+    # pass 1: per-frequency x channel statistics over TRAIN windows
+    total = np.zeros((F, S), dtype=np.float64)
+    total_sq = np.zeros((F, S), dtype=np.float64)
+    count = 0
+    for rec, _, splits in plan:
+        for t0 in splits["train"]:
+            w = features(rec, t0).astype(np.float64)
+            total += w.sum(axis=1)
+            total_sq += (w ** 2).sum(axis=1)
+            count += K
+    if count == 0:
+        raise ValueError("No training windows: recordings are shorter than the split needs")
+    mean = total / count
+    std = np.sqrt(np.maximum(total_sq / count - mean ** 2, 0.0)) + 1e-7
+    mean = mean.reshape(F, 1, S).astype(np.float32)
+    std = std.reshape(F, 1, S).astype(np.float32)
+    np.save(out_dir / "norm_mean.npy", mean)
+    np.save(out_dir / "norm_std.npy", std)
+
+    # pass 2: normalized windows, streamed straight to disk
+    counts = {}
+    for split in SPLITS:
+        n = sum(len(s[split]) for _, _, s in plan)
+        counts[split] = n
+        xs = np.lib.format.open_memmap(out_dir / f"{split}_X.npy", mode="w+",
+                                       dtype=np.float32, shape=(n, F, K, S))
+        ys = np.zeros(n, dtype=np.int32)
+        i = 0
+        for rec, label, splits in plan:
+            for t0 in splits[split]:
+                xs[i] = (features(rec, t0) - mean) / std
+                ys[i] = label - 1
+                i += 1
+        xs.flush()
+        del xs
+        np.save(out_dir / f"{split}_y.npy", ys)
+
+    meta = {
+        "source": source,
+        "dataset_version": (source or {}).get("dataset_version"),
+        "shape": {"F": F, "K": K, "S": S},
+        "frontend": fe.config,
+        "chunk_sec": chunk_sec,
+        "stride": stride,
+        "counts": counts,
+        "classes": CLASS_NAMES,
+    }
+    (out_dir / "meta.json").write_text(json.dumps(meta, indent=2))
+    return meta
+
+
+def open_feature_store(store_dir):
+    """
+    Open a feature store read-only.
+
+    Returns:
+        (meta, arrays) where arrays maps "<split>_X"/"<split>_y" to arrays;
+        the X arrays are memory-mapped so concurrent readers share pages.
+    """
+    store_dir = Path(store_dir)
+    meta = json.loads((store_dir / "meta.json").read_text())
+    arrays = {}
+    for split in SPLITS:
+        arrays[f"{split}_X"] = np.load(store_dir / f"{split}_X.npy", mmap_mode="r")
+        arrays[f"{split}_y"] = np.load(store_dir / f"{split}_y.npy")
+    return meta, arrays
+
+
+# ---------------- tf.data over memory-mapped arrays ----------------
+def augment_numpy(x, K, rng=np.random):
+    """Time shift, time/freq masks, gain and noise from `hydrophone_leak_cnn_4.py`."""
+    F, _, S = x.shape
+    tshift = rng.randint(-max(1, K // 50), max(1, K // 50) + 1)
+    x = np.roll(x, tshift, axis=1)
+    if rng.rand() < 0.5:
+        w = rng.randint(1, max(2, K // 20))
+        t0 = rng.randint(0, K - w + 1)
+        x[:, t0:t0 + w, :] = 0.0
+    if rng.rand() < 0.5:
+        fw = rng.randint(1, 5)
+        f0 = rng.randint(0, F - fw + 1)
+        x[f0:f0 + fw, :, :] = 0.0
+    gain = 1.0 + rng.normal(0, 0.02, (1, 1, S)).astype(np.float32)
+    x = x * gain + rng.normal(0, 0.003, x.shape).astype(np.float32)
+    return x.astype(np.float32)
+
+
+def make_ds(X, y, train=True, bs=16, seed=None):
+    """
+    Batched tf.data pipeline reading from (possibly memory-mapped) arrays.
+
+    Unlike `from_tensor_slices`, this never copies X into the graph; batches
+    are gathered from the memmap on demand.
+    """
+    import tensorflow as tf
+
+    n = len(X)
+    _, F, K, S = X.shape
+    rng = np.random.RandomState(seed)
+
+    def gen():
+        idx = rng.permutation(n) if train else np.arange(n)
+        for b in range(0, n, bs):
+            sel = np.sort(idx[b:b + bs])
+            xb = np.asarray(X[sel], dtype=np.float32)
+            if train:
+                xb = np.stack([augment_numpy(x.copy(), K, rng) for x in xb])
+            yield xb, np.asarray(y[sel], dtype=np.int32)
+
+    spec = (tf.TensorSpec((None, F, K, S), tf.float32), tf.TensorSpec((None,), tf.int32))
+    ds = tf.data.Dataset.from_generator(gen, output_signature=spec)
+    ds = ds.apply(tf.data.experimental.assert_cardinality(int(np.ceil(n / bs))))
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+# ---------------- model ----------------
+def make_model(input_shape, num_classes=5, widths=(32, 48, 64), dropout=0.3):
+    """`hydrophone_leak_cnn_4.py` architecture with configurable layer widths."""
+    from tensorflow.keras import layers, models
+
+    w1, w2, w3 = widths
+    inp = layers.Input(shape=input_shape)                 # (F,K,2)
+    x = inp                                               # no early avg pool
+    x = layers.DepthwiseConv2D((5, 5), padding="same")(x)
+    x = layers.BatchNormalization()(x); x = layers.ReLU()(x)
+    x = layers.Conv2D(w1, (1, 1), padding="same")(x)
+    x = layers.BatchNormalization()(x); x = layers.ReLU()(x)
+    x = layers.MaxPool2D((2, 2))(x)    # mild pooling
+    x = layers.DepthwiseConv2D((3, 5), padding="same")(x)
+    x = layers.BatchNormalization()(x); x = layers.ReLU()(x)
+    x = layers.Conv2D(w2, (1, 1), padding="same")(x)
+    x = layers.BatchNormalization()(x); x = layers.ReLU()(x)
+    x = layers.MaxPool2D((1, 2))(x)    # pool mostly in time
+    x = layers.Conv2D(w3, (1, 1), activation="relu")(x)
+    x = layers.GlobalAveragePooling2D()(x)
+    x = layers.Dropout(dropout)(x)
+    out = layers.Dense(num_classes, activation="softmax")(x)
+    return models.Model(inp, out)
+
+
+def class_weights(y, num_classes=5):
+    """Balanced class weights (no oversampling), as in `hydrophone_leak_cnn_4.py`."""
+    from sklearn.utils.class_weight import compute_class_weight
+
+    present = np.unique(y)
+    cw = compute_class_weight(class_weight="balanced", classes=present, y=y)
+    weights = {i: 1.0 for i in range(num_classes)}
+    weights.update({int(c): float(w) for c, w in zip(present, cw)})
+    return weights
+
+
+def measure_latency(predict_fn, x, warmup=3, runs=20):
+    """
+    Median wall-clock latency of `predict_fn(x)` in milliseconds.
+
+    Args:
+        predict_fn: Callable taking a batch
+        x: Input batch
+        warmup: Untimed calls first (graph tracing, allocator warm-up)
+        runs: Timed calls
+
+    Returns:
+        Dict with median and p90 latency in ms
+    """
+    import time
+
+    for _ in range(warmup):
+        predict_fn(x)
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        predict_fn(x)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    times = np.asarray(times)
+    return {"median_ms": float(np.median(times)), "p90_ms": float(np.percentile(times, 90))}
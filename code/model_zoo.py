@@ -0,0 +1,255 @@
+"""
+Latency-tiered variants of the hydrophone leak CNN.
+
+Every tier takes the same (F, K, 2) log-STFT input as the served model, so any
+of them can be dropped into `backend/models/`. The tiers differ in how early
+they downsample: `full` is the `hydrophone_leak_cnn_4.py` network, the others
+pool or stride in time (and later frequency) before the first depthwise block,
+which is where most of the cost sits.
+
+All variants are channels-last (NHWC), the layout the oneDNN CPU kernels in
+TensorFlow are optimised for. `precision` selects a Keras dtype policy; the
+`mixed_*` policies compute in bfloat16/float16 but keep float32 variables, so
+the weights, saved files and model size stay float32 (use
+`export_model.py --quantize` for smaller weights). `fold_batchnorm` rewrites a trained model with every BatchNormalization folded
+into the preceding convolution and training-only layers removed.
+"""
+
+from contextlib import contextmanager
+
+import numpy as np
+
+TIERS = ("full", "balanced", "fast", "tiny")
+PRECISIONS = ("float32", "mixed_bfloat16", "mixed_float16")
+
+
+@contextmanager
+def dtype_policy(precision):
+    """Temporarily set the global Keras dtype policy."""
+    from tensorflow import keras
+
+    previous = keras.mixed_precision.global_policy()
+    keras.mixed_precision.set_global_policy(precision)
+    try:
+        yield
+    finally:
+        keras.mixed_precision.set_global_policy(previous)
+
+
+def precision_dtypes(precision):
+    """(compute dtype, variable dtype) of a policy in PRECISIONS."""
+    from tensorflow import keras
+
+    policy = keras.mixed_precision.Policy(precision)
+    return policy.compute_dtype, policy.variable_dtype
+
+
+def cpu_supports(precision):
+    """Whether this CPU has native arithmetic for `precision` (Linux only)."""
+    if precision == "float32":
+        return True
+    try:
+        flags = open("/proc/cpuinfo").read()
+    except OSError:
+        return False
+    if precision == "mixed_bfloat16":
+        return "avx512_bf16" in flags or "amx_bf16" in flags
+    if precision == "mixed_float16":
+        return "avx512_fp16" in flags or "amx_fp16" in flags
+    return False
+
+
+def _dw_block(x, kernel, width, strides=(1, 1)):
+    from tensorflow.keras import layers
+
+    x = layers.DepthwiseConv2D(kernel, strides=strides, padding="same")(x)
+    x = layers.BatchNormalization()(x); x = layers.ReLU()(x)
+    x = layers.Conv2D(width, (1, 1), padding="same")(x)
+    x = layers.BatchNormalization()(x); x = layers.ReLU()(x)
+    return x
+
+
+def build_model(tier, input_shape, num_classes=5, precision="float32"):
+    """
+    Build one latency tier.
+
+    Args:
+        tier: One of TIERS
+        input_shape: (F, K, S) model input
+        num_classes: Number of output classes
+        precision: Keras dtype policy, one of PRECISIONS
+
+    Returns:
+        Uncompiled Keras model; the softmax output is always float32
+    """
+    from tensorflow.keras import layers, models
+
+    if tier not in TIERS:
+        raise ValueError(f"Unknown tier {tier!r}, expected one of {TIERS}")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+
+    with dtype_policy(precision):
+        inp = layers.Input(shape=input_shape)
+        x = inp
+        if tier == "full":
+            # hydrophone_leak_cnn_4.py: full resolution into the first block
+            x = _dw_block(x, (5, 5), 32)
+            x = layers.MaxPool2D((2, 2))(x)
+            x = _dw_block(x, (3, 5), 48)
+            x = layers.MaxPool2D((1, 2))(x)
+            x = layers.Conv2D(64, (1, 1), activation="relu")(x)
+            drop = 0.3
+        elif tier == "balanced":
+            # 4x in time before any convolution; 16 ms hops are heavily oversampled
+            x = layers.AveragePooling2D((1, 4))(x)
+            x = _dw_block(x, (5, 3), 32)
+            x = layers.MaxPool2D((2, 2))(x)
+            x = _dw_block(x, (3, 3), 48)
+            x = layers.MaxPool2D((2, 2))(x)
+            x = layers.Conv2D(64, (1, 1), activation="relu")(x)
+            drop = 0.3
+        elif tier == "fast":
+            # pool (2,4) then a strided depthwise block: 1/32 of the full-res pixels
+            x = layers.AveragePooling2D((2, 4))(x)
+            x = _dw_block(x, (5, 5), 24, strides=(2, 2))
+            x = _dw_block(x, (3, 3), 32)
+            x = layers.MaxPool2D((2, 2))(x)
+            x = layers.Conv2D(48, (1, 1), activation="relu")(x)
+            drop = 0.3
+        else:
+            # hydrophone_leak_cnn.py compact model, plus pooling in time
+            x = layers.AveragePooling2D((4, 4))(x)
+            x = _dw_block(x, (5, 5), 16)
+            x = layers.MaxPool2D((2, 2))(x)
+            drop = 0.5
+        x = layers.GlobalAveragePooling2D()(x)
+        x = layers.Dropout(drop)(x)
+        out = layers.Dense(num_classes, activation="softmax", dtype="float32")(x)
+    return models.Model(inp, out, name=f"leak_cnn_{tier}")
+
+
+def count_flops(model, fold_bn=True):
+    """
+    Analytic multiply-add FLOPs (x2) of one forward pass at batch size 1.
+
+    Args:
+        model: Keras model
+        fold_bn: Skip BatchNormalization as it disappears after folding
+
+    Returns:
+        FLOPs as an int
+    """
+    from tensorflow.keras import layers
+
+    flops = 0
+    for layer in model.layers:
+        if not hasattr(layer, "output") or isinstance(layer, layers.InputLayer):
+            continue
+        out_shape = tuple(layer.output.shape[1:])
+        n_out = int(np.prod(out_shape))
+        if isinstance(layer, layers.DepthwiseConv2D):
+            kh, kw = layer.kernel_size
+            flops += 2 * n_out * kh * kw
+        elif isinstance(layer, layers.Conv2D):
+            kh, kw = layer.kernel_size
+            cin = int(layer.input.shape[-1])
+            flops += 2 * n_out * kh * kw * cin
+        elif isinstance(layer, layers.Dense):
+            flops += 2 * int(layer.input.shape[-1]) * layer.units
+        elif isinstance(layer, layers.BatchNormalization):
+            flops += 0 if fold_bn else 2 * n_out
+        elif isinstance(layer, (layers.MaxPool2D, layers.AveragePooling2D)):
+            flops += n_out * int(np.prod(layer.pool_size))
+        elif isinstance(layer, layers.GlobalAveragePooling2D):
+            flops += int(np.prod(layer.input.shape[1:]))
+        elif isinstance(layer, layers.ReLU):
+            flops += n_out
+    return int(flops)
+
+
+def _chain(model):
+    """Layers of a single-path model in execution order (input layer excluded)."""
+    from tensorflow.keras import layers
+
+    chain = [l for l in model.layers if not isinstance(l, layers.InputLayer)]
+    for prev, layer in zip([None] + chain[:-1], chain):
+        inbound = layer.input
+        if isinstance(inbound, (list, tuple)):
+            raise ValueError(f"{layer.name}: only single-path models can be folded")
+        if prev is not None and inbound is not prev.output:
+            raise ValueError(f"{layer.name}: only single-path models can be folded")
+    return chain
+
+
+def fold_batchnorm(model):
+    """
+    Return an inference-only copy of a trained single-path model.
+
+    Each BatchNormalization that directly follows a (Depthwise)Conv2D without
+    activation is folded into that convolution's kernel and bias; Dropout
+    layers are dropped. The result computes the same function as
+    `model(x, training=False)` with fewer ops. Weights are folded in float32
+    (the variable dtype of every policy in PRECISIONS) and each layer keeps
+    its dtype policy, so a mixed-precision model stays mixed.
+
+    Args:
+        model: Trained Keras model built from a linear chain of layers
+
+    Returns:
+        New Keras model
+    """
+    from tensorflow.keras import layers, models
+
+    chain = _chain(model)
+    inp = layers.Input(shape=model.input.shape[1:], name=model.input.name.split(":")[0] + "_folded")
+    x = inp
+    i = 0
+    while i < len(chain):
+        layer = chain[i]
+        if isinstance(layer, layers.Dropout):
+            i += 1
+            continue
+        cfg = layer.get_config()
+        nxt = chain[i + 1] if i + 1 < len(chain) else None
+        foldable = (isinstance(layer, (layers.Conv2D, layers.DepthwiseConv2D))
+                    and isinstance(nxt, layers.BatchNormalization)
+                    and cfg.get("activation") in (None, "linear"))
+        if not foldable:
+            clone = layer.__class__.from_config(cfg)
+            x = clone(x)
+            clone.set_weights(layer.get_weights())
+            i += 1
+            continue
+
+        weights = [np.asarray(w, dtype=np.float32) for w in layer.get_weights()]
+        kernel = weights[0]
+        bias = weights[1] if layer.use_bias else None
+        gamma, beta, mean, var = _bn_params(nxt)
+        scale = gamma / np.sqrt(var + nxt.epsilon)
+        if isinstance(layer, layers.DepthwiseConv2D):
+            # kernel (kh, kw, C, m) -> output channel c*m + j
+            kernel = kernel * scale.reshape(kernel.shape[2], kernel.shape[3])
+        else:
+            kernel = kernel * scale
+        bias = np.zeros_like(mean) if bias is None else bias
+        bias = (bias - mean) * scale + beta
+
+        cfg["use_bias"] = True
+        clone = layer.__class__.from_config(cfg)
+        x = clone(x)
+        clone.set_weights([kernel, bias])
+        i += 2
+    return models.Model(inp, x, name=f"{model.name}_folded")
+
+
+def _bn_params(bn):
+    """(gamma, beta, moving_mean, moving_variance) with absent terms filled in."""
+    weights = [np.asarray(w, dtype=np.float32) for w in bn.get_weights()]
+    it = iter(weights)
+    gamma = next(it) if bn.scale else None
+    beta = next(it) if bn.center else None
+    mean, var = next(it), next(it)
+    gamma = np.ones_like(mean) if gamma is None else gamma
+    beta = np.zeros_like(mean) if beta is None else beta
+    return gamma, beta, mean, var
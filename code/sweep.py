@@ -0,0 +1,440 @@
+"""
+Parallel hyperparameter sweep runner for the hydrophone leak CNN.
+
+Trials run in a process pool sized to the CPU count, each with its own
+TensorFlow/BLAS thread limit, and all read the same memory-mapped feature
+store built by `leak_training.build_feature_store`. Results land in a SQLite
+leaderboard next to the trial models; `promote` copies a trial's model into
+`backend/models/` only if it matches the current model on accuracy and fits
+the latency budget.
+
+Usage:
+    python sweep.py prepare --x pilotLeakX.npy --y pilotLeakY.npy --store features/
+    python sweep.py prepare --dataset dataset/ --store features/
+    python sweep.py prepare --dataset dataset/ --store features_mel/ --frontend '{"name": "mel", "n_bands": 64, "hop": 32}'
+    python sweep.py run --store features/ --grid grid.json --threads 2
+    python sweep.py leaderboard --json leaderboard.json
+    python sweep.py promote --trial 7 --max-latency-ms 150
+"""
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+import leak_training as lt
+
+SWEEP_DIR = Path(__file__).parent / "sweeps"
+BACKEND_MODELS = Path(__file__).resolve().parent.parent / "backend" / "models"
+
+# Values the training scripts hard-code; a grid file overrides any subset.
+DEFAULT_GRID = {
+    "widths": [[32, 48, 64], [16, 32, 48], [48, 64, 96]],
+    "dropout": [0.3],
+    "lr": [1e-3],
+    "batch_size": [16],
+    "epochs": [500],
+    "patience": [100],
+    "lr_patience": [20],
+}
+
+# Median pruner: after `PRUNE_WARMUP` epochs a trial whose best val_loss is
+# worse than the median of other trials at the same epoch is stopped.
+PRUNE_WARMUP = 10
+PRUNE_MIN_TRIALS = 3
+
+
+# ---------------- leaderboard ----------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    epochs INTEGER,
+    val_loss REAL,
+    val_acc REAL,
+    test_acc REAL,
+    train_time_s REAL,
+    latency_ms REAL,
+    params_count INTEGER,
+    model_path TEXT,
+    promoted INTEGER DEFAULT 0,
+    created REAL,
+    dataset_version TEXT,
+    frontend TEXT,
+    sweep TEXT
+);
+CREATE TABLE IF NOT EXISTS epochs (
+    trial_id INTEGER,
+    epoch INTEGER,
+    val_loss REAL,
+    PRIMARY KEY (trial_id, epoch)
+);
+"""
+
+
+@contextmanager
+def connect(db_path):
+    """Leaderboard connection; commits on success and always closes."""
+    conn = sqlite3.connect(str(db_path), timeout=30.0)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(trials)")}
+        for column in ("dataset_version", "frontend", "sweep"):  # leaderboards created before these existed
+            if column not in columns:
+                conn.execute(f"ALTER TABLE trials ADD COLUMN {column} TEXT")
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def expand_grid(grid):
+    """Cartesian product of a {name: [values]} grid as a list of dicts."""
+    grid = {**DEFAULT_GRID, **grid}
+    keys = sorted(grid)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+
+
+def leaderboard(conn):
+    rows = conn.execute(
+        "SELECT * FROM trials WHERE status IN ('done', 'pruned') "
+        "ORDER BY val_loss IS NULL, val_loss ASC"
+    ).fetchall()
+    out = []
+    for r in rows:
+        d = dict(r)
+        d["params"] = json.loads(d["params"])
+        out.append(d)
+    return out
+
+
+# ---------------- trial worker ----------------
+_thread_limits = None  # keeps the threadpoolctl limits of a worker alive
+
+
+def _limit_threads(threads):
+    """
+    Pin BLAS/OpenMP and TensorFlow thread pools for this worker process.
+
+    NumPy (and with it BLAS) is already loaded when the trial is unpickled,
+    so its pool is resized through threadpoolctl; `run_sweep` also sets the
+    variables before the workers are spawned.
+    """
+    global _thread_limits
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    try:
+        from threadpoolctl import threadpool_limits
+        _thread_limits = threadpool_limits(limits=threads)
+    except ImportError:
+        pass
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _make_pruner(db_path, trial_id):
+    import tensorflow as tf
+
+    class MedianPruner(tf.keras.callbacks.Callback):
+        """Record val_loss per epoch and stop trials that trail the median."""
+
+        def __init__(self):
+            super().__init__()
+            self.best = np.inf
+            self.pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            val_loss = (logs or {}).get("val_loss")
+            if val_loss is None:
+                return
+            self.best = min(self.best, float(val_loss))
+            with connect(db_path) as conn:
+                conn.execute("INSERT OR REPLACE INTO epochs VALUES (?, ?, ?)",
+                             (trial_id, epoch, self.best))
+                if epoch < PRUNE_WARMUP:
+                    return
+                # only the trials of this sweep: same store, front-end and grid
+                others = [r[0] for r in conn.execute(
+                    "SELECT e.val_loss FROM epochs e JOIN trials t ON t.id = e.trial_id "
+                    "WHERE e.epoch = ? AND e.trial_id != ? "
+                    "AND t.sweep = (SELECT sweep FROM trials WHERE id = ?)",
+                    (epoch, trial_id, trial_id))]
+            if len(others) >= PRUNE_MIN_TRIALS and self.best > float(np.median(others)):
+                self.pruned = True
+                self.model.stop_training = True
+
+    return MedianPruner()
+
+
+def norm_path(model_path):
+    """Normalisation statistics saved beside a trial model."""
+    model_path = Path(model_path)
+    return model_path.with_name(f"{model_path.stem}_norm.npz")
+
+
+def run_trial(trial_id, params, store_dir, db_path, out_dir, threads):
+    """Train and score one configuration. Runs inside a pool worker."""
+    _limit_threads(threads)
+    import tensorflow as tf
+
+    meta, arrays = lt.open_feature_store(store_dir)
+    shape = meta["shape"]
+    input_shape = (shape["F"], shape["K"], shape["S"])
+    X_train, y_train = arrays["train_X"], arrays["train_y"]
+    X_val, y_val = arrays["val_X"], arrays["val_y"]
+    X_test, y_test = arrays["test_X"], arrays["test_y"]
+
+    bs = int(params["batch_size"])
+    ds_train = lt.make_ds(X_train, y_train, train=True, bs=bs, seed=trial_id)
+    ds_val = lt.make_ds(X_val, y_val, train=False, bs=32)
+
+    model = lt.make_model(input_shape, len(lt.CLASS_NAMES),
+                          widths=tuple(params["widths"]), dropout=params["dropout"])
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(params["lr"]),
+        loss=tf.keras.losses.SparseCategoricalCrossentropy(),
+        metrics=["accuracy"],
+    )
+    pruner = _make_pruner(db_path, trial_id)
+    callbacks = [
+        tf.keras.callbacks.ReduceLROnPlateau(monitor="val_loss", factor=0.5,
+                                             patience=params["lr_patience"], verbose=0),
+        tf.keras.callbacks.EarlyStopping(monitor="val_loss", patience=params["patience"],
+                                         restore_best_weights=True),
+        pruner,
+    ]
+
+    t0 = time.perf_counter()
+    history = model.fit(ds_train, validation_data=ds_val, epochs=params["epochs"],
+                        callbacks=callbacks, class_weight=lt.class_weights(y_train),
+                        verbose=0)
+    train_time = time.perf_counter() - t0
+
+    val_loss, val_acc = model.evaluate(ds_val, verbose=0)
+    probs = model.predict(lt.make_ds(X_test, y_test, train=False, bs=32), verbose=0)
+    test_acc = float(np.mean(probs.argmax(axis=1) == y_test)) if len(y_test) else None
+
+    sample = np.zeros((1,) + input_shape, dtype=np.float32)
+    latency = lt.measure_latency(lambda x: model(x, training=False), sample)
+
+    model_path = Path(out_dir) / f"trial_{trial_id}.h5"
+    model.save(str(model_path))
+    # the model expects z-scored features: ship the store's statistics with it
+    np.savez(norm_path(model_path), mean=np.load(Path(store_dir) / "norm_mean.npy"),
+             std=np.load(Path(store_dir) / "norm_std.npy"))
+
+    result = {
+        "status": "pruned" if pruner.pruned else "done",
+        "epochs": len(history.history.get("loss", [])),
+        "val_loss": float(val_loss),
+        "val_acc": float(val_acc),
+        "test_acc": test_acc,
+        "train_time_s": train_time,
+        "latency_ms": latency["median_ms"],
+        "params_count": int(model.count_params()),
+        "model_path": str(model_path),
+        "dataset_version": meta.get("dataset_version"),
+        "frontend": json.dumps(meta.get("frontend")),
+    }
+    with connect(db_path) as conn:
+        conn.execute(
+            "UPDATE trials SET status=:status, epochs=:epochs, val_loss=:val_loss, "
+            "val_acc=:val_acc, test_acc=:test_acc, train_time_s=:train_time_s, "
+            "latency_ms=:latency_ms, params_count=:params_count, model_path=:model_path, "
+            "dataset_version=:dataset_version, frontend=:frontend "
+            "WHERE id=:id",
+            {**result, "id": trial_id},
+        )
+    return trial_id, result
+
+
+def run_sweep(store_dir, grid, out_dir=SWEEP_DIR, threads=1, workers=None):
+    """
+    Run every configuration of `grid` in a process pool.
+
+    Args:
+        store_dir: Feature store built by `prepare`
+        grid: {param: [values]} overriding DEFAULT_GRID
+        out_dir: Directory for the leaderboard database and trial models
+        threads: Intra-op threads per trial
+        workers: Concurrent trials (default: CPU count // threads)
+    """
+    import multiprocessing as mp
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    db_path = out_dir / "leaderboard.db"
+    workers = workers or max(1, (os.cpu_count() or 1) // threads)
+
+    configs = expand_grid(grid)
+    sweep = uuid.uuid4().hex[:12]  # scopes median pruning to this run's trials
+    with connect(db_path) as conn:
+        ids = []
+        for params in configs:
+            cur = conn.execute("INSERT INTO trials (params, status, created, sweep) VALUES (?, 'queued', ?, ?)",
+                               (json.dumps(params), time.time(), sweep))
+            ids.append(cur.lastrowid)
+
+    print(f"{len(configs)} trials, {workers} workers x {threads} threads")
+    # inherited by the spawned workers, so BLAS starts with `threads` threads
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    # spawn: TensorFlow does not survive fork() once initialised
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        futures = {
+            pool.submit(run_trial, tid, params, str(store_dir), str(db_path), str(out_dir), threads): tid
+            for tid, params in zip(ids, configs)
+        }
+        for fut in as_completed(futures):
+            tid = futures[fut]
+            try:
+                _, res = fut.result()
+                print(f"trial {tid}: {res['status']} val_loss={res['val_loss']:.4f} "
+                      f"test_acc={res['test_acc']} latency={res['latency_ms']:.1f}ms "
+                      f"train={res['train_time_s']:.0f}s")
+            except Exception as e:  # keep the sweep going
+                with connect(db_path) as conn:
+                    conn.execute("UPDATE trials SET status='failed' WHERE id=?", (tid,))
+                print(f"trial {tid}: failed ({e})")
+    return db_path
+
+
+# ---------------- promotion ----------------
+def promote(db_path, trial_id, max_latency_ms=None, acc_tolerance=0.0, models_dir=BACKEND_MODELS,
+            force=False):
+    """
+    Copy a trial model to `backend/models/leak_detector.h5` if it is no worse.
+
+    The candidate must reach the currently promoted model's test accuracy
+    (minus `acc_tolerance`) and, if given, stay under `max_latency_ms`.
+    Accuracies on another dataset version or front-end are not comparable:
+    then promotion is refused unless `force` is set, which skips the
+    accuracy comparison.
+    The decision inputs are written to `leak_detector.json` beside the model
+    and the feature store's normalisation to `leak_detector_norm.npz` (the
+    backend applies it, see `inference.NormalizedPredictor`); exports of the
+    previously promoted model are removed.
+    """
+    with connect(db_path) as conn:
+        cand = conn.execute("SELECT * FROM trials WHERE id = ?", (trial_id,)).fetchone()
+        if cand is None or cand["status"] not in ("done", "pruned"):
+            raise ValueError(f"Trial {trial_id} has no finished result")
+        current = conn.execute("SELECT * FROM trials WHERE promoted = 1").fetchone()
+
+        comparable = current is not None and all(
+            cand[k] == current[k] for k in ("dataset_version", "frontend"))
+        if current is not None and not comparable and not force:
+            raise ValueError(f"Trial {trial_id} (dataset {cand['dataset_version']}, front-end {cand['frontend']}) "
+                             f"is not comparable with promoted trial {current['id']} (dataset "
+                             f"{current['dataset_version']}, front-end {current['frontend']}); use --force")
+        if comparable and cand["test_acc"] is not None and current["test_acc"] is not None:
+            if cand["test_acc"] < current["test_acc"] - acc_tolerance:
+                raise ValueError(f"Test accuracy {cand['test_acc']:.3f} below promoted "
+                                 f"trial {current['id']} ({current['test_acc']:.3f})")
+        if max_latency_ms is not None and cand["latency_ms"] > max_latency_ms:
+            raise ValueError(f"Latency {cand['latency_ms']:.1f}ms exceeds budget {max_latency_ms}ms")
+
+        if not norm_path(cand["model_path"]).exists():
+            raise ValueError(f"Trial {trial_id} has no {norm_path(cand['model_path']).name}; "
+                             f"the model cannot be served without its input normalisation")
+
+        models_dir = Path(models_dir)
+        models_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(cand["model_path"], models_dir / "leak_detector.h5")
+        shutil.copyfile(norm_path(cand["model_path"]), models_dir / "leak_detector_norm.npz")
+        # exports of the previous model; re-run export_model.py for the new one
+        for derived in (models_dir / "leak_detector.tflite", models_dir / "leak_detector_savedmodel"):
+            if derived.is_dir():
+                shutil.rmtree(derived)
+            elif derived.exists():
+                derived.unlink()
+        info = {k: cand[k] for k in ("id", "val_loss", "val_acc", "test_acc", "latency_ms",
+                                     "train_time_s", "params_count")}
+        info["params"] = json.loads(cand["params"])
+        sidecar = {"dataset_version": cand["dataset_version"],
+                   "frontend": json.loads(cand["frontend"] or "null"), "trial": info}
+        (models_dir / "leak_detector.json").write_text(json.dumps(sidecar, indent=2))
+
+        conn.execute("UPDATE trials SET promoted = 0")
+        conn.execute("UPDATE trials SET promoted = 1 WHERE id = ?", (trial_id,))
+    return info
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("prepare", help="build the shared memory-mapped feature store")
+    p.add_argument("--x", help="pilot.jl STFT cube")
+    p.add_argument("--y", help="pilot.jl labels")
+    p.add_argument("--dataset", help="sharded dataset from build_dataset.py (instead of --x/--y)")
+    p.add_argument("--store", required=True)
+    p.add_argument("--frontend", help='front-end config as JSON, e.g. \'{"name": "mel", "n_bands": 64, "hop": 32}\'')
+
+    p = sub.add_parser("run", help="run a sweep")
+    p.add_argument("--store", required=True)
+    p.add_argument("--grid", help="JSON file with {param: [values]}")
+    p.add_argument("--out", default=str(SWEEP_DIR))
+    p.add_argument("--threads", type=int, default=1, help="threads per trial")
+    p.add_argument("--workers", type=int, help="concurrent trials (default cores // threads)")
+
+    p = sub.add_parser("leaderboard", help="print the leaderboard")
+    p.add_argument("--out", default=str(SWEEP_DIR))
+    p.add_argument("--json", help="also write the leaderboard to this JSON file")
+
+    p = sub.add_parser("promote", help="promote a trial to backend/models/")
+    p.add_argument("--trial", type=int, required=True)
+    p.add_argument("--out", default=str(SWEEP_DIR))
+    p.add_argument("--max-latency-ms", type=float)
+    p.add_argument("--acc-tolerance", type=float, default=0.0)
+    p.add_argument("--force", action="store_true",
+                   help="promote although the promoted model was trained on another dataset or front-end")
+
+    args = ap.parse_args()
+    if args.cmd == "prepare":
+        if args.dataset:
+            recordings = lt.dataset_recordings(args.dataset)
+            source = {"dataset": args.dataset, "dataset_version": lt.dataset_version(args.dataset)}
+        elif args.x and args.y:
+            recordings = lt.cube_recordings(args.x, args.y)
+            source = {"x": args.x, "y": args.y}
+        else:
+            ap.error("prepare needs --dataset or both --x and --y")
+        frontend = json.loads(args.frontend) if args.frontend else None
+        meta = lt.build_feature_store(recordings, args.store, source=source, frontend=frontend)
+        print("feature store:", meta["shape"], meta["counts"])
+    elif args.cmd == "run":
+        grid = json.loads(Path(args.grid).read_text()) if args.grid else {}
+        run_sweep(args.store, grid, args.out, args.threads, args.workers)
+    elif args.cmd == "leaderboard":
+        with connect(Path(args.out) / "leaderboard.db") as conn:
+            rows = leaderboard(conn)
+        for r in rows:
+            print(f"{r['id']:>4} {r['status']:<7} val_loss={r['val_loss']:.4f} "
+                  f"val_acc={r['val_acc']:.3f} test_acc={r['test_acc']} "
+                  f"latency={r['latency_ms']:.1f}ms train={r['train_time_s']:.0f}s "
+                  f"{'*' if r['promoted'] else ''} {r['params']}")
+        if args.json:
+            Path(args.json).write_text(json.dumps(rows, indent=2))
+    elif args.cmd == "promote":
+        info = promote(Path(args.out) / "leaderboard.db", args.trial,
+                       args.max_latency_ms, args.acc_tolerance, force=args.force)
+        print("promoted:", info)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Vectorised synthetic hydrophone signals for all five leak classes.
+
+A batched version of `window_comparison.generate_test_signal`: one call
+produces an (N, samples, channels) float32 array with a label per row, with
+no Python branching per signal. On top of the tone/noise profiles of the
+original it supports
+
+- a target SNR (tone power over noise power) instead of the fixed noise level;
+- per-signal frequency jitter and random phases;
+- amplitude modulation (the gasket profile's 10 Hz AM, optionally on every class);
+- a second hydrophone that hears the same source delayed by a random number
+  of samples, with its own noise;
+- deterministic seeds (`numpy.random.Generator`), and streaming in batches
+  to a generator or a `.npy` file of any size.
+
+Label ids follow `leak_training.CLASS_NAMES`. The longitudinal crack's
+8 kHz "harmonic" of `generate_test_signal` sits exactly at FS and samples to
+zero, so it is not part of the profile, and its 4 kHz tone sits exactly at
+Nyquist, where a sine keeps only |sin(phase)| of its amplitude; the profile
+uses 3.8 kHz, inside the same 3.0-5.5 kHz band. Jittered tones are kept
+below Nyquist.
+
+Usage:
+    python synthetic_signals.py --n 100000 --duration 2 --snr-db 0 --out synth_X.npy --labels-out synth_y.npy
+    python synthetic_signals.py --n 20000 --benchmark
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+FS = 8000
+LEAK_TYPES = ["circumferential", "gasket", "longitudinal", "no_leak", "orifice"]
+
+# per class: tones as (frequency Hz, amplitude), noise std, AM (rate Hz, depth)
+PROFILES = {
+    "circumferential": {"tones": [(3000, 0.8), (3500, 0.6)], "noise": 0.2, "am": None},
+    "gasket": {"tones": [(1500, 0.7)], "noise": 0.3, "am": (10.0, 0.5)},
+    "longitudinal": {"tones": [(3800, 0.9)], "noise": 0.15, "am": None},
+    "no_leak": {"tones": [], "noise": 0.5, "am": None},
+    "orifice": {"tones": [(2500, 1.0), (2800, 0.5)], "noise": 0.25, "am": None},
+}
+
+MAX_TONES = max(len(p["tones"]) for p in PROFILES.values())
+
+
+def _profile_arrays():
+    """Class profiles as padded arrays: freqs/amps (C, M), noise (C,), am rate/depth (C,)."""
+    C = len(LEAK_TYPES)
+    freqs = np.zeros((C, MAX_TONES), dtype=np.float32)
+    amps = np.zeros((C, MAX_TONES), dtype=np.float32)
+    noise = np.zeros(C, dtype=np.float32)
+    am_rate = np.zeros(C, dtype=np.float32)
+    am_depth = np.zeros(C, dtype=np.float32)
+    for c, name in enumerate(LEAK_TYPES):
+        p = PROFILES[name]
+        for m, (f, a) in enumerate(p["tones"]):
+            freqs[c, m], amps[c, m] = f, a
+        noise[c] = p["noise"]
+        if p["am"]:
+            am_rate[c], am_depth[c] = p["am"]
+    return freqs, amps, noise, am_rate, am_depth
+
+
+_FREQS, _AMPS, _NOISE, _AM_RATE, _AM_DEPTH = _profile_arrays()
+
+
+def generate_batch(n, duration=2.0, labels=None, snr_db=None, freq_jitter=0.0, modulation="profile",
+                   channels=2, max_delay=0, seed=None, fs=FS):
+    """
+    Synthetic leak signals for a batch.
+
+    Args:
+        n: Number of signals
+        duration: Seconds per signal
+        labels: Class ids (n,); default: cycles through the five classes
+        snr_db: Tone-to-noise power ratio in dB, a scalar or a (lo, hi) range
+            drawn per signal; default uses the profile noise levels. No-leak
+            signals have no tones and keep their profile noise.
+        freq_jitter: Relative std of the tone frequencies, per signal and tone
+        modulation: "profile" (gasket AM only), "all" (random 2-20 Hz AM on
+            every class) or None
+        channels: Hydrophones; every channel after the first is delayed
+        max_delay: Maximum inter-channel delay in samples (uniform 0..max_delay)
+        seed: Seed or `numpy.random.Generator`
+        fs: Sample rate
+
+    Returns:
+        (signals (n, samples, channels) float32, labels (n,) int64,
+         delays (n, channels) int64)
+    """
+    rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+    S = int(round(duration * fs))
+    labels = (np.arange(n) % len(LEAK_TYPES)) if labels is None else np.asarray(labels)
+    labels = labels.astype(np.int64)
+
+    freqs = _FREQS[labels]  # (n, M)
+    amps = _AMPS[labels]
+    if freq_jitter:
+        freqs = freqs * (1.0 + freq_jitter * rng.standard_normal(freqs.shape, dtype=np.float32))
+        freqs = np.minimum(freqs, np.float32(0.49 * fs))
+    phases = rng.uniform(0, 2 * np.pi, freqs.shape).astype(np.float32)
+
+    delays = np.zeros((n, channels), dtype=np.int64)
+    if channels > 1 and max_delay:
+        delays[:, 1:] = rng.integers(0, max_delay + 1, (n, channels - 1))
+    # source long enough for the most delayed channel
+    T = S + int(delays.max())
+    t = np.arange(T, dtype=np.float32) / fs
+
+    src = np.zeros((n, T), dtype=np.float32)
+    for m in range(MAX_TONES):
+        active = amps[:, m] > 0
+        if not active.any():
+            continue
+        arg = (2 * np.pi * freqs[active, m])[:, None] * t[None, :] + phases[active, m][:, None]
+        src[active] += amps[active, m][:, None] * np.sin(arg)
+
+    if modulation == "profile":
+        rate, depth = _AM_RATE[labels], _AM_DEPTH[labels]
+    elif modulation == "all":
+        rate = rng.uniform(2.0, 20.0, n).astype(np.float32)
+        depth = np.where(_AMPS[labels].any(axis=1), rng.uniform(0.2, 0.8, n), 0.0).astype(np.float32)
+    else:
+        rate = depth = np.zeros(n, dtype=np.float32)
+    mod = depth > 0
+    if mod.any():
+        # depth * (0.5 sin + 0.5) + (1 - depth); depth 0.5 at 10 Hz reproduces the gasket's AM shape
+        am = np.sin(2 * np.pi * rate[mod][:, None] * t[None, :]) * 0.5 + 0.5
+        src[mod] *= depth[mod][:, None] * am + (1.0 - depth[mod][:, None])
+
+    noise_std = _NOISE[labels].copy()
+    if snr_db is not None:
+        snr = (rng.uniform(*snr_db, n) if np.ndim(snr_db) else np.full(n, snr_db)).astype(np.float32)
+        tone_power = np.mean(src ** 2, axis=1)
+        tonal = tone_power > 0
+        noise_std[tonal] = np.sqrt(tone_power[tonal] / 10 ** (snr[tonal] / 10))
+
+    # channel c hears src[T - S - d_c : T - d_c]
+    out = np.empty((n, S, channels), dtype=np.float32)
+    idx = np.arange(S)
+    for c in range(channels):
+        start = T - S - delays[:, c]
+        out[:, :, c] = np.take_along_axis(src, start[:, None] + idx[None, :], axis=1)
+    out += noise_std[:, None, None] * rng.standard_normal(out.shape, dtype=np.float32)
+    return out, labels, delays
+
+
+def stream_batches(total, batch_size=1024, seed=0, **kwargs):
+    """
+    Yield (signals, labels, delays) batches until `total` signals are produced.
+
+    Each batch has its own child seed from `numpy.random.SeedSequence(seed)`,
+    so a stream is reproducible for a given seed and batch size.
+    """
+    children = np.random.SeedSequence(seed).spawn((total + batch_size - 1) // batch_size)
+    for b, child in enumerate(children):
+        n = min(batch_size, total - b * batch_size)
+        labels = (np.arange(b * batch_size, b * batch_size + n) % len(LEAK_TYPES))
+        yield generate_batch(n, labels=labels, seed=np.random.default_rng(child), **kwargs)
+
+
+def write_npy(path, total, labels_path=None, batch_size=1024, seed=0, **kwargs):
+    """
+    Stream `total` signals into a `.npy` file without holding them in memory.
+
+    Returns:
+        Shape of the written array
+    """
+    out = labels = None
+    k = 0
+    for x, y, _ in stream_batches(total, batch_size, seed, **kwargs):
+        if out is None:
+            out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(total,) + x.shape[1:])
+            labels = np.empty(total, dtype=np.int64)
+        out[k:k + len(x)] = x
+        labels[k:k + len(y)] = y
+        k += len(x)
+    out.flush()
+    if labels_path:
+        np.save(labels_path, labels)
+    return out.shape
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=10000)
+    ap.add_argument("--duration", type=float, default=2.0)
+    ap.add_argument("--snr-db", type=float, nargs="+", help="value or lo hi range")
+    ap.add_argument("--freq-jitter", type=float, default=0.0)
+    ap.add_argument("--modulation", choices=["profile", "all", "none"], default="profile")
+    ap.add_argument("--channels", type=int, default=2)
+    ap.add_argument("--max-delay", type=int, default=0, help="samples")
+    ap.add_argument("--batch-size", type=int, default=1024)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help=".npy file for the signals")
+    ap.add_argument("--labels-out", help=".npy file for the labels")
+    ap.add_argument("--benchmark", action="store_true", help="report generation throughput only")
+    args = ap.parse_args()
+
+    snr = None if args.snr_db is None else (args.snr_db[0] if len(args.snr_db) == 1 else tuple(args.snr_db[:2]))
+    kwargs = {"duration": args.duration, "snr_db": snr, "freq_jitter": args.freq_jitter,
+              "modulation": None if args.modulation == "none" else args.modulation,
+              "channels": args.channels, "max_delay": args.max_delay}
+
+    t0 = time.perf_counter()
+    if args.benchmark or not args.out:
+        samples = 0
+        for x, _, _ in stream_batches(args.n, args.batch_size, args.seed, **kwargs):
+            samples += x.size
+        shape = (args.n,) + x.shape[1:]
+    else:
+        shape = write_npy(args.out, args.n, args.labels_out, args.batch_size, args.seed, **kwargs)
+        samples = int(np.prod(shape))
+    dt = time.perf_counter() - t0
+    print(f"{shape} in {dt:.2f}s: {samples / dt / 1e6:.1f} M samples/s"
+          + (f" -> {args.out}" if args.out and not args.benchmark else ""))
+
+
+if __name__ == "__main__":
+    main()
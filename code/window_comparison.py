@@ -264,16 +264,24 @@ def visualize_comparison():
     print("Performance Summary")
     print("=" * 70)
 
-    advantages = [
-        ("Frequency Resolution", "+12.5%"),
-        ("Spectral Leakage Reduction", "+18.3%"),
-        ("Time-Frequency Localization", "+15.2%"),
-        ("SNR Improvement", "+8.7%"),
+    # measured with the window benchmark engine rather than quoted
+    from window_benchmark import evaluate_window
+
+    hlt_row = evaluate_window(("hlt", "hlt", {"zeta": 8.0, "n": 0.99}), seeds=5)
+    ham_row = evaluate_window(("hamming", "hamming", {}), seeds=5)
+    measured = [
+        ("Main Lobe Width -3 dB (bins)", "mainlobe_3db_bins", ".2f"),
+        ("Peak Sidelobe Level (dB)", "peak_sidelobe_db", ".1f"),
+        ("Equivalent Noise Bandwidth (bins)", "enbw_bins", ".2f"),
+        ("Tone SNR (dB)", "snr_db_mean", ".2f"),
+        ("Class Separability (Fisher)", "fisher_ratio", ".1f"),
+        ("Nearest-Centroid Accuracy", "centroid_acc", ".3f"),
     ]
 
-    print("\nHyperlet Transform Advantages over Standard Hamming:")
-    for metric, improvement in advantages:
-        print(f"  • {metric:.<40} {improvement:>10}")
+    print(f"\n  {'Metric':<36}{'HLT':>10}{'Hamming':>10}")
+    for label, key, fmt in measured:
+        print(f"  {label:.<36}{hlt_row[key]:>10{fmt}}{ham_row[key]:>10{fmt}}")
+    print("\n  Full sweep over windows and HLT parameters: python window_benchmark.py")
 
     print("\n" + "=" * 70)
     print("Recommended Usage:")